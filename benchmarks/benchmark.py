@@ -0,0 +1,298 @@
+"""
+Benchmarks of the OxfCryo700 device server, run against the simulator:
+
+    pip install .[benchmark]
+    python benchmarks/benchmark.py [--quick] [--output results.json]
+
+- decode: StatusPacket, StatusPacketDecoder and decode_status_packets
+  throughput (packets/s)
+- reader: CPU time of the device server process per status packet at
+  elevated packet rates
+- read_latency: p50/p99 latency of attribute reads with concurrent clients
+- command_latency: time from a Cool/Ramp command to the new target
+  appearing in the status stream, on the serial line and through the
+  device
+
+The results are saved as JSON, with the version and platform, to compare
+them between releases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+    __file__)), os.pardir))
+
+from oxfcryo700.oxfordcryo import StatusPacket, StatusPacketDecoder, \
+    decode_status_packets, CSCOMMAND, splitBytes  # noqa
+from oxfcryo700.simulator import CryostreamModel  # noqa
+
+PACKET = CryostreamModel().packet()
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# seconds to wait for a command to appear in the status stream
+COMMAND_TIMEOUT = 10.
+
+
+def version():
+    with open(os.path.join(ROOT, 'setup.py')) as f:
+        return re.search(r"__version = '(.*)'", f.read()).group(1)
+
+
+def percentiles(samples):
+    samples = numpy.asarray(samples)
+    return {'count': len(samples),
+            'mean': float(samples.mean()),
+            'p50': float(numpy.percentile(samples, 50)),
+            'p99': float(numpy.percentile(samples, 99)),
+            'max': float(samples.max())}
+
+
+def rate(func, count, repeat=3):
+    """best rate of count calls of func (which does count operations)"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+
+class SimulatorProcess:
+    """simulator served on a pseudo terminal by a separate process, so it
+    does not compete with the measured code for the GIL"""
+
+    def __init__(self, rate, time_scale=1.):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'oxfcryo700.simulator',
+             '--rate', str(rate), '--time-scale', str(time_scale)],
+            stdout=subprocess.PIPE, universal_newlines=True, cwd=ROOT)
+        line = self.process.stdout.readline()
+        self.port = re.match(r'Serving on (\S+)', line).group(1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
+
+
+def device_context(port, **properties):
+    from tango.test_context import DeviceTestContext
+    from oxfcryo700.tango import OxfCryo700
+    properties['port'] = port
+    return DeviceTestContext(OxfCryo700, properties=properties,
+                             process=True)
+
+
+def server_process(context):
+    """psutil.Process of the device server of a device_context"""
+    import psutil
+    return psutil.Process(context.thread.pid)
+
+
+def check_deadline(deadline, command, target):
+    if time.monotonic() > deadline:
+        raise RuntimeError('{} {} K not applied after {} s'.format(
+            command, target, COMMAND_TIMEOUT))
+
+
+def wait_first_packet(proxy, timeout=10.):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout:
+        try:
+            proxy.read_attribute('GasTemp')
+            return
+        except Exception:
+            time.sleep(0.05)
+    raise RuntimeError('No status packet received')
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+def bench_decode(quick):
+    count = 10000 if quick else 100000
+    stream = PACKET * count
+
+    def decode_packets():
+        for _ in range(count):
+            StatusPacket(PACKET)
+
+    def decode_stream():
+        decoder = StatusPacketDecoder()
+        for i in range(0, len(stream), 4096):
+            decoder.feed(stream[i:i + 4096])
+
+    def decode_batch():
+        decode_status_packets(stream)
+
+    return {'status_packet': rate(decode_packets, count),
+            'stream_decoder': rate(decode_stream, count),
+            'batch': rate(decode_batch, count)}
+
+
+def bench_reader(quick):
+    duration = 3. if quick else 10.
+    results = {}
+    for packet_rate in (10, 100, 1000):
+        with SimulatorProcess(packet_rate) as simulator:
+            context = device_context(simulator.port)
+            with context as proxy:
+                wait_first_packet(proxy)
+                server = server_process(context)
+                t0 = server.cpu_times()
+                time.sleep(duration)
+                t1 = server.cpu_times()
+        cpu = (t1.user - t0.user) + (t1.system - t0.system)
+        results[str(packet_rate)] = {
+            'cpu_fraction': cpu / duration,
+            'cpu_per_packet': cpu / (duration * packet_rate)}
+    return results
+
+
+def bench_read_latency(quick):
+    import tango
+    duration = 2. if quick else 10.
+    results = {}
+    with SimulatorProcess(10) as simulator:
+        with device_context(simulator.port) as proxy:
+            wait_first_packet(proxy)
+            name = proxy.dev_name()
+            for clients in (1, 8, 32):
+                latencies = []
+                stop = threading.Event()
+
+                def client():
+                    dev = tango.DeviceProxy(name)
+                    samples = []
+                    while not stop.is_set():
+                        t0 = time.perf_counter()
+                        dev.read_attribute('GasTemp')
+                        samples.append(time.perf_counter() - t0)
+                    latencies.extend(samples)
+
+                threads = [threading.Thread(target=client)
+                           for _ in range(clients)]
+                for thread in threads:
+                    thread.start()
+                time.sleep(duration)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                results[str(clients)] = percentiles(latencies)
+                results[str(clients)]['reads_per_second'] = \
+                    len(latencies) / duration
+    return results
+
+
+def _cool_packet(temp):
+    high, low = splitBytes(int(temp * 100))
+    return bytes([4, CSCOMMAND.COOL, high, low])
+
+
+def _ramp_packet(rate, temp):
+    rate_high, rate_low = splitBytes(int(rate))
+    high, low = splitBytes(int(temp * 100))
+    return bytes([6, CSCOMMAND.RAMP, rate_high, rate_low, high, low])
+
+
+def bench_command_latency(quick):
+    import serial
+    repeat = 5 if quick else 20
+    packet_rate = 10
+    targets = [250. - i for i in range(repeat)]
+    serial_latencies = {'Cool': [], 'Ramp': []}
+    device_latencies = {'Cool': [], 'Ramp': []}
+    with SimulatorProcess(packet_rate) as simulator:
+        port = serial.serial_for_url(simulator.port, timeout=1.)
+        decoder = StatusPacketDecoder()
+        for command, build in (('Cool', _cool_packet),
+                               ('Ramp', lambda t: _ramp_packet(360, t))):
+            for target in targets:
+                port.reset_input_buffer()
+                t0 = time.perf_counter()
+                deadline = time.monotonic() + COMMAND_TIMEOUT
+                port.write(build(target))
+                done = False
+                while not done:
+                    check_deadline(deadline, command, target)
+                    data = port.read(max(1, port.in_waiting))
+                    for packet in decoder.feed(data):
+                        if packet.target_temp == target and \
+                                packet.phase == command:
+                            done = True
+                serial_latencies[command].append(time.perf_counter() - t0)
+        port.close()
+    with SimulatorProcess(packet_rate) as simulator:
+        with device_context(simulator.port) as proxy:
+            wait_first_packet(proxy)
+            for command in ('Cool', 'Ramp'):
+                for target in targets:
+                    t0 = time.perf_counter()
+                    deadline = time.monotonic() + COMMAND_TIMEOUT
+                    if command == 'Cool':
+                        proxy.Cool(target)
+                    else:
+                        proxy.Ramp([360, target])
+                    while proxy.TargetTemp != target or \
+                            proxy.Phase != command:
+                        check_deadline(deadline, command, target)
+                        time.sleep(0.001)
+                    device_latencies[command].append(
+                        time.perf_counter() - t0)
+    return {'packet_rate': packet_rate,
+            'serial': {k: percentiles(v)
+                       for k, v in serial_latencies.items()},
+            'device': {k: percentiles(v)
+                       for k, v in device_latencies.items()}}
+
+
+BENCHMARKS = {'decode': bench_decode,
+              'reader': bench_reader,
+              'read_latency': bench_read_latency,
+              'command_latency': bench_command_latency}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run: {} (default '
+                             'all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--quick', action='store_true',
+                        help='shorter runs, less accurate')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON results file')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    report = {'version': version(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'quick': args.quick,
+              'results': {}}
+    for name in args.benchmarks or BENCHMARKS:
+        print('Running {}...'.format(name), flush=True)
+        report['results'][name] = BENCHMARKS[name](args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['results'], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Oxford Cryosystems Cryostream 700 series: protocol library (oxfordcryo)
+and Tango device server (tango).
+
+The names below are imported on first access, so the protocol classes can
+be used without pytango (e.g. from oxfcryo700 import StatusPacket).
+"""
+
+import importlib
+
+_EXPORTS = {'StatusPacket': 'oxfordcryo',
+            'StatusPacketDecoder': 'oxfordcryo',
+            'PacketCapture': 'oxfordcryo',
+            'SharedPacketReader': 'oxfordcryo',
+            'CSCOMMAND': 'oxfordcryo',
+            'command_packet': 'oxfordcryo',
+            'decode_status_packets': 'oxfordcryo',
+            'CryostreamSimulator': 'simulator',
+            'CryostreamGroup': 'group',
+            'OxfCryo700': 'tango',
+            'OxfCryo700Asyncio': 'tango_asyncio'}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute "
+                             "{!r}".format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
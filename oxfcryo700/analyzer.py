@@ -0,0 +1,424 @@
+"""
+Offline analysis of status packet recordings, in parallel:
+
+    OxfCryo700Analyzer capture1.cap capture2.cap dump.bin
+                       [--start 1700000000] [--jobs 8] [--tolerance 1]
+                       [--json report.json]
+
+The files are PacketCapture files (CaptureFile property of the device
+server), or raw dumps of the serial stream, whose packets are assumed to
+be --period seconds apart from the --start time given for each dump. They
+are split in tasks run by a process pool and read in chunks of --chunk
+packets, so the memory use does not depend on the file sizes. Each task
+continues from the last sample of each controller before its records, so
+the intervals, alarms and excursions across the tasks are counted once.
+The report has, per controller number:
+
+- the time in each run mode, and in each phase while running
+- the number of occurrences and the duration of each alarm
+- the number, duration and maximum of the gas temperature excursions
+  (|GasError| above --tolerance while running)
+- the drift (least squares slope) of the gas flow and line pressure while
+  running
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+
+import numpy
+
+from .oxfordcryo import PacketCapture, StatusPacket, StatusPacketDecoder, \
+    STATUS_FORMATS, code_name, decode_status_packets
+
+# status packet fields used by the analysis
+ANALYSIS_FIELDS = ('controller_nb', 'run_mode_code', 'phase_code',
+                   'alarm_code', 'gas_error', 'gas_flow', 'line_pressure')
+
+RUN = StatusPacket.RUNMODE_CODES.index('Run')
+
+# capture file records as a NumPy dtype
+CAPTURE_DTYPE = numpy.dtype([('monotonic', '<f8'), ('timestamp', '<f8'),
+                             ('raw', 'u1', (48,))])
+
+# tasks are at most this number of capture file records
+TASK_RECORDS = 1000000
+
+# records before a task searched for the last sample of each controller
+LOOKBACK_RECORDS = 4096
+
+
+class Drift:
+    """Least squares slope of a value over time, from running moments
+    which can be merged (Chan et al. parallel algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean_t = 0.
+        self.mean_y = 0.
+        self.m2_t = 0.
+        self.c_ty = 0.
+
+    def add(self, t, y):
+        """adds arrays of samples"""
+        other = Drift()
+        other.count = len(t)
+        if not other.count:
+            return
+        other.mean_t = t.mean()
+        other.mean_y = y.mean()
+        other.m2_t = ((t - other.mean_t) ** 2).sum()
+        other.c_ty = ((t - other.mean_t) * (y - other.mean_y)).sum()
+        self.merge(other)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if not other.count:
+            return
+        dt = other.mean_t - self.mean_t
+        dy = other.mean_y - self.mean_y
+        factor = self.count * other.count / count
+        self.m2_t += other.m2_t + dt * dt * factor
+        self.c_ty += other.c_ty + dt * dy * factor
+        self.mean_t += dt * other.count / count
+        self.mean_y += dy * other.count / count
+        self.count = count
+
+    @property
+    def slope(self):
+        """slope per day, None without enough samples"""
+        if self.count < 2 or self.m2_t <= 0:
+            return None
+        return 86400. * self.c_ty / self.m2_t
+
+
+class ControllerStatistics:
+    """Statistics of the recordings of one controller, mergeable"""
+
+    def __init__(self, controller_nb):
+        self.controller_nb = controller_nb
+        self.samples = 0
+        self.first = None
+        self.last = None
+        self.run_mode_time = {}
+        self.phase_time = {}
+        self.alarm_count = {}
+        self.alarm_time = {}
+        self.excursions = 0
+        self.excursion_time = 0.
+        self.max_error = 0.
+        self.flow = Drift()
+        self.pressure = Drift()
+
+    @staticmethod
+    def _add_counts(counts, codes, weights=None):
+        if not len(codes):
+            return
+        sums = numpy.bincount(codes, weights)
+        for code in numpy.nonzero(sums)[0]:
+            counts[int(code)] = counts.get(int(code), 0) + sums[code].item()
+
+    def add(self, times, columns, previous, tolerance, max_gap):
+        """adds a chunk of samples of this controller. previous is the
+        last sample of the previous chunk (dictionary of the same columns
+        and 'timestamp', or None); the time between two samples is
+        attributed to the state of the first one"""
+        if previous is not None:
+            times = numpy.concatenate(([previous['timestamp']], times))
+            columns = {name: numpy.concatenate(([previous[name]], values))
+                       for name, values in columns.items()}
+        n = len(times)
+        if n == 0:
+            return
+        new = n - (previous is not None)
+        self.samples += new
+        if self.first is None:
+            self.first = float(times[0])
+        self.last = float(times[-1])
+        dt = numpy.diff(times)
+        dt[(dt < 0) | (dt > max_gap)] = 0.
+        run_mode = columns['run_mode_code'].astype(numpy.intp)
+        phase = columns['phase_code'].astype(numpy.intp)
+        alarm = columns['alarm_code'].astype(numpy.intp)
+        running = run_mode[:-1] == RUN
+        self._add_counts(self.run_mode_time, run_mode[:-1], dt)
+        self._add_counts(self.phase_time, phase[:-1][running], dt[running])
+        self._add_counts(self.alarm_time, alarm[:-1], dt)
+        # an alarm occurrence is a change to a non-zero alarm code
+        if previous is None:
+            starts = numpy.concatenate(([alarm[0] != 0],
+                                        (alarm[1:] != alarm[:-1])
+                                        & (alarm[1:] != 0)))
+        else:
+            starts = numpy.concatenate(([False], (alarm[1:] != alarm[:-1])
+                                        & (alarm[1:] != 0)))
+        self._add_counts(self.alarm_count, alarm[starts])
+        error = numpy.abs(columns['gas_error'])
+        excursion = (error > tolerance) & (run_mode == RUN)
+        first_new = n - new
+        entering = excursion[1:] & ~excursion[:-1]
+        self.excursions += int(entering.sum())
+        if previous is None and excursion[0]:
+            self.excursions += 1
+        self.excursion_time += float(dt[excursion[:-1]].sum())
+        if excursion[first_new:].any():
+            self.max_error = max(self.max_error,
+                                 float(error[first_new:][
+                                     excursion[first_new:]].max()))
+        run = (run_mode == RUN)
+        run[:first_new] = False
+        self.flow.add(times[run], columns['gas_flow'][run])
+        self.pressure.add(times[run], columns['line_pressure'][run])
+
+    def merge(self, other):
+        self.samples += other.samples
+        for value in (other.first, other.last):
+            if value is None:
+                continue
+            self.first = value if self.first is None \
+                else min(self.first, value)
+            self.last = value if self.last is None \
+                else max(self.last, value)
+        for name in ('run_mode_time', 'phase_time', 'alarm_count',
+                     'alarm_time'):
+            counts = getattr(self, name)
+            for code, value in getattr(other, name).items():
+                counts[code] = counts.get(code, 0) + value
+        self.excursions += other.excursions
+        self.excursion_time += other.excursion_time
+        self.max_error = max(self.max_error, other.max_error)
+        self.flow.merge(other.flow)
+        self.pressure.merge(other.pressure)
+
+    def report(self):
+        def named(counts, names):
+            return {code_name(names, code): value
+                    for code, value in sorted(counts.items())}
+        return {
+            'controller_nb': self.controller_nb,
+            'samples': self.samples,
+            'first': self.first,
+            'last': self.last,
+            'run_mode_time': named(self.run_mode_time,
+                                   StatusPacket.RUNMODE_CODES),
+            'phase_time': named(self.phase_time, StatusPacket.PHASE_CODES),
+            'alarm_count': named(self.alarm_count, StatusPacket.ALARM_CODES),
+            'alarm_time': named(self.alarm_time, StatusPacket.ALARM_CODES),
+            'excursions': self.excursions,
+            'excursion_time': self.excursion_time,
+            'max_excursion': self.max_error,
+            'gas_flow_drift_per_day': self.flow.slope,
+            'line_pressure_drift_per_day': self.pressure.slope}
+
+
+class Analysis:
+    """Statistics per controller of a sequence of chunks"""
+
+    def __init__(self, tolerance, max_gap):
+        self.tolerance = tolerance
+        self.max_gap = max_gap
+        self.controllers = {}
+        self._previous = {}
+
+    def seed(self, times, columns):
+        """takes the last sample of each controller of the chunk as the
+        previous one of the next chunk, without adding it"""
+        controllers = columns['controller_nb']
+        for controller_nb in numpy.unique(controllers):
+            index = numpy.nonzero(controllers == controller_nb)[0][-1]
+            last = {name: values[index] for name, values in columns.items()}
+            last['timestamp'] = times[index]
+            self._previous[int(controller_nb)] = last
+
+    def add(self, times, columns):
+        controllers = columns['controller_nb']
+        for controller_nb in numpy.unique(controllers):
+            controller_nb = int(controller_nb)
+            mask = controllers == controller_nb
+            chunk = {name: values[mask] for name, values in columns.items()}
+            chunk_times = times[mask]
+            statistics = self.controllers.get(controller_nb)
+            if statistics is None:
+                statistics = ControllerStatistics(controller_nb)
+                self.controllers[controller_nb] = statistics
+            statistics.add(chunk_times, chunk,
+                           self._previous.get(controller_nb),
+                           self.tolerance, self.max_gap)
+            last = {name: values[-1] for name, values in chunk.items()}
+            last['timestamp'] = chunk_times[-1]
+            self._previous[controller_nb] = last
+
+    def merge(self, other):
+        for controller_nb, statistics in other.controllers.items():
+            if controller_nb in self.controllers:
+                self.controllers[controller_nb].merge(statistics)
+            else:
+                self.controllers[controller_nb] = statistics
+
+
+def is_capture(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(PacketCapture.MAGIC)) == PacketCapture.MAGIC
+
+
+def decode_records(raw):
+    """columns of the analysis fields of raw packets of any status format,
+    padded to 48 bytes (2D array)"""
+    columns = {name: numpy.zeros(len(raw)) for name in ANALYSIS_FIELDS}
+    for length, status_format in STATUS_FORMATS.items():
+        mask = raw[:, 0] == length
+        if not mask.any():
+            continue
+        packets = numpy.ascontiguousarray(raw[mask, :length])
+        decoded = decode_status_packets(packets, status_format=status_format)
+        for name in ANALYSIS_FIELDS:
+            columns[name][mask] = decoded[name]
+    return columns
+
+
+def read_records(capture, first, last):
+    """capture records [first, last) of the known status formats"""
+    view = capture.records(first, last)
+    records = numpy.frombuffer(view, CAPTURE_DTYPE).copy()
+    view.release()
+    return records[numpy.isin(records['raw'][:, 0], list(STATUS_FORMATS))]
+
+
+def analyze_capture(filename, first, last, chunk, tolerance, max_gap):
+    analysis = Analysis(tolerance, max_gap)
+    with PacketCapture(filename) as capture:
+        if first > 0:
+            # the previous task ends with these records
+            records = read_records(capture, max(0, first - LOOKBACK_RECORDS),
+                                   first)
+            if len(records):
+                analysis.seed(records['timestamp'],
+                              decode_records(records['raw']))
+        for start in range(first, min(last, len(capture)), chunk):
+            records = read_records(capture, start, min(start + chunk, last))
+            if len(records):
+                analysis.add(records['timestamp'],
+                             decode_records(records['raw']))
+    return analysis
+
+
+def analyze_dump(filename, chunk, start, period, tolerance, max_gap):
+    """analysis of a raw dump whose first packet was received at start
+    (seconds since the epoch, like the capture timestamps)"""
+    analysis = Analysis(tolerance, max_gap)
+    decoder = StatusPacketDecoder()
+    index = 0
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(chunk * 32)
+            if not data:
+                break
+            packets = decoder.feed(data)
+            if not packets:
+                continue
+            times = start + (index + numpy.arange(len(packets))) * period
+            index += len(packets)
+            raw = numpy.frombuffer(b''.join([packet.raw.ljust(48, b'\0')
+                                             for packet in packets]),
+                                   numpy.uint8).reshape(-1, 48)
+            analysis.add(times, decode_records(raw))
+    return analysis
+
+
+def analyze(filenames, jobs=None, chunk=65536, period=1., tolerance=1.,
+            max_gap=10., starts=()):
+    """analyzes the files in a process pool, returns the merged Analysis.
+    starts are the times of the first packet of the raw dumps, in their
+    order"""
+    dumps = [filename for filename in filenames if not is_capture(filename)]
+    if len(starts) != len(dumps):
+        raise ValueError('{} start times given for the {} raw dumps ({}), '
+                         'one is required per dump'.format(
+                             len(starts), len(dumps), ', '.join(dumps)))
+    starts = dict(zip(dumps, starts))
+    result = Analysis(tolerance, max_gap)
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = []
+        for filename in filenames:
+            if filename not in starts:
+                with PacketCapture(filename) as capture:
+                    count = len(capture)
+                for first in range(0, count, TASK_RECORDS):
+                    futures.append(pool.submit(
+                        analyze_capture, filename, first,
+                        first + TASK_RECORDS, chunk, tolerance, max_gap))
+            else:
+                futures.append(pool.submit(analyze_dump, filename, chunk,
+                                           starts[filename], period,
+                                           tolerance, max_gap))
+        for future in futures:
+            result.merge(future.result())
+    return result
+
+
+def format_report(report):
+    lines = []
+    for controller in report:
+        lines.append('Controller {controller_nb}: {samples} samples'.format(
+            **controller))
+        for title, name in (('Run mode time (s)', 'run_mode_time'),
+                            ('Phase time while running (s)', 'phase_time'),
+                            ('Alarm occurrences', 'alarm_count'),
+                            ('Alarm time (s)', 'alarm_time')):
+            lines.append('  {}:'.format(title))
+            for key, value in controller[name].items():
+                lines.append('    {:<40} {:g}'.format(key, value))
+        lines.append('  Excursions: {excursions}, {excursion_time:g} s, '
+                     'max {max_excursion:g} K'.format(**controller))
+        for title, name in (('Gas flow drift (l/min/day)',
+                             'gas_flow_drift_per_day'),
+                            ('Line pressure drift (100*bar/day)',
+                             'line_pressure_drift_per_day')):
+            value = controller[name]
+            lines.append('  {}: {}'.format(
+                title, 'n/a' if value is None else '{:g}'.format(value)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cryostream status recordings analyzer')
+    parser.add_argument('files', nargs='+',
+                        help='capture files or raw serial dumps')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes (default CPU count)')
+    parser.add_argument('--chunk', type=int, default=65536,
+                        help='packets decoded at once (default 65536)')
+    parser.add_argument('--period', type=float, default=1.,
+                        help='seconds between the packets of the raw dumps '
+                             '(default 1)')
+    parser.add_argument('--start', type=float, action='append', default=[],
+                        help='time of the first packet of a raw dump, in '
+                             'seconds since the epoch. Required once per '
+                             'raw dump, in their order')
+    parser.add_argument('--tolerance', type=float, default=1.,
+                        help='gas temperature error of an excursion, in K '
+                             '(default 1)')
+    parser.add_argument('--max-gap', type=float, default=10.,
+                        help='longer intervals between packets are not '
+                             'counted, in s (default 10)')
+    parser.add_argument('--json', metavar='FILE',
+                        help='save the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        analysis = analyze(args.files, args.jobs, args.chunk, args.period,
+                           args.tolerance, args.max_gap, args.start)
+    except ValueError as e:
+        parser.error(str(e))
+    report = [analysis.controllers[nb].report()
+              for nb in sorted(analysis.controllers)]
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
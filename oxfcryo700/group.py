@@ -0,0 +1,193 @@
+"""
+Control of many Cryostreams at once, e.g. to cool, purge or stop all the
+controllers of a facility:
+
+    group = CryostreamGroup(['bl13/eh/cryo', 'socket://cryo2:5000'])
+    results = group.run('Cool', 100)
+    print(format_results(results))
+    group.close()
+
+The targets are OxfCryo700 Tango devices (their name) or serial ports and
+pyserial URLs opened directly. A command is dispatched to all of them
+concurrently by a bounded thread pool, each worker waits until the status
+packets of its controller confirm it (the SendAndConfirm command of the
+devices), so the whole operation takes as long as the slowest controller.
+The arguments are in the units of the monitor commands (K, K/h, min).
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from .monitor import command_params
+from .oxfordcryo import StatusPacketDecoder, command_packet, \
+    command_confirmation
+from .writer import CommandWriter, CommandRequest
+
+# command: Tango command of the devices, sent with SendAndConfirm
+GROUP_COMMANDS = {'restart': 'Restart',
+                  'purge': 'Purge',
+                  'stop': 'Stop',
+                  'pause': 'Pause',
+                  'resume': 'Resume',
+                  'cool': 'Cool',
+                  'ramp': 'Ramp',
+                  'end': 'End',
+                  'turbo': 'Turbo'}
+
+TIMEOUT = 'timeout'
+
+GroupResult = collections.namedtuple(
+    'GroupResult', 'target command state latency error')
+GroupResult.__doc__ = """Result of a command on one target: state is one of
+the CommandRequest states (confirmed, sent...), timeout if the confirmation
+did not come in time"""
+
+
+class TangoTarget:
+    """OxfCryo700 device, confirming the commands itself"""
+
+    def __init__(self, name):
+        self.name = name
+        self._proxy = None
+
+    def execute(self, command, args, timeout):
+        if self._proxy is None:
+            import tango
+            self._proxy = tango.DeviceProxy(self.name)
+        # SendAndConfirm blocks up to the timeout
+        self._proxy.set_timeout_millis(int((timeout + 3) * 1000))
+        state = self._proxy.SendAndConfirm(
+            [[timeout] + [float(a) for a in args], [GROUP_COMMANDS[command]]])
+        return state, None
+
+    def close(self):
+        self._proxy = None
+
+
+class SerialTarget:
+    """Controller on a serial port or pyserial URL, read by a thread which
+    confirms the commands against its status packets"""
+
+    def __init__(self, url):
+        self.name = url
+        self.serial = None
+        self.error = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _open(self):
+        import serial
+        if 'oxfcryo700' not in serial.protocol_handler_packages:
+            serial.protocol_handler_packages.append('oxfcryo700')
+        self.serial = serial.serial_for_url(self.name, timeout=0.5)
+        self.writer = CommandWriter(self.serial)
+        self._thread = threading.Thread(target=self._read, daemon=True,
+                                        name='SerialTarget')
+        self._thread.start()
+
+    def _read(self):
+        decoder = StatusPacketDecoder()
+        while not self._closed:
+            try:
+                data = self.serial.read(max(1, self.serial.in_waiting))
+            except Exception as e:
+                if not self._closed:
+                    self.error = e
+                return
+            received = time.monotonic()
+            for packet in decoder.feed(data, time.time()):
+                self.writer.notify(packet, received)
+
+    def execute(self, command, args, timeout):
+        with self._lock:
+            if self.serial is None:
+                self._open()
+        if self.error is not None:
+            raise self.error
+        params = command_params(' '.join([command] + [str(a) for a in args]))
+        request = self.writer.submit(command_packet(*params),
+                                     command_confirmation(*params))
+        if not request.wait(timeout) and not request.done:
+            return TIMEOUT, self.error
+        return request.state, request.error
+
+    def close(self):
+        self._closed = True
+        if self.serial is not None:
+            self.writer.stop(1.0)
+            self.serial.close()
+
+
+def make_target(name):
+    """Tango device for a device name (domain/family/member or tango://
+    URL), serial target for a device file or a pyserial URL"""
+    if name.startswith('tango://') or (
+            name.count('/') == 2 and '://' not in name
+            and not name.startswith('/')):
+        return TangoTarget(name)
+    return SerialTarget(name)
+
+
+class CryostreamGroup:
+    """Sends the same command to a group of Cryostreams concurrently,
+    with at most max_workers commands in progress"""
+
+    def __init__(self, targets, max_workers=16, timeout=60.):
+        self.targets = [make_target(target) if isinstance(target, str)
+                        else target for target in targets]
+        self.timeout = timeout
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max(1, min(max_workers, len(self.targets))),
+            thread_name_prefix='CryostreamGroup')
+
+    def _execute(self, target, command, args, timeout):
+        start = time.monotonic()
+        try:
+            state, error = target.execute(command, args, timeout)
+        except Exception as e:
+            state, error = CommandRequest.FAILED, e
+        return GroupResult(target.name, command, state,
+                           time.monotonic() - start, error)
+
+    def run(self, command, *args, timeout=None):
+        """sends the command to all the targets and waits for their
+        confirmation. Returns the GroupResult of each target, in the order
+        of the targets"""
+        command = command.lower()
+        if command not in GROUP_COMMANDS:
+            raise ValueError("Unknown group command '{}'. Valid commands "
+                             "are: {}".format(command,
+                                              ', '.join(GROUP_COMMANDS)))
+        # the arguments are checked once before the dispatch
+        command_params(' '.join([command] + [str(a) for a in args]))
+        if timeout is None:
+            timeout = self.timeout
+        futures = [self._pool.submit(self._execute, target, command, args,
+                                     timeout)
+                   for target in self.targets]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._pool.shutdown()
+        for target in self.targets:
+            target.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def format_results(results):
+    """text table of the results"""
+    width = max([len(result.target) for result in results] + [6])
+    lines = ['{:<{}}  {:<10}  {:>9}  {}'.format('Target', width, 'State',
+                                                'Latency', 'Error')]
+    for result in results:
+        lines.append('{:<{}}  {:<10}  {:>8.3f}s  {}'.format(
+            result.target, width, result.state, result.latency,
+            '' if result.error is None else result.error))
+    return '\n'.join(lines)
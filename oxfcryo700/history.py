@@ -0,0 +1,79 @@
+import threading
+import numpy
+
+# Decoded status packet fields kept in the history
+HISTORY_FIELDS = ('gas_set_point', 'gas_temp', 'gas_error', 'gas_flow',
+                  'evap_temp', 'suct_temp', 'gas_heat', 'evap_heat',
+                  'suct_heat', 'line_pressure', 'remaining', 'run_mode_code',
+                  'phase_code', 'alarm_code')
+
+
+class StatusHistory:
+    """Fixed-capacity ring buffer of timestamped status packet fields.
+
+    All the memory is allocated at construction time, appending a packet
+    only writes its values in place, overwriting the oldest sample once
+    the buffer is full. The readers get chronologically ordered copies.
+    """
+
+    def __init__(self, capacity, fields=HISTORY_FIELDS):
+        if capacity < 1:
+            raise ValueError('History capacity must be positive')
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = numpy.zeros(capacity)
+        self._data = numpy.zeros((len(self.fields), capacity))
+        self._columns = tuple(zip(self.fields, self._data))
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        self._next = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, packet, timestamp):
+        """stores the fields of the packet in the oldest slot"""
+        i = self._next
+        with self._lock:
+            self.timestamps[i] = timestamp
+            for name, column in self._columns:
+                column[i] = getattr(packet, name)
+            self._next = (i + 1) % self.capacity
+            self.count += 1
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self.count = 0
+
+    def _ordered(self, column):
+        if self.count < self.capacity:
+            return column[:self._next].copy()
+        return numpy.concatenate((column[self._next:],
+                                  column[:self._next]))
+
+    def get_timestamps(self):
+        """returns the timestamps, oldest first"""
+        with self._lock:
+            return self._ordered(self.timestamps)
+
+    def get(self, name):
+        """returns the values of a field, oldest first"""
+        column = self._data[self._index[name]]
+        with self._lock:
+            return self._ordered(column)
+
+    def query(self, start, end, fields=None):
+        """returns the timestamps and the values of the fields (all by
+        default) of the samples within [start, end], as a 2D array with
+        one row per sample: timestamp, field values..."""
+        if fields is None:
+            fields = self.fields
+        rows = [self.timestamps] + [self._data[self._index[name]]
+                                    for name in fields]
+        with self._lock:
+            table = numpy.array([self._ordered(row) for row in rows])
+        first = numpy.searchsorted(table[0], start, side='left')
+        last = numpy.searchsorted(table[0], end, side='right')
+        return table[:, first:last].T
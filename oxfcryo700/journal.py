@@ -0,0 +1,133 @@
+"""
+Journal of the state transitions of the controller: changes of the run
+mode, phase and alarm codes and of the turbo mode, detected by the reader
+on every status packet.
+
+The last entries are kept in memory and optionally appended to a file of
+fixed-size records (timestamp, field index, value before, value after),
+reloaded at start. The file is rewritten with the entries in memory when
+it holds more than twice their number, so it stays bounded.
+"""
+
+import collections
+import os
+import struct
+import threading
+
+from .oxfordcryo import StatusPacket, code_name
+
+# journaled fields, as their attribute name, and the names of their codes
+TRANSITION_FIELDS = ('RunMode', 'Phase', 'Alarm', 'TurboMode')
+TRANSITION_CODES = (StatusPacket.RUNMODE_CODES, StatusPacket.PHASE_CODES,
+                    StatusPacket.ALARM_CODES, ['Off', 'On'])
+
+# timestamp, field index, value before, value after
+RECORD = struct.Struct('<dHhh')
+
+Transition = collections.namedtuple('Transition',
+                                    'timestamp field before after')
+
+
+def transition_values(packet, turbo):
+    """values of TRANSITION_FIELDS of a status packet"""
+    return (packet.run_mode_code, packet.phase_code, packet.alarm_code,
+            int(turbo))
+
+
+def transition_text(transition):
+    """"<field> <before name> -> <after name>" of a Transition"""
+    names = TRANSITION_CODES[TRANSITION_FIELDS.index(transition.field)]
+    return '{} {} -> {}'.format(transition.field,
+                                code_name(names, transition.before),
+                                code_name(names, transition.after))
+
+
+class TransitionJournal:
+    """Bounded journal of the transitions, fed with the values of
+    TRANSITION_FIELDS of every status packet"""
+
+    def __init__(self, size, filename=None):
+        if size < 1:
+            raise ValueError('Journal size must be positive')
+        self.size = size
+        self.entries = collections.deque(maxlen=size)
+        # number of transitions appended since the start
+        self.count = 0
+        self.last_values = None
+        self.filename = filename
+        self._file = None
+        self._records = 0
+        self._lock = threading.Lock()
+        if filename:
+            self._load()
+            self._file = open(filename, 'ab')
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        self._records = len(data) // RECORD.size
+        first = max(0, self._records - self.size)
+        for timestamp, field, before, after in RECORD.iter_unpack(
+                data[first * RECORD.size:self._records * RECORD.size]):
+            if field < len(TRANSITION_FIELDS):
+                self.entries.append(Transition(
+                    timestamp, TRANSITION_FIELDS[field], before, after))
+
+    def _write(self, transitions):
+        if self._records + len(transitions) > 2 * self.size:
+            # compaction: only the entries in memory are kept
+            self._file.close()
+            with open(self.filename, 'wb') as f:
+                f.write(b''.join([self._pack(t) for t in self.entries]))
+            self._records = len(self.entries)
+            self._file = open(self.filename, 'ab')
+        else:
+            self._file.write(b''.join([self._pack(t) for t in transitions]))
+            self._records += len(transitions)
+        self._file.flush()
+
+    @staticmethod
+    def _pack(transition):
+        return RECORD.pack(transition.timestamp,
+                           TRANSITION_FIELDS.index(transition.field),
+                           transition.before, transition.after)
+
+    def update(self, timestamp, values):
+        """compares the values with the previous ones and journals the
+        changes. Returns the new transitions"""
+        last, self.last_values = self.last_values, values
+        if last is None or last == values:
+            return []
+        transitions = [Transition(timestamp, field, before, after)
+                       for field, before, after in zip(TRANSITION_FIELDS,
+                                                       last, values)
+                       if before != after]
+        with self._lock:
+            self.entries.extend(transitions)
+            self.count += len(transitions)
+            if self._file is not None:
+                self._write(transitions)
+        return transitions
+
+    def last(self, count):
+        """the last count transitions (at most the journal size)"""
+        with self._lock:
+            count = min(count, len(self.entries))
+            return [self.entries[i]
+                    for i in range(len(self.entries) - count,
+                                   len(self.entries))]
+
+    def query(self, start, end, fields=None):
+        """transitions within [start, end], of the fields if given"""
+        with self._lock:
+            return [t for t in self.entries
+                    if start <= t.timestamp <= end
+                    and (fields is None or t.field in fields)]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,216 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper edges (s) of the inter-arrival jitter histogram bins, the last bin
+# counts the larger deviations
+JITTER_BINS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.)
+
+
+class ReaderMetrics:
+    """Statistics of the status packet stream of one device.
+
+    The jitter is the deviation of each packet inter-arrival time from the
+    average period (exponential moving average).
+    """
+    # weight of a new sample in the moving averages
+    ALPHA = 0.1
+
+    def __init__(self):
+        self.packets = 0
+        self.skipped = 0
+        self.corrupted = 0
+        self.flushed_bytes = 0
+        self.discarded_bytes = 0
+        self.bytes_read = 0
+        self.first_arrival = None
+        self.last_arrival = None
+        self.period = None
+        self.jitter_counts = [0] * (len(JITTER_BINS) + 1)
+        self.jitter_sum = 0.
+        self.decode_time = 0.
+        self.decode_time_max = 0.
+        self.decode_time_total = 0.
+        self.read_age = 0.
+        self.read_age_max = 0.
+        self.reads = 0
+
+    def add_chunk(self, size, packets, decode_time, arrival):
+        """records a chunk of bytes read, the number of complete packets
+        it contained, the time taken to decode it and its monotonic arrival
+        time"""
+        self.bytes_read += size
+        self.decode_time_total += decode_time
+        if not packets:
+            return
+        per_packet = decode_time / packets
+        self.decode_time += self.ALPHA * (per_packet - self.decode_time)
+        self.decode_time_max = max(self.decode_time_max, per_packet)
+        self.packets += packets
+        # only the newest packet of a chunk is published
+        self.skipped += packets - 1
+        if self.first_arrival is None:
+            self.first_arrival = arrival
+        elif self.last_arrival is not None:
+            interval = (arrival - self.last_arrival) / packets
+            if self.period is None:
+                self.period = interval
+            else:
+                jitter = abs(interval - self.period)
+                self.jitter_counts[bisect.bisect_left(JITTER_BINS,
+                                                      jitter)] += 1
+                self.jitter_sum += jitter
+                self.period += self.ALPHA * (interval - self.period)
+        self.last_arrival = arrival
+
+    def add_read(self):
+        """records the age of the last packet when it is read"""
+        age = self.age
+        if age is None:
+            return
+        self.reads += 1
+        self.read_age += self.ALPHA * (age - self.read_age)
+        self.read_age_max = max(self.read_age_max, age)
+
+    @property
+    def age(self):
+        """time since the last packet arrival"""
+        if self.last_arrival is None:
+            return None
+        return time.monotonic() - self.last_arrival
+
+    @property
+    def rate(self):
+        """packets per second (moving average)"""
+        if not self.period:
+            return 0.
+        return 1. / self.period
+
+    def families(self):
+        """returns the metric families as (name, type, help, samples)
+        tuples, each sample being a (suffix, labels, value) tuple"""
+        count = 0
+        buckets = []
+        for edge, bin_count in zip(JITTER_BINS + ('+Inf',),
+                                   self.jitter_counts):
+            count += bin_count
+            buckets.append(('_bucket', 'le="{}"'.format(edge), count))
+        return [
+            ('packets_total', 'counter', 'Status packets decoded',
+             [('', '', self.packets)]),
+            ('skipped_packets_total', 'counter',
+             'Packets superseded by a newer one read at once',
+             [('', '', self.skipped)]),
+            ('corrupted_packets_total', 'counter',
+             'Stream resynchronizations', [('', '', self.corrupted)]),
+            ('flushed_bytes_total', 'counter',
+             'Bytes flushed from the input buffer',
+             [('', '', self.flushed_bytes)]),
+            ('discarded_bytes_total', 'counter',
+             'Bytes discarded while resynchronizing',
+             [('', '', self.discarded_bytes)]),
+            ('read_bytes_total', 'counter', 'Bytes read from the port',
+             [('', '', self.bytes_read)]),
+            ('packet_rate', 'gauge', 'Packets per second',
+             [('', '', self.rate)]),
+            ('packet_age_seconds', 'gauge', 'Time since the last packet',
+             [('', '', self.age)]),
+            ('decode_seconds', 'gauge',
+             'Decode time per packet (moving average)',
+             [('', '', self.decode_time)]),
+            ('read_age_seconds', 'gauge',
+             'Packet age when read by a client (moving average)',
+             [('', '', self.read_age)]),
+            ('jitter_seconds', 'histogram',
+             'Packet inter-arrival deviation from the average period',
+             buckets + [('_sum', '', self.jitter_sum),
+                        ('_count', '', count)]),
+        ]
+
+    def prometheus(self, labels):
+        """returns the metrics in the Prometheus text format"""
+        return prometheus_text([(labels, self)])
+
+
+def prometheus_text(metrics):
+    """returns the metrics of several devices, given as (labels,
+    ReaderMetrics) pairs, in the Prometheus text format: each family is
+    described once, followed by the samples of all the devices"""
+    families = {}
+    for labels, device_metrics in metrics:
+        for name, kind, doc, samples in device_metrics.families():
+            lines = families.setdefault(name, (kind, doc, []))[2]
+            for suffix, sample_labels, value in samples:
+                if value is None:
+                    continue
+                lines.append('oxfcryo700_{}{}{{{}}} {}'.format(
+                    name, suffix,
+                    ','.join(item for item in (labels, sample_labels)
+                             if item),
+                    value))
+    lines = []
+    for name, (kind, doc, samples) in families.items():
+        if not samples:
+            continue
+        lines.append('# HELP oxfcryo700_{} {}'.format(name, doc))
+        lines.append('# TYPE oxfcryo700_{} {}'.format(name, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """HTTP server exposing the ReaderMetrics of the registered devices in
+    the Prometheus text format. There is one server per address, shared
+    by the devices of the process configured with the same host and
+    port."""
+
+    _servers = {}
+    _servers_lock = threading.Lock()
+
+    def __init__(self, port, host='localhost'):
+        self.host = host
+        self.port = port
+        self.metrics = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @classmethod
+    def register(cls, port, name, metrics, host='localhost'):
+        with cls._servers_lock:
+            if (host, port) not in cls._servers:
+                cls._servers[host, port] = cls(port, host)
+            cls._servers[host, port].metrics[name] = metrics
+
+    @classmethod
+    def unregister(cls, port, name, host='localhost'):
+        with cls._servers_lock:
+            server = cls._servers.get((host, port))
+            if server is None:
+                return
+            server.metrics.pop(name, None)
+            if not server.metrics:
+                server.httpd.shutdown()
+                server.httpd.server_close()
+                del cls._servers[host, port]
+
+    def render(self):
+        return prometheus_text(
+            [('device="{}"'.format(name), metrics)
+             for name, metrics in sorted(self.metrics.items())])
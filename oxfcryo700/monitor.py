@@ -0,0 +1,188 @@
+"""
+Command line monitor of a Cryostream controller, without Tango:
+
+    OxfCryo700Monitor /dev/ttyS0 [--format csv|json] [--fields ...]
+                      [--command "Cool 100"] [--stdin]
+
+It opens the port with serial.serial_for_url (also socket:// and
+cryosim:// URLs) and prints one line per status packet, as CSV (with a
+header line) or JSON, to be piped into other tools. Commands can be sent
+at start (--command, repeatable) and read from the standard input, one per
+line (--stdin), e.g. "Ramp 360 250" or "Stop".
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+from .oxfordcryo import StatusPacketDecoder, EXTENDED_FORMAT, CSCOMMAND, \
+    command_packet
+
+# command name: (command id, divisors converting the arguments to the
+# protocol units)
+COMMANDS = {'restart': (CSCOMMAND.RESTART, ()),
+            'ramp': (CSCOMMAND.RAMP, (1, 100)),
+            'plat': (CSCOMMAND.PLAT, (1,)),
+            'hold': (CSCOMMAND.HOLD, ()),
+            'cool': (CSCOMMAND.COOL, (100,)),
+            'end': (CSCOMMAND.END, (1,)),
+            'purge': (CSCOMMAND.PURGE, ()),
+            'pause': (CSCOMMAND.PAUSE, ()),
+            'resume': (CSCOMMAND.RESUME, ()),
+            'stop': (CSCOMMAND.STOP, ()),
+            'turbo': (CSCOMMAND.TURBO, (1,)),
+            'statusformat': (CSCOMMAND.SETSTATUSFORMAT, (1,)),
+            'shutterstart': (CSCOMMAND.CRYOSHUTTER_START_MAN, ()),
+            'shutterstop': (CSCOMMAND.CRYOSHUTTER_STOP, ())}
+
+COMMANDS_HELP = ('Restart, Ramp <rate K/h> <target K>, Plat <min>, Hold, '
+                 'Cool <target K>, End <rate K/h>, Purge, Pause, Resume, '
+                 'Stop, Turbo <0|1>, StatusFormat <0|1>, ShutterStart, '
+                 'ShutterStop')
+
+# fields printed by default
+DEFAULT_FIELDS = ('timestamp', 'gas_set_point', 'gas_temp', 'gas_error',
+                  'run_mode', 'phase', 'ramp_rate', 'target_temp',
+                  'evap_temp', 'suct_temp', 'remaining', 'gas_flow',
+                  'gas_heat', 'evap_heat', 'suct_heat', 'line_pressure',
+                  'alarm', 'run_time', 'controller_nb')
+
+# all the fields which can be printed
+FIELDS = ('timestamp',) + EXTENDED_FORMAT.names \
+    + ('run_mode', 'phase', 'alarm')
+
+
+def parse_command(line):
+    """command packet from a "<name> [arguments]" line"""
+    return command_packet(*command_params(line))
+
+
+def command_params(line):
+    """command id and parameters in protocol units from a "<name>
+    [arguments]" line"""
+    items = line.split()
+    if not items:
+        raise ValueError("Empty command. Valid commands are: "
+                         "{}".format(COMMANDS_HELP))
+    return command_values(items[0], items[1:])
+
+
+def command_values(name, values):
+    """command id and parameters in protocol units from a command name
+    and its arguments (K, K/h, min)"""
+    if name.lower() not in COMMANDS:
+        raise ValueError("Unknown command '{}'. Valid commands are: "
+                         "{}".format(name, COMMANDS_HELP))
+    cmd, scales = COMMANDS[name.lower()]
+    if len(values) != len(scales):
+        raise ValueError("Wrong number of arguments of {}. Valid "
+                         "commands are: {}".format(name, COMMANDS_HELP))
+    params = [int(round(float(value) * scale))
+              for value, scale in zip(values, scales)]
+    return [cmd] + params
+
+
+def command_argument(line):
+    try:
+        return parse_command(line)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def csv_formatter(fields):
+    def format_packet(packet):
+        return ','.join(['' if value is None else str(value)
+                         for value in [getattr(packet, name)
+                                       for name in fields]])
+    return ','.join(fields), format_packet
+
+
+def json_formatter(fields):
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def format_packet(packet):
+        return encode({name: getattr(packet, name) for name in fields})
+    return None, format_packet
+
+
+FORMATTERS = {'csv': csv_formatter, 'json': json_formatter}
+
+
+def read_commands(port, stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            packet = parse_command(line)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            continue
+        port.write(packet)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cryostream 700 series status monitor',
+        epilog='Commands: {}'.format(COMMANDS_HELP))
+    parser.add_argument('port', help='serial port or pyserial URL')
+    parser.add_argument('--format', choices=sorted(FORMATTERS),
+                        default='csv', help='output format (default csv)')
+    parser.add_argument('--fields', nargs='+', choices=FIELDS,
+                        default=DEFAULT_FIELDS, metavar='FIELD',
+                        help='fields to print: {}'.format(', '.join(FIELDS)))
+    parser.add_argument('--command', '-c', action='append', default=[],
+                        type=command_argument, metavar='COMMAND',
+                        help='command sent at start, e.g. "Cool 100"')
+    parser.add_argument('--stdin', action='store_true',
+                        help='read commands from the standard input')
+    parser.add_argument('--count', type=int, default=0,
+                        help='exit after this number of packets')
+    parser.add_argument('--duration', type=float, default=0.,
+                        help='exit after this number of seconds')
+    args = parser.parse_args()
+
+    # pyserial is only needed here, not to decode the packets
+    import serial
+    if 'oxfcryo700' not in serial.protocol_handler_packages:
+        serial.protocol_handler_packages.append('oxfcryo700')
+    port = serial.serial_for_url(args.port, timeout=0.5)
+
+    header, format_packet = FORMATTERS[args.format](args.fields)
+    out = sys.stdout
+    if header is not None:
+        out.write(header + '\n')
+    for packet in args.command:
+        port.write(packet)
+    if args.stdin:
+        threading.Thread(target=read_commands, daemon=True,
+                         args=(port, sys.stdin)).start()
+
+    decoder = StatusPacketDecoder()
+    end = time.monotonic() + args.duration if args.duration else None
+    count = 0
+    try:
+        while args.count <= 0 or count < args.count:
+            if end is not None and time.monotonic() >= end:
+                break
+            data = port.read(max(1, port.in_waiting))
+            if not data:
+                continue
+            packets = decoder.feed(data, time.time())
+            if args.count > 0:
+                packets = packets[:args.count - count]
+            if not packets:
+                continue
+            count += len(packets)
+            out.write(''.join([format_packet(packet) + '\n'
+                               for packet in packets]))
+            out.flush()
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        port.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+import collections
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+INT = struct.Struct('i')
+
+
+def bytes_waiting(fd):
+    """number of bytes readable without blocking on a socket, pipe or
+    terminal descriptor (FIONREAD), None if unknown"""
+    if fcntl is None:
+        return None
+    try:
+        buff = fcntl.ioctl(fd, termios.FIONREAD, b'\0' * INT.size)
+    except OSError:
+        return None
+    return INT.unpack(buff)[0]
+
+
+def port_waiting(serial, fd=None):
+    """number of bytes waiting on a port. The in_waiting of socket://
+    ports only tells if there is data, so FIONREAD is used on the port
+    descriptor when there is one"""
+    if fd is None:
+        try:
+            fd = serial.fileno()
+        except Exception:
+            fd = None
+    waiting = None if fd is None else bytes_waiting(fd)
+    if waiting is None:
+        waiting = serial.in_waiting
+    return waiting
+
+
+class Channel:
+    """A serial port registered in a SerialMultiplexer.
+
+    The multiplexer thread only reads the port and, if given, calls
+    decode(data, timestamp) on the bytes read, which returns the items to
+    process (e.g. the complete packets). The device callbacks run in a
+    worker thread of the channel, so a slow device does not delay the
+    others: callback(items, timestamp) with the decoded items (the bytes
+    without decode), error_callback(exception) when reading the port
+    fails, after which the channel is removed, and tick_callback() every
+    SerialMultiplexer.TICK seconds, even when no data is received. At most
+    queue_size chunks wait for the worker, the newer ones are dropped.
+    """
+
+    def __init__(self, serial, callback, error_callback=None,
+                 max_read=4096, tick_callback=None, decode=None,
+                 queue_size=256):
+        self.serial = serial
+        # file descriptor while registered, the port may be closed before
+        # the channel is removed
+        self.fd = None
+        self.callback = callback
+        self.error_callback = error_callback
+        self.tick_callback = tick_callback
+        self.decode = decode
+        self.max_read = max_read
+        self.queue_size = queue_size
+        self.bytes_read = 0
+        self.dropped = 0
+        self.callback_errors = 0
+        self.last_error = None
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = None
+
+    def _start(self, thread_context=None):
+        self._worker = threading.Thread(target=self._run,
+                                        args=(thread_context,),
+                                        daemon=True, name='Channel')
+        self._worker.start()
+
+    def _post(self, call, *args, required=False):
+        """queues a callback for the worker. Data and ticks are dropped
+        when the queue is full, required calls (errors) are not"""
+        with self._condition:
+            if not required and len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                return
+            self._queue.append((call, args))
+            self._condition.notify()
+
+    def _stop(self, timeout=None, discard=True):
+        """stops the worker, after the queued callbacks unless discard"""
+        with self._condition:
+            if discard:
+                self._closed = True
+            self._queue.append(None)
+            self._condition.notify()
+        if self._worker is not None and \
+                threading.current_thread() is not self._worker:
+            self._worker.join(timeout)
+
+    def _run(self, thread_context):
+        if thread_context is None:
+            self._work()
+        else:
+            with thread_context():
+                self._work()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                item = self._queue.popleft()
+                if item is None:
+                    return
+                if self._closed:
+                    continue
+            call, args = item
+            try:
+                call(*args)
+            except Exception as e:
+                self.callback_errors += 1
+                self.last_error = e
+
+
+class SerialMultiplexer:
+    """Reads the serial ports of all the devices of a process from a single
+    thread, waiting on them with a selector.
+
+    Every channel reads at most max_read bytes per wake-up, so a flooding
+    port can not starve the others, and a failing port or device callback
+    does not affect the rest. The callbacks run in one worker thread per
+    channel (see Channel). The ports must provide fileno() (posix
+    serial ports, socket:// and cryosim:// URLs). Errors of the thread
+    itself are counted in errors and last_error instead of stopping it.
+    """
+
+    # interval in seconds of the channel tick callbacks
+    TICK = 0.5
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, thread_context=None):
+        self.thread_context = thread_context
+        self.selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._changes = []
+        self.errors = 0
+        self.last_error = None
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='SerialMultiplexer')
+        self._thread.start()
+
+    @classmethod
+    def instance(cls, thread_context=None):
+        """the multiplexer shared by the whole process"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(thread_context)
+            return cls._instance
+
+    @staticmethod
+    def supports(serial):
+        try:
+            serial.fileno()
+        except Exception:
+            return False
+        return True
+
+    def register(self, serial, callback, error_callback=None,
+                 max_read=4096, tick_callback=None, decode=None):
+        """starts reading the port, returns its Channel"""
+        channel = Channel(serial, callback, error_callback, max_read,
+                          tick_callback, decode)
+        channel._start(self.thread_context)
+        self._change(channel, True)
+        return channel
+
+    def unregister(self, channel, timeout=1.):
+        """stops reading the channel, once this returns the callbacks are
+        not called anymore (unless called from one of them)"""
+        done = threading.Event()
+        self._change(channel, False, done)
+        if threading.current_thread() is not self._thread:
+            done.wait(timeout)
+        channel._stop(timeout)
+
+    def _change(self, channel, register, done=None):
+        with self._lock:
+            self._changes.append((channel, register, done))
+        self._wakeup_w.send(b'\0')
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for channel, register, done in changes:
+            if register:
+                try:
+                    fd = channel.serial.fileno()
+                    self.selector.register(fd, selectors.EVENT_READ,
+                                           channel)
+                    channel.fd = fd
+                except Exception as e:
+                    # e.g. port closed before the registration
+                    self._fail(channel, e)
+            else:
+                self._remove(channel)
+            if done is not None:
+                done.set()
+
+    def _remove(self, channel):
+        """unregisters the channel by its registered descriptor, never by
+        the port, which may be closed, or whose descriptor may already be
+        reused by another channel"""
+        fd, channel.fd = channel.fd, None
+        if fd is None:
+            return
+        key = self.selector.get_map().get(fd)
+        if key is not None and key.data is channel:
+            self.selector.unregister(fd)
+
+    def _fail(self, channel, error):
+        """removes a channel whose port failed and reports the error from
+        its worker, which then stops"""
+        channel.last_error = error
+        self._remove(channel)
+        if channel.error_callback is not None:
+            channel._post(channel.error_callback, error, required=True)
+        channel._stop(0, discard=False)
+
+    def _check_descriptors(self):
+        """removes the channels whose descriptor was closed, after the
+        selector failed on it"""
+        for key in list(self.selector.get_map().values()):
+            if key.data is None:
+                continue
+            try:
+                os.fstat(key.fd)
+            except OSError as e:
+                self._fail(key.data, e)
+
+    def _run(self):
+        if self.thread_context is None:
+            self._loop()
+        else:
+            with self.thread_context():
+                self._loop()
+
+    def _loop(self):
+        next_tick = time.monotonic() + self.TICK
+        while True:
+            try:
+                next_tick = self._step(next_tick)
+            except Exception as e:
+                # the thread serves all the devices, it must not die
+                self.errors += 1
+                self.last_error = e
+                try:
+                    self._check_descriptors()
+                except Exception:
+                    pass
+                time.sleep(0.01)
+
+    def _step(self, next_tick):
+        """waits for the ports once, returns the time of the next tick"""
+        timeout = max(0., next_tick - time.monotonic())
+        for key, _ in self.selector.select(timeout):
+            channel = key.data
+            if channel is None:
+                try:
+                    self._wakeup_r.recv(4096)
+                except BlockingIOError:
+                    pass
+                self._apply_changes()
+            elif channel.fd is not None:
+                self._read(channel)
+        now = time.monotonic()
+        if now >= next_tick:
+            next_tick = now + self.TICK
+            self._tick()
+        return next_tick
+
+    def _tick(self):
+        channels = [key.data for key in self.selector.get_map().values()]
+        for channel in channels:
+            if channel is None or channel.tick_callback is None:
+                continue
+            channel._post(channel.tick_callback)
+
+    def _read(self, channel):
+        try:
+            waiting = port_waiting(channel.serial, channel.fd)
+            data = channel.serial.read(min(max(1, waiting),
+                                           channel.max_read))
+        except Exception as e:
+            self._fail(channel, e)
+            return
+        if not data:
+            return
+        channel.bytes_read += len(data)
+        timestamp = time.time()
+        items = data
+        if channel.decode is not None:
+            try:
+                items = channel.decode(data, timestamp)
+            except Exception as e:
+                channel.callback_errors += 1
+                channel.last_error = e
+                return
+            if not items:
+                return
+        channel._post(channel.callback, items, timestamp)
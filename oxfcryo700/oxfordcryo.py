@@ -92,37 +92,165 @@
         AlarmConditionPsuOverheat, /* = 15: Power supply overheating */
         AlarmConditionPowerLoss /* = 16: Power failure */
      };
+
+     Extended Status Packets
+     -----------------------
+     After a CSCOMMAND_SETSTATUSFORMAT command with parameter 1 the
+     controller issues extended status packets. They start with the same
+     members as CryostreamStatus, followed by:
+
+     typedef struct {
+        ...
+        unsigned char Length; /* Length of this packet = 42 (bytes) */
+        unsigned char Type; /* Status Packet ID = 2 */
+        ...
+        unsigned char TurboMode; /* Turbo mode on/off */
+        unsigned char HardwareType; /* Hardware type */
+        unsigned char ShutterState; /* Cryoshutter state */
+        unsigned char ShutterTime; /* Cryoshutter time remaining */
+        unsigned char AvgGasHeat; /* Average gas heater, % */
+        unsigned char AvgSuctHeat; /* Average suct heater, % */
+        unsigned short TimeToFill; /* Time to fill */
+        unsigned short TotalHours; /* Total hours of operation */
+     } CryostreamStatusExtended ;
 """
 
+import bisect
+import mmap
+import os
+import struct
+import time
+
+# Status packet layouts, one entry per field of the structure:
+# (attribute name, struct format character, divisor to get physical units)
+STATUS_FIELDS = (
+    ('length', 'B', None),
+    ('type', 'B', None),
+    ('gas_set_point', 'H', 100.),
+    ('gas_temp', 'H', 100.),
+    ('gas_error', 'h', 100.),
+    ('run_mode_code', 'B', None),
+    ('phase_code', 'B', None),
+    ('ramp_rate', 'H', None),
+    ('target_temp', 'H', 100.),
+    ('evap_temp', 'H', 100.),
+    ('suct_temp', 'H', 100.),
+    ('remaining', 'H', None),
+    ('gas_flow', 'B', 10.),
+    ('gas_heat', 'B', None),
+    ('evap_heat', 'B', None),
+    ('suct_heat', 'B', None),
+    ('line_pressure', 'B', None),
+    ('alarm_code', 'B', None),
+    ('run_time', 'H', None),
+    ('controller_nb', 'H', None),
+    ('software_version', 'B', None),
+    ('evap_adjust', 'B', None),
+)
+
+EXTENDED_STATUS_FIELDS = STATUS_FIELDS + (
+    ('turbo_mode', 'B', None),
+    ('hardware_type', 'B', None),
+    ('shutter_state', 'B', None),
+    ('shutter_time', 'B', None),
+    ('avg_gas_heat', 'B', None),
+    ('avg_suct_heat', 'B', None),
+    ('time_to_fill', 'H', None),
+    ('total_hours', 'H', None),
+)
+
+_DTYPE_CODES = {'B': 'u1', 'H': '>u2', 'h': '>i2'}
+
+
+class StatusFormat:
+    """Layout of one status packet format, built from a field table"""
+
+    def __init__(self, name, type_id, fields):
+        self.name = name
+        self.type = type_id
+        self.fields = fields
+        self.names = tuple(field[0] for field in fields)
+        # byte offset of each field in the packet
+        self.offsets = {}
+        layout = '>'
+        for field in fields:
+            self.offsets[field[0]] = struct.calcsize(layout)
+            layout += field[1]
+        self.struct = struct.Struct(
+            '>' + ''.join(field[1] for field in fields))
+        self.length = self.struct.size
+        # NumPy structured dtype (big-endian) description of the layout
+        self.dtype = [(field[0], _DTYPE_CODES[field[1]])
+                      for field in fields]
+        self.scales = {field[0]: field[2] for field in fields
+                       if field[2] is not None}
+        # (index, divisor) of the scaled fields
+        self.scaled = tuple((i, field[2]) for i, field in enumerate(fields)
+                            if field[2] is not None)
+
+    def pack(self, values):
+        """encodes a status packet from a dictionary of field values in
+        physical units, missing fields are 0"""
+        raw = []
+        for name, _, scale in self.fields:
+            value = values.get(name, 0)
+            if scale is not None:
+                value = int(round(value * scale))
+            raw.append(value)
+        raw[0], raw[1] = self.length, self.type
+        return self.struct.pack(*raw)
+
+
+STANDARD_FORMAT = StatusFormat('standard', 1, STATUS_FIELDS)
+EXTENDED_FORMAT = StatusFormat('extended', 2, EXTENDED_STATUS_FIELDS)
+
+# Status packet formats by their Length byte
+STATUS_FORMATS = {fmt.length: fmt for fmt in (STANDARD_FORMAT,
+                                              EXTENDED_FORMAT)}
+
+# Status packet Length/Type header pairs the controller may emit: the
+# standard format and the extended one (see Status_Format command)
+STATUS_PACKET_HEADERS = {fmt.length: fmt.type
+                         for fmt in STATUS_FORMATS.values()}
+
+# NumPy structured dtype mirroring the CryostreamStatus layout
+STATUS_PACKET_DTYPE = STANDARD_FORMAT.dtype
+
+# divisor applied to the raw value to get the physical units
+STATUS_PACKET_SCALES = STANDARD_FORMAT.scales
+
+# fields only present in the extended status packets
+EXTENDED_ONLY_NAMES = EXTENDED_FORMAT.names[len(STANDARD_FORMAT.names):]
+
+# value of the fields missing in each format
+_MISSING_FIELDS = {fmt: (None,) * (len(EXTENDED_FORMAT.names)
+                                   - len(fmt.names))
+                   for fmt in STATUS_FORMATS.values()}
+
+
+# alarm codes from AlarmConditionTempWarning are failures, the lower ones
+# are the normal end of a run (stop, end, purge)
+FIRST_FAULT_ALARM = 5
+
+# run modes of a controller which is not shut down
+RUNNING_MODES = ('StartUp', 'StartUpOK', 'Run', 'SetUp')
+
+
+def code_name(names, code):
+    """name of a run mode, phase or alarm code, Unknown(code) if the code
+    is not in the table"""
+    if code < len(names):
+        return names[code]
+    return 'Unknown({})'.format(code)
+
 
 class StatusPacket:
-    # 0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 22 23 24 25 26
-    #  27 28 29 30 31
-    # L T GS  2GT 2GE R P 2RR   2TT   2ET   2ST   2R    GF GH EH SH LP AC
-    # 2RT   2CN   SV EA
-    Length_c_idx = 0
-    Type_c_idx = 1
-    GasSetPoint_s_idx = 2
-    GasTemp_s_idx = 4
-    GasError_s_idx = 6
-    RunMode_c_idx = 8
-    PhaseId_c_idx = 9
-    RampRate_s_idx = 10
-    TargetTemp_s_idx = 12
-    EvapTemp_s_idx = 14
-    SuctTemp_s_idx = 16
-    Remaining_s_idx = 18
-    GasFlow_c_idx = 20
-    GasHeat_c_idx = 21
-    EvapHeat_c_idx = 22
-    SuctHeat_c_idx = 23
-    LinePressure_c_idx = 24
-    AlarmCode_c_idx = 25
-    RunTime_s_idx = 26
-    ControllerNumber_s_idx = 28
-    SoftwareVersion_c_idx = 30
-    EvapAdjust_c_idx = 31
+    """Status packet received from the controller.
 
+    The raw bytes are kept and the fields are decoded on first access, with
+    the temperatures in K and the gas flow in l/min. The fields only in the
+    extended format are None for the standard packets.
+    """
     RUNMODE_CODES = ['StartUp', 'StartUpFail', 'StartUpOK', 'Run', 'SetUp',
                      'ShutdownOK', 'ShutdownFail']
 
@@ -160,60 +288,60 @@ class StatusPacket:
                    'AlarmConditionHighTempError'
                    ]
 
-    def __init__(self, data):
-        self.length = data[self.Length_c_idx]
-        self.type = data[self.Type_c_idx]
-        self.gas_set_point = self.getShort(
-            data[self.GasSetPoint_s_idx:self.GasSetPoint_s_idx + 2]) / 100.
-        self.gas_temp = self.getShort(
-            data[self.GasTemp_s_idx:self.GasTemp_s_idx + 2]) / 100.
-        self.gas_error = self.getSignedShort(
-            data[self.GasError_s_idx:self.GasError_s_idx + 2]) / 100.
-        self.run_mode_code = data[self.RunMode_c_idx]
-        self.run_mode = self.RUNMODE_CODES[self.run_mode_code]
-        self.phase_code = data[self.PhaseId_c_idx]
-        self.phase = self.PHASE_CODES[self.phase_code]
-        self.ramp_rate = self.getShort(
-            data[self.RampRate_s_idx:self.RampRate_s_idx + 2])
-        self.target_temp = self.getShort(
-            data[self.TargetTemp_s_idx:self.TargetTemp_s_idx + 2]) / 100.
-        self.evap_temp = self.getShort(
-            data[self.EvapTemp_s_idx:self.EvapTemp_s_idx + 2]) / 100.
-        self.suct_temp = self.getShort(
-            data[self.SuctTemp_s_idx:self.SuctTemp_s_idx + 2]) / 100.
-        self.remaining = self.getShort(
-            data[self.Remaining_s_idx:self.Remaining_s_idx + 2])
-        self.gas_flow = data[self.GasFlow_c_idx] / 10.
-        self.gas_heat = data[self.GasHeat_c_idx]
-        self.evap_heat = data[self.EvapHeat_c_idx]
-        self.suct_heat = data[self.SuctHeat_c_idx]
-        self.line_pressure = data[self.LinePressure_c_idx]
-        self.alarm_code = data[self.AlarmCode_c_idx]
-        self.alarm = self.ALARM_CODES[self.alarm_code]
-        rt = data[self.RunTime_s_idx:self.RunTime_s_idx + 2]
-        self.run_time = self.getShort(rt)
-        self.run_days = self.run_time // (60 * 24)
-        self.run_hours = (self.run_time - (self.run_days * 24 * 60)) // 60
-        run_min = (self.run_days * 24 * 60) - (self.run_hours * 60)
-        self.run_mins = self.run_time - run_min
-        nb = data[self.ControllerNumber_s_idx:self.ControllerNumber_s_idx + 2]
-        self.controller_nb = self.getShort(nb)
-        self.software_version = data[self.SoftwareVersion_c_idx]
-        self.evap_adjust = data[self.EvapAdjust_c_idx]
-
-    def getShort(self, data):
-        return (data[0] << 8) + data[1]
-
-    def getSignedShort(self, data):
-        """reverting two's complement if necessary"""
-        short = self.getShort(data)
-        # checking if value is negative
-        if (short & 0b1000000000000000) >> 15:
-            short = ~short
-            short += 1
-            short &= 0b1111111111111111
-            short *= -1  # returning the negative value
-        return short
+    __slots__ = ('format', 'raw', 'timestamp', '_values')
+
+    def __init__(self, data, timestamp=None):
+        data = bytes(data)
+        try:
+            fmt = STATUS_FORMATS[data[0]]
+        except KeyError:
+            raise ValueError('Unknown status packet length: '
+                             '{}'.format(data[0]))
+        if len(data) < fmt.length:
+            raise ValueError('Truncated status packet: {} bytes instead of '
+                             '{}'.format(len(data), fmt.length))
+        self.format = fmt
+        self.raw = data if len(data) == fmt.length else data[:fmt.length]
+        self.timestamp = timestamp
+        # the fields are decoded on first access
+        self._values = None
+
+    def _decode(self):
+        fmt = self.format
+        values = list(fmt.struct.unpack(self.raw))
+        for i, scale in fmt.scaled:
+            values[i] /= scale
+        values.extend(_MISSING_FIELDS[fmt])
+        self._values = values
+        return values
+
+    @property
+    def run_mode(self):
+        return code_name(self.RUNMODE_CODES, self.run_mode_code)
+
+    @property
+    def phase(self):
+        return code_name(self.PHASE_CODES, self.phase_code)
+
+    @property
+    def alarm(self):
+        return code_name(self.ALARM_CODES, self.alarm_code)
+
+    @property
+    def run_days(self):
+        return self.run_time // (60 * 24)
+
+    @property
+    def run_hours(self):
+        return self.run_time % (60 * 24) // 60
+
+    @property
+    def run_mins(self):
+        return self.run_time % 60
+
+    @property
+    def extended(self):
+        return self.format is EXTENDED_FORMAT
 
     def __repr__(self):
         pretty_print = 'Status Packet:'
@@ -246,9 +374,509 @@ class StatusPacket:
         pretty_print += '\ncontroller number: {}'.format(self.controller_nb)
         pretty_print += '\nsoftware version: {}'.format(self.software_version)
         pretty_print += '\nevap adjust: {}'.format(self.evap_adjust)
+        if self.extended:
+            for name in EXTENDED_ONLY_NAMES:
+                pretty_print += '\n{}: {}'.format(name.replace('_', ' '),
+                                                  getattr(self, name))
         return pretty_print
 
 
+class _Field:
+    """Status packet field, read from the values decoded at once on the
+    first access to any field"""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, packet, owner=None):
+        if packet is None:
+            return self
+        values = packet._values
+        if values is None:
+            values = packet._decode()
+        return values[self.index]
+
+
+# the fields of the standard format are first in the extended one
+for _index, _name in enumerate(EXTENDED_FORMAT.names):
+    setattr(StatusPacket, _name, _Field(_index))
+del _index, _name
+
+
+def turbo_state(packet):
+    """Turbo mode state, estimated from the gas flow and the phase when
+    the packet is not in the extended format"""
+    if packet.extended:
+        return bool(packet.turbo_mode)
+    return packet.gas_flow > 5 and packet.phase != "Cool"
+
+
+class StatusPacketDecoder:
+    """Incremental decoder of the status packet stream.
+
+    Bytes read from the serial line are fed in chunks of any size, and the
+    complete packets found so far are returned. Incomplete data is kept
+    until the next call. When the stream is misaligned (start in the
+    middle of a packet, partial read, line glitch) the decoder drops one
+    byte at a time until a valid Length/Type header is found again, instead
+    of throwing the whole input away. Payload bytes can look like a header,
+    so a packet followed by bytes which are not a header is rejected, and
+    while unsynchronized a candidate packet is only accepted once the
+    following header is received and if it is plausible (see _plausible).
+    """
+
+    def __init__(self, headers=None):
+        if headers is None:
+            headers = STATUS_PACKET_HEADERS
+        self.headers = dict(headers)
+        self.buffer = bytearray()
+        # statistics
+        self.packets = 0
+        self.discarded = 0
+        self.resyncs = 0
+        # the stream may start anywhere
+        self._synced = False
+
+    @property
+    def pending(self):
+        """number of bytes waiting for the rest of their packet"""
+        return len(self.buffer)
+
+    def reset(self):
+        """drop the pending bytes (they are counted as discarded)"""
+        self.discarded += len(self.buffer)
+        del self.buffer[:]
+        self._synced = False
+
+    @staticmethod
+    def _plausible(buff, pos):
+        """a steady payload can form a header repeated at the packet
+        period, as the real one: a candidate packet must also have run
+        mode, phase and alarm codes of the protocol tables and a non zero
+        gas temperature"""
+        offsets = STANDARD_FORMAT.offsets
+        gas_temp = pos + offsets['gas_temp']
+        return buff[pos + offsets['run_mode_code']] \
+            < len(StatusPacket.RUNMODE_CODES) \
+            and buff[pos + offsets['phase_code']] \
+            < len(StatusPacket.PHASE_CODES) \
+            and buff[pos + offsets['alarm_code']] \
+            < len(StatusPacket.ALARM_CODES) \
+            and (buff[gas_temp] or buff[gas_temp + 1]) != 0
+
+    def feed(self, data, timestamp=None):
+        """appends the data to the stream and returns the list of complete
+        StatusPacket found, with the given timestamp"""
+        buff = self.buffer
+        buff.extend(data)
+        packets = []
+        pos = 0
+        synced = self._synced
+        size = len(buff)
+        while size - pos >= 2:
+            length = buff[pos]
+            if self.headers.get(length) != buff[pos + 1]:
+                pos += 1
+                self.discarded += 1
+                if synced:
+                    synced = False
+                    self.resyncs += 1
+                continue
+            following = pos + length
+            if size - following >= 2:
+                if self.headers.get(buff[following]) != buff[following + 1]:
+                    # not followed by a header: misaligned
+                    pos += 1
+                    self.discarded += 1
+                    if synced:
+                        synced = False
+                        self.resyncs += 1
+                    continue
+            elif not synced or size - pos < length:
+                break
+            if not synced and not self._plausible(buff, pos):
+                pos += 1
+                self.discarded += 1
+                continue
+            packets.append(StatusPacket(bytes(buff[pos:pos + length]),
+                                        timestamp))
+            pos += length
+            synced = True
+        self._synced = synced
+        self.packets += len(packets)
+        del buff[:pos]
+        return packets
+
+
+def decode_status_packets(buffer, scaled=True, status_format=None):
+    """Decodes a buffer (bytes, bytearray, memoryview...) of concatenated
+    status packets at once.
+
+    Returns a dictionary of columnar NumPy arrays, one per field of the
+    CryostreamStatus structure. The raw fields are views on the buffer
+    (no copy), the temperatures are converted to K and the gas flow to
+    l/min unless scaled is False. A trailing incomplete packet is ignored.
+    All the packets must have the same format, by default the one given by
+    the Length byte of the first packet: ValueError is raised if the
+    Length and Type bytes of any packet do not match it (mixed formats or
+    buffer not packet-aligned).
+    """
+    import numpy
+
+    view = memoryview(buffer).cast('B')
+    if status_format is None:
+        if not len(view):
+            status_format = STANDARD_FORMAT
+        elif view[0] in STATUS_FORMATS:
+            status_format = STATUS_FORMATS[view[0]]
+        else:
+            raise ValueError('Buffer not packet-aligned: unknown status '
+                             'packet length {}'.format(view[0]))
+    dtype = numpy.dtype(status_format.dtype)
+    count = len(view) // dtype.itemsize
+    packets = numpy.frombuffer(buffer, dtype=dtype, count=count)
+    wrong = numpy.flatnonzero((packets['length'] != status_format.length)
+                              | (packets['type'] != status_format.type))
+    if len(wrong):
+        index = wrong[0]
+        length, type_id = packets['length'][index], packets['type'][index]
+        if STATUS_PACKET_HEADERS.get(length) == type_id:
+            raise ValueError('Mixed status formats: packet {} is {} '
+                             'instead of {}'.format(
+                                 index, STATUS_FORMATS[length].name,
+                                 status_format.name))
+        raise ValueError('Buffer not packet-aligned: packet {} has Length '
+                         '{} and Type {}'.format(index, length, type_id))
+    columns = {}
+    for name in dtype.names:
+        column = packets[name]
+        if scaled and name in status_format.scales:
+            column = column / status_format.scales[name]
+        columns[name] = column
+    return columns
+
+
+class PacketCapture:
+    """Capture file of raw status packets, memory-mapped.
+
+    The file is a header followed by fixed-size records: the monotonic
+    and the wall-clock (epoch) timestamps of the packet, as little-endian
+    doubles, and the raw packet padded to 48 bytes. It grows by chunks of
+    GROW_RECORDS records and the number of valid records is kept in the
+    header, so a reader can follow a file being written.
+
+    A sparse index holding the wall-clock timestamp of every INDEX_STEP-th
+    record is kept in memory, so a time window is found with a binary
+    search on it, then on one block of records. It assumes the wall-clock
+    timestamps do not go backwards.
+    """
+    MAGIC = b'OXFCAP01'
+    HEADER = struct.Struct('<8sHHQ')  # magic, header size, record size, count
+    HEADER_SIZE = 64
+    RECORD = struct.Struct('<dd48s')  # monotonic, wall-clock, raw packet
+    RECORD_SIZE = RECORD.size
+    PACKET_OFFSET = 16
+    INDEX_STEP = 256
+    GROW_RECORDS = 4096
+
+    def __init__(self, filename, mode='r'):
+        if mode not in ('r', 'a'):
+            raise ValueError("Wrong mode. It must be 'r' (read) or "
+                             "'a' (append)")
+        self.filename = filename
+        self.mode = mode
+        self.count = 0
+        self.index = []
+        self._map = None
+        if mode == 'a':
+            self._file = open(filename, 'a+b')
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._resize(self.GROW_RECORDS)
+                self._write_header()
+        else:
+            self._file = open(filename, 'rb')
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return (len(self._map) - self.HEADER_SIZE) // self.RECORD_SIZE
+
+    def _resize(self, records):
+        if self._map is not None:
+            self._map.close()
+        size = self.HEADER_SIZE + records * self.RECORD_SIZE
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def _write_header(self):
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.HEADER_SIZE,
+                              self.RECORD_SIZE, self.count)
+
+    def refresh(self):
+        """maps the current file and reads the records written since the
+        last call (needed to follow a file written by another process)"""
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is None or len(self._map) != size:
+            if self._map is not None:
+                self._map.close()
+            access = mmap.ACCESS_READ if self.mode == 'r' else \
+                mmap.ACCESS_WRITE
+            self._map = mmap.mmap(self._file.fileno(), size, access=access)
+        magic, header_size, record_size, count = \
+            self.HEADER.unpack_from(self._map)
+        if magic != self.MAGIC or header_size != self.HEADER_SIZE or \
+                record_size != self.RECORD_SIZE:
+            raise ValueError('{} is not a status packet capture '
+                             'file'.format(self.filename))
+        self.count = count
+        for i in range(len(self.index) * self.INDEX_STEP, count,
+                       self.INDEX_STEP):
+            self.index.append(self.timestamp(i))
+
+    def close(self):
+        if self._map is not None:
+            if self.mode == 'a':
+                self._map.flush()
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def append(self, raw, monotonic=None, timestamp=None):
+        """appends a raw packet with its arrival timestamps (now by
+        default)"""
+        if monotonic is None:
+            monotonic = time.monotonic()
+        if timestamp is None:
+            timestamp = time.time()
+        if self.count == self.capacity:
+            self._resize(self.count + self.GROW_RECORDS)
+        offset = self.HEADER_SIZE + self.count * self.RECORD_SIZE
+        self.RECORD.pack_into(self._map, offset, monotonic, timestamp,
+                              bytes(raw))
+        if self.count % self.INDEX_STEP == 0:
+            self.index.append(timestamp)
+        self.count += 1
+        self._write_header()
+
+    def _offset(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError('record {} out of range'.format(i))
+        return self.HEADER_SIZE + i * self.RECORD_SIZE
+
+    def timestamp(self, i):
+        """wall-clock timestamp of the record i"""
+        return struct.unpack_from('<d', self._map, self._offset(i) + 8)[0]
+
+    def record(self, i):
+        """returns the monotonic and wall-clock timestamps of the record
+        i and a memoryview of its raw packet"""
+        offset = self._offset(i)
+        monotonic, timestamp = struct.unpack_from('<dd', self._map, offset)
+        offset += self.PACKET_OFFSET
+        length = self._map[offset]
+        view = memoryview(self._map)[offset:offset + length]
+        return monotonic, timestamp, view
+
+    def find(self, timestamp):
+        """index of the first record with a wall-clock timestamp not
+        earlier than timestamp"""
+        block = bisect.bisect_left(self.index, timestamp)
+        if block == 0:
+            return 0
+        lo = (block - 1) * self.INDEX_STEP
+        hi = min(block * self.INDEX_STEP, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, start, end):
+        """returns the range of records within [start, end]"""
+        first = self.find(start)
+        last = self.find(end)
+        while last < self.count and self.timestamp(last) <= end:
+            last += 1
+        return range(first, last)
+
+    def view(self, start, end):
+        """returns a memoryview of the records within [start, end], e.g.
+        to build a NumPy array without copy"""
+        records = self.window(start, end)
+        return self.records(records.start, records.stop)
+
+    def records(self, first, last):
+        """returns a memoryview of the records first to last (excluded)"""
+        first = self.HEADER_SIZE + first * self.RECORD_SIZE
+        last = self.HEADER_SIZE + min(last, self.count) * self.RECORD_SIZE
+        return memoryview(self._map)[first:last]
+
+    def packets(self, start, end):
+        """returns the list of (wall-clock timestamp, StatusPacket) within
+        [start, end]"""
+        result = []
+        for i in self.window(start, end):
+            _, timestamp, raw = self.record(i)
+            result.append((timestamp, StatusPacket(raw, timestamp)))
+        return result
+
+
+class _SharedPacket:
+    """Shared memory segment holding the last status packet, for the
+    processes of the same host. Layout (little-endian):
+
+        magic          8s
+        seqlock        Q   odd while the writer updates the packet
+        sequence       Q   number of packets written, 0 if none
+        timestamp      d   wall-clock timestamp of the packet
+        raw            48s raw packet, its first byte is its length
+    """
+    MAGIC = b'OXFSHM01'
+    HEADER = struct.Struct('<8s')
+    SEQLOCK = struct.Struct('<Q')
+    SEQLOCK_OFFSET = 8
+    PACKET = struct.Struct('<Qd48s')
+    PACKET_OFFSET = 16
+    SIZE = PACKET_OFFSET + PACKET.size
+
+    @staticmethod
+    def _untrack(shm):
+        """the segment outlives this process: the multiprocessing
+        resource tracker must not unlink it at exit"""
+        from multiprocessing import resource_tracker
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+    def close(self):
+        if self._shm is not None:
+            self._buf.release()
+            self._shm.close()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedPacketWriter(_SharedPacket):
+    """Publishes the status packets in a named shared memory segment
+    (created if needed, reused otherwise so the readers survive a restart
+    of the writer) protected by a seqlock. There must be only one writer
+    per segment."""
+
+    def __init__(self, name):
+        # multiprocessing.shared_memory needs Python 3.8
+        from multiprocessing import shared_memory
+        self.name = name
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True,
+                                                   size=self.SIZE)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name)
+            if self._shm.size < self.SIZE:
+                self._shm.close()
+                raise ValueError('Shared memory {} is too small for a '
+                                 'status packet'.format(name))
+        self._untrack(self._shm)
+        self._buf = self._shm.buf
+        self.seqlock, = self.SEQLOCK.unpack_from(self._buf,
+                                                 self.SEQLOCK_OFFSET)
+        if self.seqlock & 1:
+            # a previous writer died while writing
+            self.seqlock += 1
+        self.sequence = 0
+        if bytes(self._buf[:8]) == self.MAGIC:
+            self.sequence, = self.SEQLOCK.unpack_from(self._buf,
+                                                      self.PACKET_OFFSET)
+        self.HEADER.pack_into(self._buf, 0, self.MAGIC)
+
+    def write(self, raw, timestamp):
+        self.sequence += 1
+        self.SEQLOCK.pack_into(self._buf, self.SEQLOCK_OFFSET,
+                               self.seqlock + 1)
+        self.PACKET.pack_into(self._buf, self.PACKET_OFFSET, self.sequence,
+                              timestamp, bytes(raw))
+        self.seqlock += 2
+        self.SEQLOCK.pack_into(self._buf, self.SEQLOCK_OFFSET, self.seqlock)
+
+    def unlink(self):
+        """removes the segment, the attached readers keep the last
+        packet"""
+        # SharedMemory.unlink() unregisters the segment from the resource
+        # tracker, which fails on an untracked segment
+        from multiprocessing import resource_tracker
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+
+
+class SharedPacketReader(_SharedPacket):
+    """Reads the last status packet published by a SharedPacketWriter.
+    read() only copies the packet from the mapped segment (no system call
+    nor lock), retrying while the writer updates it:
+
+        reader = SharedPacketReader('oxfcryo700')
+        sequence, packet = reader.read()
+        print(packet.timestamp, packet.gas_temp)
+    """
+    RETRIES = 10000
+
+    def __init__(self, name):
+        # multiprocessing.shared_memory needs Python 3.8
+        from multiprocessing import shared_memory
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name)
+        self._untrack(self._shm)
+        self._buf = self._shm.buf
+        if self._shm.size < self.SIZE \
+                or bytes(self._buf[:8]) != self.MAGIC:
+            self.close()
+            raise ValueError('Shared memory {} is not a status packet '
+                             'segment'.format(name))
+
+    @property
+    def sequence(self):
+        """number of packets written"""
+        return self.SEQLOCK.unpack_from(self._buf, self.PACKET_OFFSET)[0]
+
+    def read(self):
+        """returns the sequence number and the StatusPacket of a
+        consistent copy of the last packet, (0, None) if none was
+        written"""
+        buf = self._buf
+        for _ in range(self.RETRIES):
+            seqlock, = self.SEQLOCK.unpack_from(buf, self.SEQLOCK_OFFSET)
+            if seqlock & 1:
+                continue
+            sequence, timestamp, raw = self.PACKET.unpack_from(
+                buf, self.PACKET_OFFSET)
+            if self.SEQLOCK.unpack_from(buf, self.SEQLOCK_OFFSET)[0] \
+                    == seqlock:
+                break
+        else:
+            raise RuntimeError('No consistent status packet in shared '
+                               'memory {}, the writer may have '
+                               'died'.format(self.name))
+        if sequence == 0:
+            return 0, None
+        return sequence, StatusPacket(raw, timestamp)
+
+
 class Struct:
     def __init__(self, **entries): self.__dict__.update(entries)
 
@@ -259,6 +887,77 @@ CSCOMMAND = Enum(RESTART=10, RAMP=11, PLAT=12, HOLD=13, COOL=14, END=15,
                  SETSTATUSFORMAT=40, CRYOSHUTTER_START_AUTO=80,
                  CRYOSHUTTER_START_MAN=81, CRYOSHUTTER_STOP=82)
 
+# struct format of the parameters of each command (big-endian)
+COMMAND_PARAMS = {CSCOMMAND.RESTART: '',
+                  CSCOMMAND.RAMP: 'HH',  # rate (K/h), end temp (100*K)
+                  CSCOMMAND.PLAT: 'H',  # duration (min)
+                  CSCOMMAND.HOLD: '',
+                  CSCOMMAND.COOL: 'H',  # end temp (100*K)
+                  CSCOMMAND.END: 'H',  # rate (K/h)
+                  CSCOMMAND.PURGE: '',
+                  CSCOMMAND.PAUSE: '',
+                  CSCOMMAND.RESUME: '',
+                  CSCOMMAND.STOP: '',
+                  CSCOMMAND.TURBO: 'B',  # 0 off, 1 on
+                  CSCOMMAND.SETSTATUSFORMAT: 'B',  # 0 standard, 1 extended
+                  CSCOMMAND.CRYOSHUTTER_START_AUTO: 'B',
+                  CSCOMMAND.CRYOSHUTTER_START_MAN: '',
+                  CSCOMMAND.CRYOSHUTTER_STOP: ''}
+
+_COMMAND_STRUCTS = {cmd: struct.Struct('>BB' + params)
+                    for cmd, params in COMMAND_PARAMS.items()}
+
+# precomputed packets of the commands without parameters
+COMMAND_PACKETS = {cmd: packer.pack(packer.size, cmd)
+                   for cmd, packer in _COMMAND_STRUCTS.items()
+                   if packer.size == 2}
+
+
+def command_packet(cmd, *params):
+    """encodes a command packet: size, command and parameters"""
+    if not params and cmd in COMMAND_PACKETS:
+        return COMMAND_PACKETS[cmd]
+    packer = _COMMAND_STRUCTS[cmd]
+    try:
+        return packer.pack(packer.size, cmd, *params)
+    except struct.error as e:
+        raise ValueError('Wrong parameters {} for command {}: '
+                         '{}'.format(params, cmd, e))
+
+
+def command_confirmation(cmd, *params):
+    """predicate on the status packets telling when the controller applied
+    a command (parameters in protocol units, as for command_packet), None
+    if the status packets can not confirm it. Only the packets received
+    after the command was written must be checked (see CommandWriter)"""
+    if cmd == CSCOMMAND.RESTART:
+        return lambda p: p.run_mode in RUNNING_MODES
+    if cmd == CSCOMMAND.STOP:
+        return lambda p: p.run_mode not in RUNNING_MODES
+    if cmd == CSCOMMAND.PURGE:
+        return lambda p: p.phase == 'Purge' \
+            or p.alarm == 'AlarmConditionPurge'
+    if cmd == CSCOMMAND.END:
+        return lambda p: p.phase == 'End' or p.alarm == 'AlarmConditionEnd'
+    if cmd in (CSCOMMAND.RAMP, CSCOMMAND.COOL):
+        # target temperature in centi-Kelvin
+        target = params[-1] / 100.
+        phase = 'Ramp' if cmd == CSCOMMAND.RAMP else 'Cool'
+        # the phase started, or already ended on its target
+        return lambda p: (p.phase == phase and p.target_temp == target) \
+            or (p.phase == 'Hold' and p.gas_set_point == target)
+    if cmd == CSCOMMAND.PLAT:
+        return lambda p: p.phase == 'Plat'
+    if cmd in (CSCOMMAND.HOLD, CSCOMMAND.PAUSE):
+        return lambda p: p.phase == 'Hold'
+    if cmd == CSCOMMAND.TURBO:
+        turn_on = bool(params[0])
+        return lambda p: turbo_state(p) == turn_on
+    if cmd == CSCOMMAND.SETSTATUSFORMAT:
+        extended = bool(params[0])
+        return lambda p: p.extended == extended
+    return None
+
 
 def splitBytes(number):
     """splits high and low byte (two less significant bytes) of an integer,
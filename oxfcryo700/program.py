@@ -0,0 +1,235 @@
+import threading
+import time
+
+from .oxfordcryo import CSCOMMAND, FIRST_FAULT_ALARM, command_packet, \
+    command_confirmation
+
+# gas temperature reached by End and Purge, for the time estimates
+ROOM_TEMP = 294.
+# rate of the Cool and Purge phases (K/h), for the time estimates
+COOL_RATE = 360.
+
+# parameters of the program phases: name, divisor for the protocol units
+PROGRAM_PHASES = {'Ramp': (('rate', 1), ('target', 100)),
+                  'Cool': (('target', 100),),
+                  'Plat': (('duration', 1),),
+                  'End': (('rate', 1),),
+                  'Purge': ()}
+
+PROGRAM_SYNTAX = ('Ramp <rate K/h> <target K>, Cool <target K>, '
+                  'Plat <duration min>, End <rate K/h> or Purge')
+
+
+class ProgramPhase:
+    """One phase of a temperature program, sent as a controller command
+    and completed according to the status packets"""
+
+    def __init__(self, name, rate=None, target=None, duration=None):
+        self.name = name
+        self.rate = rate
+        self.target = target
+        self.duration = duration
+        self._confirm = command_confirmation(*self.command())
+
+    def __repr__(self):
+        params = [str(value) for value in (self.rate, self.target,
+                                           self.duration)
+                  if value is not None]
+        return ' '.join([self.name] + params)
+
+    @classmethod
+    def parse(cls, line):
+        items = line.split()
+        if not items or items[0] not in PROGRAM_PHASES:
+            raise ValueError("Wrong program phase '{}'. Valid phases are: "
+                             "{}".format(line, PROGRAM_SYNTAX))
+        name = items[0]
+        params = PROGRAM_PHASES[name]
+        if len(items) - 1 != len(params):
+            raise ValueError("Wrong number of arguments in program phase "
+                             "'{}'. Valid phases are: {}".format(
+                                 line, PROGRAM_SYNTAX))
+        values = {param: float(value)
+                  for (param, _), value in zip(params, items[1:])}
+        if 'target' in values and not 80 <= values['target'] <= 400:
+            raise ValueError("Wrong target temperature in program phase "
+                             "'{}'. It must be between 80 and "
+                             "400".format(line))
+        return cls(name, **values)
+
+    def command(self):
+        """command id and parameters in protocol units"""
+        cmd = getattr(CSCOMMAND, self.name.upper())
+        params = [int(round(getattr(self, param) * scale))
+                  for param, scale in PROGRAM_PHASES[self.name]]
+        return [cmd] + params
+
+    def packet(self):
+        return command_packet(*self.command())
+
+    @property
+    def sent_target(self):
+        """target temperature in K as sent to the controller (rounded to
+        0.01 K)"""
+        return self.command()[-1] / 100.
+
+    def started(self, p):
+        """the controller applied the phase command"""
+        return self._confirm(p)
+
+    def finished(self, p):
+        """the phase is completed, once it has started"""
+        if self.name in ('Ramp', 'Cool'):
+            return p.phase != self.name \
+                and abs(p.gas_set_point - self.sent_target) < 0.005
+        if self.name == 'End':
+            return p.alarm == 'AlarmConditionEnd'
+        if self.name == 'Purge':
+            return p.alarm == 'AlarmConditionPurge'
+        return p.phase != self.name
+
+    def estimate(self, start_temp):
+        """estimated duration in seconds from the start_temp set point,
+        and the set point at the end of the phase"""
+        if self.name == 'Plat':
+            return self.duration * 60., start_temp
+        target = ROOM_TEMP if self.target is None else self.target
+        rate = self.rate or COOL_RATE
+        return abs(target - start_temp) / rate * 3600., target
+
+
+class ProgramExecutor:
+    """Runs a temperature program: sends its phases one after the other,
+    as soon as the status packets show that the current one is completed.
+
+    send(packet, confirm) writes a command packet and returns its
+    CommandRequest (see writer.CommandWriter). update(packet) must be
+    called with every new status packet.
+    """
+    IDLE = 'Idle'
+    RUNNING = 'Running'
+    DONE = 'Done'
+    ABORTED = 'Aborted'
+    FAILED = 'Failed'
+
+    def __init__(self, phases, send):
+        if not phases:
+            raise ValueError('Empty temperature program')
+        self.phases = list(phases)
+        self.send = send
+        self.state = self.IDLE
+        self.message = ''
+        self.index = -1
+        self.request = None
+        self.phase_started = False
+        self.start_time = None
+        self.end_time = None
+        self.last_packet = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.state == self.RUNNING
+
+    def start(self, packet=None):
+        with self._lock:
+            if self.running:
+                raise RuntimeError('The program is already running')
+            self.last_packet = packet
+            self.start_time = time.monotonic()
+            self.end_time = None
+            self.index = -1
+            self.state = self.RUNNING
+            self.message = ''
+            self._next()
+
+    def abort(self, message='Aborted'):
+        """stops the program and holds the current temperature"""
+        with self._lock:
+            if not self.running:
+                return
+            self._finish(self.ABORTED, message)
+        self.send(command_packet(CSCOMMAND.HOLD),
+                  command_confirmation(CSCOMMAND.HOLD))
+
+    def update(self, packet):
+        with self._lock:
+            self.last_packet = packet
+            if not self.running:
+                return
+            phase = self.phases[self.index]
+            if packet.alarm_code >= FIRST_FAULT_ALARM:
+                self._finish(self.FAILED, 'Controller alarm: {}'.format(
+                    packet.alarm))
+                return
+            if packet.run_mode != 'Run' and phase.name not in ('End',
+                                                               'Purge'):
+                self._finish(self.FAILED, 'Controller run mode: {}'.format(
+                    packet.run_mode))
+                return
+            if not self.phase_started:
+                state = self.request.state
+                if state == self.request.CONFIRMED:
+                    self.phase_started = True
+                elif self.request.done and state != self.request.SENT:
+                    self._finish(self.FAILED, '{} command {}'.format(
+                        phase.name, state))
+                    return
+                else:
+                    return
+            if phase.finished(packet):
+                self._next()
+
+    def _next(self):
+        self.index += 1
+        if self.index == len(self.phases):
+            self._finish(self.DONE, '')
+            return
+        phase = self.phases[self.index]
+        self.phase_started = False
+        self.phase_start_time = time.monotonic()
+        try:
+            self.request = self.send(phase.packet(), phase.started)
+        except Exception as e:
+            self._finish(self.FAILED, 'Could not send {}: {}'.format(
+                phase, e))
+
+    def _finish(self, state, message):
+        self.state = state
+        self.message = message
+        self.end_time = time.monotonic()
+
+    @property
+    def eta(self):
+        """estimated time in seconds to the end of the program"""
+        if not self.running:
+            return 0.
+        packet = self.last_packet
+        set_point = ROOM_TEMP if packet is None else packet.gas_set_point
+        phase = self.phases[self.index]
+        elapsed = time.monotonic() - self.phase_start_time
+        if packet is not None and self.phase_started \
+                and packet.phase == phase.name:
+            current = packet.remaining * 60.
+            _, set_point = phase.estimate(set_point)
+        else:
+            current, set_point = phase.estimate(set_point)
+            current = max(0., current - elapsed)
+        total = current
+        for phase in self.phases[self.index + 1:]:
+            duration, set_point = phase.estimate(set_point)
+            total += duration
+        return total
+
+    @property
+    def progress(self):
+        """percentage of the estimated program time elapsed"""
+        if self.state == self.DONE:
+            return 100.
+        if self.start_time is None:
+            return 0.
+        end = self.end_time if self.end_time is not None \
+            else time.monotonic()
+        elapsed = end - self.start_time
+        total = elapsed + self.eta
+        return 100. * elapsed / total if total > 0 else 0.
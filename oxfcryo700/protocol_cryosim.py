@@ -0,0 +1,130 @@
+"""
+pyserial URL handler of an in-process Cryostream simulator:
+
+    cryosim://[?rate=<packets/s>][&time_scale=<x>][&extended=1]
+              [&controller_nb=<n>][&garbage=<p>][&truncate=<p>][&alarm=<p>]
+
+It is found by serial.serial_for_url once 'oxfcryo700' is in
+serial.protocol_handler_packages (done by the Tango device server).
+"""
+
+import select
+import socket
+import time
+import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, \
+    PortNotOpenError, to_bytes
+
+from .simulator import CryostreamModel, CryostreamSimulator
+
+
+class Serial(SerialBase):
+    """Serial port connected to a simulator running in a thread"""
+
+    def __init__(self, *args, **kwargs):
+        self.simulator = None
+        self._socket = None
+        self._remote = None
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can "
+                                  "be used.")
+        self.simulator = self.from_url(self.port)
+        self._socket, remote = socket.socketpair()
+        self._remote = remote
+        self.simulator.start(remote.fileno())
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.simulator.stop()
+            self._socket.close()
+            self._remote.close()
+        super(Serial, self).close()
+
+    def _reconfigure_port(self):
+        pass
+
+    def from_url(self, url):
+        """returns the simulator configured by the URL options"""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != 'cryosim':
+            raise SerialException(
+                'expected a string in the form "cryosim://[?options]": not '
+                'starting with cryosim:// ({!r})'.format(parts.scheme))
+        kwargs = {}
+        model = CryostreamModel()
+        try:
+            for option, values in urlparse.parse_qs(parts.query,
+                                                    True).items():
+                if option in ('rate', 'time_scale', 'garbage', 'truncate',
+                              'alarm'):
+                    kwargs[option] = float(values[0])
+                elif option == 'extended':
+                    model.extended = bool(int(values[0]))
+                elif option == 'controller_nb':
+                    model.controller_nb = int(values[0])
+                else:
+                    raise ValueError('unknown option: {!r}'.format(option))
+        except ValueError as e:
+            raise SerialException(
+                'expected a string in the form "cryosim://[?options]": '
+                '{}'.format(e))
+        return CryostreamSimulator(model=model, **kwargs)
+
+    def fileno(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self._socket.fileno()
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        try:
+            flags = socket.MSG_PEEK | socket.MSG_DONTWAIT
+            return len(self._socket.recv(65536, flags))
+        except BlockingIOError:
+            return 0
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = bytearray()
+        deadline = None
+        if self._timeout is not None:
+            deadline = time.monotonic() + self._timeout
+        while len(data) < size:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0., deadline - time.monotonic())
+            readable, _, _ = select.select([self._socket], [], [], timeout)
+            if not readable:
+                break
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise SerialException('simulator stopped')
+            data.extend(chunk)
+        return bytes(data)
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = to_bytes(data)
+        self._socket.sendall(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        while self.in_waiting:
+            self._socket.recv(65536)
+
+    def reset_output_buffer(self):
+        pass
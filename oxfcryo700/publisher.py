@@ -0,0 +1,134 @@
+"""
+Fan-out of the raw status packets to local subscribers.
+
+The device server (PublisherAddress property) sends every packet it reads
+to any number of clients connected to a Unix or TCP socket, so other tools
+get the status stream without opening the serial port. Each record is the
+wall-clock timestamp (little-endian double) followed by the raw packet,
+whose first byte is its length. Subscribers which do not read fast enough
+are disconnected instead of blocking the reader.
+
+    for packet in subscribe('/run/oxfcryo700.sock'):
+        print(packet.timestamp, packet.gas_temp)
+"""
+
+import os
+import socket
+import stat
+import struct
+import threading
+
+from .oxfordcryo import StatusPacket
+
+TIMESTAMP = struct.Struct('<d')
+
+
+def parse_address(address):
+    """socket family and address from a Unix socket path (or unix:<path>)
+    or a TCP [host:]port"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if address.startswith('/'):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or 'localhost', int(port))
+
+
+class PacketPublisher:
+    """Sends the raw status packets to the connected subscribers.
+
+    publish() never blocks: the kernel socket buffer of each subscriber is
+    its queue, a subscriber whose buffer is full is dropped.
+    """
+
+    def __init__(self, address):
+        self.family, self.address = parse_address(address)
+        self.subscribers = []
+        self.published = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        if self.family == socket.AF_UNIX and os.path.lexists(self.address):
+            # only a stale socket of a previous server is replaced
+            if not stat.S_ISSOCK(os.lstat(self.address).st_mode):
+                raise ValueError('{} exists and is not a socket'.format(
+                    self.address))
+            os.unlink(self.address)
+        self._server = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,
+                                    1)
+        self._server.bind(self.address)
+        self._server.listen(16)
+        if self.family == socket.AF_INET:
+            self.address = self._server.getsockname()
+        self._closed = False
+        self._thread = threading.Thread(target=self._accept, daemon=True,
+                                        name='PacketPublisher')
+        self._thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.setblocking(False)
+            with self._lock:
+                self.subscribers.append(client)
+
+    def publish(self, raw, timestamp):
+        if not self.subscribers:
+            return
+        record = TIMESTAMP.pack(timestamp) + raw
+        dropped = []
+        with self._lock:
+            for client in self.subscribers:
+                try:
+                    sent = client.send(record)
+                except OSError:
+                    sent = 0
+                if sent != len(record):
+                    dropped.append(client)
+            for client in dropped:
+                self.subscribers.remove(client)
+                client.close()
+            self.dropped += len(dropped)
+        self.published += 1
+
+    def close(self):
+        self._closed = True
+        # shutdown wakes up the blocking accept
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        with self._lock:
+            for client in self.subscribers:
+                client.close()
+            self.subscribers = []
+        if self.family == socket.AF_UNIX:
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+
+
+def subscribe(address, timeout=None):
+    """connects to a PacketPublisher and yields the StatusPacket received,
+    with their timestamp, until the publisher closes the connection"""
+    family, address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        stream = sock.makefile('rb')
+        while True:
+            header = stream.read(TIMESTAMP.size + 1)
+            if len(header) < TIMESTAMP.size + 1:
+                return
+            length = header[TIMESTAMP.size]
+            rest = stream.read(length - 1)
+            if len(rest) < length - 1:
+                return
+            timestamp, = TIMESTAMP.unpack_from(header)
+            yield StatusPacket(header[TIMESTAMP.size:] + rest, timestamp)
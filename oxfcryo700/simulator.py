@@ -0,0 +1,404 @@
+"""
+Simulator of a Cryostream 700 series controller.
+
+It speaks the serial protocol: it emits status packets at a configurable
+rate and executes the command packets it receives, modelling the phases
+(Ramp, Cool, Plat, Hold, End, Purge) with a first order response of the
+gas temperature to the set point. Faults can be injected: garbage bytes,
+truncated packets and alarms.
+
+It can be served on a pseudo terminal or on a TCP port (to be opened with
+socket://host:port) with the OxfCryo700Simulator script, or opened
+in-process with serial.serial_for_url('cryosim://') (see protocol_cryosim).
+"""
+
+import argparse
+import math
+import os
+import random
+import select
+import socket
+import threading
+import time
+
+from .oxfordcryo import StatusPacket, STANDARD_FORMAT, EXTENDED_FORMAT, \
+    CSCOMMAND
+
+RUN = StatusPacket.RUNMODE_CODES.index('Run')
+SHUTDOWN_OK = StatusPacket.RUNMODE_CODES.index('ShutdownOK')
+RAMP = StatusPacket.PHASE_CODES.index('Ramp')
+COOL = StatusPacket.PHASE_CODES.index('Cool')
+PLAT = StatusPacket.PHASE_CODES.index('Plat')
+HOLD = StatusPacket.PHASE_CODES.index('Hold')
+END = StatusPacket.PHASE_CODES.index('End')
+PURGE = StatusPacket.PHASE_CODES.index('Purge')
+ALARM_NONE = 0
+ALARM_STOP_COMMAND = 2
+ALARM_END = 3
+ALARM_PURGE = 4
+# warnings raised at random by the fault injection
+RANDOM_ALARMS = (5, 6, 7, 9)
+
+
+class CryostreamModel:
+    """State and dynamics of a simulated controller.
+
+    Temperatures are in K, rates in K/h and times in seconds (the status
+    packets report the remaining time in minutes).
+    """
+    ROOM_TEMP = 294.
+    COOL_RATE = 360.
+    PURGE_RATE = 360.
+    # gas temperature response time to the set point
+    TIME_CONSTANT = 5.
+    NOISE = 0.01
+
+    def __init__(self, controller_nb=1, software_version=1):
+        self.controller_nb = controller_nb
+        self.software_version = software_version
+        self.extended = False
+        self.run_mode = RUN
+        self.phase = HOLD
+        self.set_point = self.ROOM_TEMP
+        self.gas_temp = self.ROOM_TEMP
+        self.target = self.ROOM_TEMP
+        self.rate = 0.
+        self.plat_time = 0.
+        self.alarm = ALARM_NONE
+        self.alarm_time = 0.
+        self.turbo = False
+        self.shutter = 0
+        self.run_seconds = 0.
+        self.paused = None
+
+    # ------------------------------------------------------------------
+    # Commands
+    # ------------------------------------------------------------------
+
+    def command(self, data):
+        """executes a command packet (size, command id, parameters...)"""
+        cmd = data[1]
+        params = data[2:]
+        if cmd == CSCOMMAND.RESTART:
+            self.run_mode = RUN
+            self.alarm = ALARM_NONE
+            self._set_phase(HOLD, self.set_point)
+        elif cmd == CSCOMMAND.STOP:
+            self._shutdown(ALARM_STOP_COMMAND)
+        elif self.run_mode != RUN:
+            # phase commands are ignored until restarted
+            return
+        elif cmd == CSCOMMAND.RAMP:
+            self._set_phase(RAMP, self._short(params, 1) / 100.,
+                            self._short(params, 0))
+        elif cmd == CSCOMMAND.COOL:
+            self._set_phase(COOL, self._short(params, 0) / 100.,
+                            self.COOL_RATE)
+        elif cmd == CSCOMMAND.PLAT:
+            self._set_phase(PLAT, self.set_point)
+            self.plat_time = self._short(params, 0) * 60.
+        elif cmd == CSCOMMAND.HOLD:
+            self._set_phase(HOLD, self.set_point)
+        elif cmd == CSCOMMAND.END:
+            self._set_phase(END, self.ROOM_TEMP, self._short(params, 0))
+        elif cmd == CSCOMMAND.PURGE:
+            self._set_phase(PURGE, self.ROOM_TEMP, self.PURGE_RATE)
+        elif cmd == CSCOMMAND.PAUSE:
+            if self.paused is None:
+                self.paused = (self.phase, self.target, self.rate)
+                self._set_phase(HOLD, self.set_point)
+        elif cmd == CSCOMMAND.RESUME:
+            if self.paused is not None:
+                self._set_phase(*self.paused)
+                self.paused = None
+        elif cmd == CSCOMMAND.TURBO:
+            self.turbo = bool(params[0])
+        elif cmd == CSCOMMAND.SETSTATUSFORMAT:
+            self.extended = bool(params[0])
+        elif cmd == CSCOMMAND.CRYOSHUTTER_START_MAN:
+            self.shutter = 1
+        elif cmd == CSCOMMAND.CRYOSHUTTER_STOP:
+            self.shutter = 0
+
+    @staticmethod
+    def _short(params, i):
+        return (params[2 * i] << 8) + params[2 * i + 1]
+
+    def _set_phase(self, phase, target, rate=0.):
+        self.phase = phase
+        self.target = target
+        self.rate = rate
+
+    def _shutdown(self, alarm):
+        self.run_mode = SHUTDOWN_OK
+        self.alarm = alarm
+        self.phase = HOLD
+        self.rate = 0.
+
+    def raise_alarm(self, code, duration=5.):
+        """raises an alarm for duration seconds"""
+        self.alarm = code
+        self.alarm_time = duration
+
+    # ------------------------------------------------------------------
+    # Dynamics
+    # ------------------------------------------------------------------
+
+    def step(self, dt):
+        """advances the model dt seconds"""
+        if self.alarm_time > 0:
+            self.alarm_time -= dt
+            if self.alarm_time <= 0:
+                self.alarm = ALARM_NONE
+        if self.run_mode != RUN:
+            self._relax(self.ROOM_TEMP, dt)
+            return
+        self.run_seconds += dt
+        if self.phase in (RAMP, COOL, END, PURGE):
+            delta = self.target - self.set_point
+            step = self.rate * dt / 3600.
+            if abs(delta) <= step:
+                self.set_point = self.target
+                if self.phase == END:
+                    self._shutdown(ALARM_END)
+                elif self.phase == PURGE:
+                    self._shutdown(ALARM_PURGE)
+                else:
+                    self.phase = HOLD
+            else:
+                self.set_point += math.copysign(step, delta)
+        elif self.phase == PLAT:
+            self.plat_time -= dt
+            if self.plat_time <= 0:
+                self.plat_time = 0.
+                self.phase = HOLD
+        self._relax(self.set_point, dt)
+
+    def _relax(self, temp, dt):
+        factor = 1. - math.exp(-dt / self.TIME_CONSTANT)
+        self.gas_temp += (temp - self.gas_temp) * factor
+        self.gas_temp += random.gauss(0., self.NOISE)
+
+    @property
+    def remaining(self):
+        """time remaining in the phase, in minutes"""
+        if self.phase == PLAT:
+            return int(self.plat_time // 60)
+        if self.phase in (RAMP, COOL, END, PURGE) and self.rate > 0:
+            return int(abs(self.target - self.set_point) / self.rate * 60)
+        return 0
+
+    def values(self):
+        """returns the status packet fields"""
+        running = self.run_mode == RUN
+        flow = (10. if self.turbo else 5.) if running else 0.
+        error = self.gas_temp - self.set_point
+        heat = min(100, max(0, int(50 - 10 * error))) if running else 0
+        return dict(
+            gas_set_point=self.set_point,
+            gas_temp=min(max(self.gas_temp, 0.), 655.),
+            gas_error=max(min(error, 327.), -327.),
+            run_mode_code=self.run_mode,
+            phase_code=self.phase,
+            ramp_rate=int(self.rate),
+            target_temp=self.target,
+            evap_temp=75. if running else self.ROOM_TEMP,
+            suct_temp=self.gas_temp + 10.,
+            remaining=self.remaining,
+            gas_flow=flow,
+            gas_heat=heat,
+            evap_heat=10 if running else 0,
+            suct_heat=20 if running else 0,
+            line_pressure=10 if running else 0,
+            alarm_code=self.alarm,
+            run_time=int(self.run_seconds // 60) & 0xffff,
+            controller_nb=self.controller_nb,
+            software_version=self.software_version,
+            evap_adjust=0,
+            turbo_mode=int(self.turbo),
+            hardware_type=0,
+            shutter_state=self.shutter,
+            shutter_time=0,
+            avg_gas_heat=heat,
+            avg_suct_heat=20 if running else 0,
+            time_to_fill=0,
+            total_hours=int(self.run_seconds // 3600) & 0xffff)
+
+    def packet(self):
+        """returns the raw status packet of the current state"""
+        fmt = EXTENDED_FORMAT if self.extended else STANDARD_FORMAT
+        return fmt.pack(self.values())
+
+
+class CryostreamSimulator:
+    """Serves a CryostreamModel on a file descriptor.
+
+    rate: status packets per second
+    time_scale: simulated seconds per real second
+    garbage, truncate, alarm: probability, per packet, of sending random
+    bytes before it, of sending only part of it, and of raising a random
+    warning alarm
+    """
+
+    def __init__(self, rate=1., time_scale=1., garbage=0., truncate=0.,
+                 alarm=0., model=None):
+        self.rate = rate
+        self.time_scale = time_scale
+        self.garbage = garbage
+        self.truncate = truncate
+        self.alarm = alarm
+        self.model = model or CryostreamModel()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.commands = bytearray()
+        self.packets_sent = 0
+        self.commands_received = 0
+
+    def feed(self, data):
+        """processes the bytes received, executing the complete
+        commands"""
+        buff = self.commands
+        buff.extend(data)
+        while buff:
+            size = buff[0]
+            if not 2 <= size <= 16:
+                del buff[0]
+                continue
+            if len(buff) < size:
+                break
+            with self.lock:
+                self.model.command(bytes(buff[:size]))
+            self.commands_received += 1
+            del buff[:size]
+
+    def next_output(self, dt):
+        """advances the model and returns the bytes to send"""
+        with self.lock:
+            self.model.step(dt * self.time_scale)
+            if self.alarm and random.random() < self.alarm:
+                self.model.raise_alarm(random.choice(RANDOM_ALARMS))
+            packet = self.model.packet()
+        if self.garbage and random.random() < self.garbage:
+            garbage = bytes(random.randrange(256)
+                            for _ in range(random.randint(1, 16)))
+            packet = garbage + packet
+        if self.truncate and random.random() < self.truncate:
+            packet = packet[:random.randrange(1, len(packet))]
+        self.packets_sent += 1
+        return packet
+
+    def serve(self, fd):
+        """emits the status packets on the file descriptor and executes
+        the commands read from it, until stop() or the peer closes it"""
+        period = 1. / self.rate
+        last = time.monotonic()
+        deadline = last
+        while not self.stop_event.is_set():
+            timeout = max(0., deadline - time.monotonic())
+            readable, _, _ = select.select([fd], [], [], min(timeout, 0.1))
+            if readable:
+                try:
+                    data = os.read(fd, 1024)
+                except OSError:
+                    break
+                if not data:
+                    break
+                self.feed(data)
+            now = time.monotonic()
+            if now < deadline:
+                continue
+            output = self.next_output(now - last)
+            last = now
+            deadline = max(deadline + period, now - period)
+            try:
+                os.write(fd, output)
+            except OSError:
+                break
+
+    def stop(self):
+        self.stop_event.set()
+
+    def start(self, fd):
+        """serves the file descriptor in a daemon thread"""
+        thread = threading.Thread(target=self.serve, args=(fd,),
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def serve_pty(self):
+        """serves on a new pseudo terminal in a daemon thread and returns
+        the name of the port to open"""
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.start(master)
+        return os.ttyname(slave)
+
+    def serve_tcp(self, host='localhost', port=0):
+        """accepts connections on a TCP port, one client at a time,
+        in a daemon thread. Returns the bound address"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        server.settimeout(0.5)
+
+        def accept_loop():
+            while not self.stop_event.is_set():
+                try:
+                    client, _ = server.accept()
+                except socket.timeout:
+                    continue
+                with client:
+                    client.setblocking(True)
+                    self.serve(client.fileno())
+            server.close()
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+        return server.getsockname()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cryostream 700 series controller simulator')
+    parser.add_argument('--tcp', metavar='[HOST:]PORT',
+                        help='serve on a TCP port instead of a pseudo '
+                             'terminal')
+    parser.add_argument('--rate', type=float, default=1.,
+                        help='status packets per second (default 1)')
+    parser.add_argument('--time-scale', type=float, default=1.,
+                        help='simulated seconds per second (default 1)')
+    parser.add_argument('--extended', action='store_true',
+                        help='start with the extended status format')
+    parser.add_argument('--controller-nb', type=int, default=1)
+    parser.add_argument('--garbage', type=float, default=0.,
+                        help='probability of garbage bytes per packet')
+    parser.add_argument('--truncate', type=float, default=0.,
+                        help='probability of truncated packets')
+    parser.add_argument('--alarm', type=float, default=0.,
+                        help='probability of random alarm per packet')
+    args = parser.parse_args()
+
+    model = CryostreamModel(controller_nb=args.controller_nb)
+    model.extended = args.extended
+    simulator = CryostreamSimulator(rate=args.rate,
+                                    time_scale=args.time_scale,
+                                    garbage=args.garbage,
+                                    truncate=args.truncate,
+                                    alarm=args.alarm, model=model)
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(':')
+        host, port = simulator.serve_tcp(host or 'localhost', int(port))
+        print('Serving on socket://{}:{}'.format(host, port), flush=True)
+    else:
+        print('Serving on {}'.format(simulator.serve_pty()), flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import collections
+import math
+import threading
+
+# Status packet fields with windowed statistics
+STATISTICS_FIELDS = ('gas_temp', 'gas_error', 'gas_flow')
+
+# Columns of the statistics of a window, the slope is per hour like the
+# ramp rates
+STATISTICS_NAMES = ('mean', 'std', 'min', 'max', 'slope')
+
+NAN = float('nan')
+
+
+class RunningStatistics:
+    """Mean, standard deviation, minimum, maximum and slope of a value over
+    a sliding time window, updated in O(1) (amortized) per sample.
+
+    The mean, variance and time/value co-moment are updated with Welford's
+    formulas when a sample enters or leaves the window, and recomputed
+    from the window from time to time to bound the rounding drift. The
+    minimum and maximum are the heads of monotonic deques.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = collections.deque()
+        self._min = collections.deque()
+        self._max = collections.deque()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self._mean_t = 0.
+        self._mean_y = 0.
+        self._m2_t = 0.
+        self._m2_y = 0.
+        self._c_ty = 0.
+        self._removed = 0
+
+    def _add(self, t, y):
+        self.count += 1
+        dt = t - self._mean_t
+        dy = y - self._mean_y
+        self._mean_t += dt / self.count
+        self._mean_y += dy / self.count
+        self._m2_t += dt * (t - self._mean_t)
+        self._m2_y += dy * (y - self._mean_y)
+        self._c_ty += dt * (y - self._mean_y)
+
+    def _remove(self, t, y):
+        self.count -= 1
+        if not self.count:
+            self._reset()
+            return
+        dt = t - self._mean_t
+        dy = y - self._mean_y
+        self._mean_t -= dt / self.count
+        self._mean_y -= dy / self.count
+        self._m2_t -= dt * (t - self._mean_t)
+        self._m2_y -= dy * (y - self._mean_y)
+        self._c_ty -= dt * (y - self._mean_y)
+        self._removed += 1
+
+    def add(self, t, y):
+        samples = self._samples
+        sample = t, y
+        samples.append(sample)
+        self._add(t, y)
+        while self._min and self._min[-1][1] >= y:
+            self._min.pop()
+        self._min.append(sample)
+        while self._max and self._max[-1][1] <= y:
+            self._max.pop()
+        self._max.append(sample)
+        start = t - self.window
+        while samples[0][0] < start:
+            old = samples.popleft()
+            self._remove(*old)
+            if self._min[0] is old:
+                self._min.popleft()
+            if self._max[0] is old:
+                self._max.popleft()
+        if self._removed > max(1000, len(samples)):
+            self._reset()
+            for sample in samples:
+                self._add(*sample)
+
+    def clear(self):
+        self._samples.clear()
+        self._min.clear()
+        self._max.clear()
+        self._reset()
+
+    def values(self):
+        """(mean, std, min, max, slope per hour), NaN without samples"""
+        if not self.count:
+            return (NAN,) * len(STATISTICS_NAMES)
+        std = 0.
+        slope = NAN
+        if self.count > 1:
+            std = math.sqrt(max(0., self._m2_y / (self.count - 1)))
+            if self._m2_t > 0:
+                slope = 3600. * self._c_ty / self._m2_t
+        return (self._mean_y, std, self._min[0][1], self._max[0][1], slope)
+
+
+class StatusStatistics:
+    """RunningStatistics of some status packet fields over several time
+    windows (in seconds)"""
+
+    def __init__(self, windows, fields=STATISTICS_FIELDS):
+        if not windows or min(windows) <= 0:
+            raise ValueError('The statistics windows must be positive')
+        self.windows = tuple(windows)
+        self.fields = tuple(fields)
+        self._statistics = {
+            name: [RunningStatistics(window) for window in self.windows]
+            for name in self.fields}
+        self._lock = threading.Lock()
+
+    def append(self, packet, timestamp):
+        with self._lock:
+            for name, statistics in self._statistics.items():
+                value = getattr(packet, name)
+                for window in statistics:
+                    window.add(timestamp, value)
+
+    def clear(self):
+        with self._lock:
+            for statistics in self._statistics.values():
+                for window in statistics:
+                    window.clear()
+
+    def get(self, name):
+        """one row of STATISTICS_NAMES values per window"""
+        with self._lock:
+            return [window.values() for window in self._statistics[name]]
@@ -1,54 +1,445 @@
 import threading
+import time
 import serial
-from tango import DevState
+from tango import DevState, AttrQuality, EnsureOmniThread, SerialModel, \
+    Util
 from tango.server import Device, attribute, command
 from tango.server import device_property
-from .oxfordcryo import StatusPacket, CSCOMMAND, splitBytes
+from .oxfordcryo import StatusPacketDecoder, PacketCapture, CSCOMMAND, \
+    SharedPacketWriter, EXTENDED_FORMAT, FIRST_FAULT_ALARM, command_packet, \
+    command_confirmation, turbo_state
+from .history import StatusHistory, HISTORY_FIELDS
+from .writer import CommandWriter
+from .multiplexer import SerialMultiplexer, port_waiting
+from .metrics import ReaderMetrics, MetricsServer, JITTER_BINS
+from .program import ProgramPhase, ProgramExecutor
+from .publisher import PacketPublisher
+from .trend import TrendStore
+from .journal import TransitionJournal, TRANSITION_FIELDS, \
+    transition_values, transition_text
+from .statistics import StatusStatistics, RunningStatistics, \
+    STATISTICS_NAMES
+from .monitor import command_values
+
+# allow to open the in-process simulator: port = cryosim://
+if 'oxfcryo700' not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append('oxfcryo700')
+
+# maximum number of samples of the history spectrum attributes
+HISTORY_MAX_SIZE = 86400
+
+# maximum number of windows of the statistics attributes
+STATISTICS_MAX_WINDOWS = 16
+
+# attributes pushing change and archive events, and their status packet
+# field
+EVENT_ATTRIBUTES = {'GasSetPoint': 'gas_set_point',
+                    'GasTemp': 'gas_temp',
+                    'GasError': 'gas_error',
+                    'RunMode': 'run_mode',
+                    'Phase': 'phase',
+                    'RampRate': 'ramp_rate',
+                    'TargetTemp': 'target_temp',
+                    'EvapTemp': 'evap_temp',
+                    'SuctTemp': 'suct_temp',
+                    'GasFlow': 'gas_flow',
+                    'GasHeat': 'gas_heat',
+                    'EvapHeat': 'evap_heat',
+                    'SuctHeat': 'suct_heat',
+                    'LinePressure': 'line_pressure',
+                    'Alarm': 'alarm',
+                    'ControllerNr': 'controller_nb',
+                    'SoftwareVersion': 'software_version',
+                    'EvapAdjust': 'evap_adjust'}
+
+# fields of the StatusSnapshot attribute
+SNAPSHOT_FIELDS = ('timestamp',) + EXTENDED_FORMAT.names[2:]
+NAN = float('nan')
+
+# run modes setting the FAULT state
+FAILED_RUN_MODES = ('StartUpFail', 'ShutdownFail')
+
+# commands of SendAndConfirm, with the arguments of the monitor commands
+SEND_COMMANDS = ('Restart', 'Purge', 'Stop', 'Pause', 'Resume', 'Cool',
+                 'Ramp', 'Plat', 'End', 'Turbo')
+
+# interval in seconds of the state supervision when no data is received
+SUPERVISION_PERIOD = 0.5
+
+
+def check_cool(temp):
+    if not (80 <= temp <= 400):
+        raise ValueError("Wrong arguments. Cool only accept values "
+                         "between 80 to 400")
 
 
 class OxfCryo700(Device):
     port = device_property(dtype=str, doc='Serial port name (/dev/ttyXX)')
+    HistorySize = device_property(
+        dtype=int, default_value=3600,
+        doc='Number of status packets kept in the history (max {})'.format(
+            HISTORY_MAX_SIZE))
+    EventDeadbands = device_property(
+        dtype=(str,),
+        default_value=['GasSetPoint 0.01', 'GasTemp 0.05', 'GasError 0.05',
+                       'TargetTemp 0.01', 'EvapTemp 0.1', 'SuctTemp 0.1',
+                       'GasFlow 0.1'],
+        doc='Change/archive event deadbands, one line per attribute: '
+            '"<attribute> <absolute> [<relative %>]". Events are pushed '
+            'when the value changes more than any of them, a deadband of '
+            '0 is disabled (e.g. "GasTemp 0 1" for 1 %). Attributes not '
+            'listed push an event on every change')
+    CaptureFile = device_property(
+        dtype=str, default_value='',
+        doc='File where every raw status packet is recorded with its '
+            'timestamps (see oxfordcryo.PacketCapture). Empty to disable')
+    SharedReader = device_property(
+        dtype=bool, default_value=True,
+        doc='Read and decode the port from the reader thread shared by '
+            'all the devices of the server, the packets being processed '
+            'by a worker thread per device, instead of a reader thread '
+            'per device (not possible for ports without file descriptor)')
+    TrendDirectory = device_property(
+        dtype=str, default_value='',
+        doc='Directory of the fixed-size trend files (raw samples, 1 min '
+            'and 1 h aggregates, see the GetTrend command). Empty to '
+            'disable')
+    PublisherAddress = device_property(
+        dtype=str, default_value='',
+        doc='Unix socket path or TCP [host:]port where every raw status '
+            'packet is sent to the local subscribers (see '
+            'publisher.subscribe). Empty to disable')
+    JournalSize = device_property(
+        dtype=int, default_value=1000,
+        doc='Number of run mode, phase, alarm and turbo mode transitions '
+            'kept in the journal (see the GetTransitions command)')
+    JournalFile = device_property(
+        dtype=str, default_value='',
+        doc='File where the transitions are recorded, reloaded at start. '
+            'Empty to keep them only in memory')
+    SharedMemoryName = device_property(
+        dtype=str, default_value='',
+        doc='Name of the shared memory segment where every raw status '
+            'packet is published for the local processes (see '
+            'oxfordcryo.SharedPacketReader, Python >= 3.8). Empty to '
+            'disable')
+    StatisticsWindows = device_property(
+        dtype=(float,), default_value=[10., 60., 600.],
+        doc='Time windows in seconds of the statistics attributes '
+            '(GasTempStatistics...), max {}'.format(STATISTICS_MAX_WINDOWS))
+    StaleTimeout = device_property(
+        dtype=float, default_value=5.,
+        doc='Time in seconds without status packets after which the data '
+            'is stale: FAULT state, invalid attributes and events and '
+            'reconnection')
+    ReconnectDelay = device_property(
+        dtype=float, default_value=1.,
+        doc='Delay in seconds before reopening the port after an error '
+            'or stale data, doubled on every failed attempt')
+    ReconnectMaxDelay = device_property(
+        dtype=float, default_value=60.,
+        doc='Maximum delay in seconds between two attempts to reopen the '
+            'port')
+    MetricsPort = device_property(
+        dtype=int, default_value=0,
+        doc='Local TCP port of the HTTP endpoint exposing the reader '
+            'metrics in the Prometheus text format, shared by the devices '
+            'of the server with the same port. 0 to disable')
+    MetricsHost = device_property(
+        dtype=str, default_value='localhost',
+        doc='Address the metrics endpoint is bound to: localhost by '
+            'default, empty for all the interfaces')
 
     def init_device(self):
         Device.init_device(self)
         self.info_stream('In Python init_device method')
-        self.serial = serial.serial_for_url(self.port)
-        self.status_packet = None
-        self.status_thread = threading.Thread(group=None,
-                                              target=self.update_status_packet)
-        self.status_thread_stop = threading.Event()
-        self.status_thread.start()
-        self.set_state(DevState.ON)
+        self._open()
 
     def delete_device(self):
-        self.status_thread_stop.set()
-        self.status_thread.join(3.0)
+        self._close()
         self.info_stream('OxfCryo700.delete_device')
 
-    def _write(self, data):
-        data_bytes = bytes(data)
-        self.serial.write(data_bytes)
+    def _open(self):
+        # the requests are not serialized by the device monitor (see
+        # main): the status packet and the state, the program, the read
+        # requests, the last command and the reconnection timer are shared
+        # with the reader under this lock
+        self.state_lock = threading.RLock()
+        self.serial = None
+        self.status_packet = None
+        # status packet and quality of the read request of each thread, by
+        # thread id (threading.local does not persist in the ORB threads
+        # between two calls)
+        self._requests = {}
+        self.decoder = StatusPacketDecoder()
+        self.metrics = ReaderMetrics()
+        self.writer = CommandWriter(None)
+        self.last_command = None
+        self.packet_condition = threading.Condition()
+        self.program = None
+        self.history = StatusHistory(min(self.HistorySize, HISTORY_MAX_SIZE))
+        self.statistics = StatusStatistics(
+            self.StatisticsWindows[:STATISTICS_MAX_WINDOWS])
+        self.deadbands = self._parse_deadbands(self.EventDeadbands)
+        self.event_values = {}
+        for name in EVENT_ATTRIBUTES:
+            self.set_change_event(name, True, False)
+            self.set_archive_event(name, True, False)
+        self.capture = None
+        if self.CaptureFile:
+            self.capture = PacketCapture(self.CaptureFile, 'a')
+        self.shared_packet = None
+        if self.SharedMemoryName:
+            self.shared_packet = SharedPacketWriter(self.SharedMemoryName)
+        self.journal = TransitionJournal(self.JournalSize,
+                                         self.JournalFile or None)
+        self.transitions_pushed = self.journal.count
+        self.set_data_ready_event('LastTransition', True)
+        self.trends = None
+        if self.TrendDirectory:
+            self.trends = TrendStore(self.TrendDirectory)
+        self.publisher = None
+        if self.PublisherAddress:
+            self.publisher = PacketPublisher(self.PublisherAddress)
+        if self.MetricsPort:
+            MetricsServer.register(self.MetricsPort, self.get_name(),
+                                   self.metrics, self.MetricsHost)
+        # supervision
+        self.closing = False
+        self.channel = None
+        self.status_thread = None
+        self.port_error = None
+        self.reconnect_timer = None
+        self.reconnect_delay = self.ReconnectDelay
+        self.quality = AttrQuality.ATTR_INVALID
+        self.state_key = None
+        self._connect()
+
+    def _close(self):
+        with self.state_lock:
+            self.closing = True
+            if self.program is not None:
+                self.program.abort('Device deleted')
+            if self.reconnect_timer is not None:
+                self.reconnect_timer.cancel()
+        self._stop_reader()
+        self.writer.stop(1.0)
+        if self.MetricsPort:
+            MetricsServer.unregister(self.MetricsPort, self.get_name(),
+                                     self.MetricsHost)
+        if self.capture is not None:
+            self.capture.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.trends is not None:
+            self.trends.close()
+        if self.shared_packet is not None:
+            self.shared_packet.close()
+        self.journal.close()
+        self._close_port()
+
+    def _close_port(self):
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except Exception:
+                pass
+
+    def _connect(self):
+        """opens the port and starts reading it, on failure a new attempt
+        is scheduled with exponential backoff"""
+        self.connect_time = time.monotonic()
+        try:
+            self.serial = serial.serial_for_url(self.port,
+                                                timeout=SUPERVISION_PERIOD)
+        except Exception as e:
+            self._port_failed(e)
+            return
+        self.writer.serial = self.serial
+        self.decoder.reset()
+        self.port_error = None
+        self._start_reader()
+        self._update_state()
+
+    def _reconnect(self):
+        if self.closing:
+            return
+        # the timer is cleared once the reader is stopped, so that it does
+        # not schedule another attempt meanwhile
+        self._stop_reader()
+        self._close_port()
+        with self.state_lock:
+            if self.closing:
+                return
+            self.reconnect_timer = None
+        self._connect()
+
+    def _port_failed(self, error):
+        """the port could not be opened or read: FAULT state and new
+        connection attempt after the current backoff delay"""
+        self.port_error = error
+        delay = self.reconnect_delay
+        self.reconnect_delay = min(2 * delay, self.ReconnectMaxDelay)
+        self.error_stream("Serial port {} error: {}. Reconnecting in "
+                          "{:g} s".format(self.port, error, delay))
+        self._update_state()
+        with self.state_lock:
+            if not self.closing:
+                self.reconnect_timer = self._call_later(delay,
+                                                        self._reconnect)
+
+    def _stale_reconnect(self, age):
+        """no status packet while the port is open: the port is reopened
+        after the current backoff delay"""
+        delay = self.reconnect_delay
+        self.reconnect_delay = min(2 * delay, self.ReconnectMaxDelay)
+        self.error_stream("No status packet received from {} for {} s. "
+                          "Reconnecting in {:g} s".format(self.port, age,
+                                                          delay))
+        with self.state_lock:
+            self.reconnect_timer = self._call_later(delay, self._reconnect)
+
+    def _call_later(self, delay, func):
+        """calls func after delay seconds, returns an object with a cancel
+        method"""
+        def run():
+            with EnsureOmniThread():
+                func()
+        timer = threading.Timer(delay, run)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _update_state(self):
+        """sets the state, the status and the attribute quality from the
+        port, the age of the last status packet and the controller run
+        mode and alarm. Called by the reader on every packet and
+        periodically"""
+        with self.state_lock:
+            self._update_state_locked()
+
+    def _update_state_locked(self):
+        packet = self.status_packet
+        # the age is updated when the data is read, before the packets
+        # decoded from it are processed
+        age = None if packet is None else self.metrics.age
+        stale = False
+        if self.port_error is not None:
+            key = DevState.FAULT, 'port', str(self.port_error)
+            stale = True
+        elif age is None or age > self.StaleTimeout:
+            stale = True
+            waited = time.monotonic() - self.connect_time
+            if waited < self.StaleTimeout:
+                key = DevState.INIT, 'waiting', None
+            elif age is None or self.metrics.last_arrival < \
+                    self.connect_time:
+                key = DevState.FAULT, 'nodata', int(waited)
+            else:
+                key = DevState.FAULT, 'stale', int(age)
+        elif packet.run_mode in FAILED_RUN_MODES:
+            key = DevState.FAULT, packet.run_mode, packet.alarm
+        elif packet.alarm_code >= FIRST_FAULT_ALARM:
+            key = DevState.ALARM, packet.run_mode, packet.alarm
+        else:
+            key = DevState.ON, packet.run_mode, packet.phase
+        quality = AttrQuality.ATTR_INVALID if stale \
+            else AttrQuality.ATTR_VALID
+        if quality != self.quality:
+            self.quality = quality
+            if stale:
+                self._push_invalid_events()
+        if key[1] in ('nodata', 'stale') and self.reconnect_timer is None \
+                and not self.closing:
+            self._stale_reconnect(key[2])
+        if key == self.state_key:
+            return
+        self.state_key = key
+        state, reason, detail = key
+        if reason == 'port':
+            status = 'Serial port {} error: {}. Reconnecting'.format(
+                self.port, detail)
+        elif reason == 'waiting':
+            status = 'Waiting for the first status packet'
+        elif reason == 'nodata':
+            status = 'No status packet received from {} for {} s'.format(
+                self.port, detail)
+        elif reason == 'stale':
+            status = 'No status packet received for {} s'.format(detail)
+        elif state == DevState.ON:
+            status = 'Run mode: {}, phase: {}'.format(reason, detail)
+        else:
+            status = 'Run mode: {}, alarm: {}'.format(reason, detail)
+        self.set_state(state)
+        self.set_status(status)
+
+    def _start_reader(self):
+        self.channel = None
+        self.status_thread = None
+        self.status_thread_stop = threading.Event()
+        if self.SharedReader and SerialMultiplexer.supports(self.serial):
+            self.flush_input_buffer()
+            multiplexer = SerialMultiplexer.instance(EnsureOmniThread)
+            self.channel = multiplexer.register(
+                self.serial, self._process_packets, self._read_error,
+                tick_callback=self._update_state, decode=self._decode_data)
+        else:
+            self.status_thread = threading.Thread(
+                group=None, target=self.update_status_packet)
+            self.status_thread.start()
+
+    def _stop_reader(self):
+        if self.channel is not None:
+            SerialMultiplexer.instance().unregister(self.channel)
+        elif self.status_thread is not None:
+            self.status_thread_stop.set()
+            self.status_thread.join(3.0)
+
+    @staticmethod
+    def _parse_deadbands(lines):
+        deadbands = {}
+        for line in lines:
+            items = line.split()
+            if not items:
+                continue
+            name = items[0]
+            if name not in EVENT_ATTRIBUTES or not 2 <= len(items) <= 3:
+                raise ValueError("Wrong EventDeadbands line '{}'. The format "
+                                 "is: <attribute> <absolute> [<relative "
+                                 "%>]".format(line))
+            absolute = float(items[1])
+            relative = float(items[2]) if len(items) == 3 else 0.
+            deadbands[name] = absolute, relative
+        return deadbands
+
+    def _write(self, packet, confirm=None):
+        """queues the command packet in the writer, confirm is a predicate
+        on the status packets telling when the command is applied"""
+        with self.state_lock:
+            self.last_command = self.writer.submit(packet, confirm)
+            return self.last_command
+
     # ------------------------------------------------------------------
     # COMMANDS
     # ------------------------------------------------------------------
 
     @command
     def Restart(self):
-        data = [2, CSCOMMAND.RESTART]
-        self.debug_stream("Restart(): sending data: {}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.RESTART)
+        self.debug_stream("Restart(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.RESTART))
 
     @command
     def Purge(self):
-        data = [2, CSCOMMAND.PURGE]
-        self.debug_stream("PURGE(): sending data: {}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.PURGE)
+        self.debug_stream("PURGE(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.PURGE))
 
     @command
     def Stop(self):
-        data = [2, CSCOMMAND.STOP]
-        self.debug_stream("Stop(): sending data: {}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.STOP)
+        self.debug_stream("Stop(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.STOP))
 
     @command(dtype_in=(float,), doc_in='Rate and FinalTemperature')
     def Ramp(self, args):
@@ -64,15 +455,11 @@ class OxfCryo700(Device):
                              "are ramp and end temperature.")
 
         rate = int(args[0])
-        finalTemp = args[1]
-
-        finalTemp = int(finalTemp * 100)  # transfering to centi-Kelvin
-        rateHigh, rateLow = splitBytes(rate)
-        finalTempHigh, finalTempLow = splitBytes(finalTemp)
-        data = [6, CSCOMMAND.RAMP, rateHigh, rateLow, finalTempHigh,
-                finalTempLow]
-        self.debug_stream("Ramp(): sending data: {}".format(data))
-        self._write(data)
+        finalTemp = int(args[1] * 100)  # transfering to centi-Kelvin
+        data = command_packet(CSCOMMAND.RAMP, rate, finalTemp)
+        self.debug_stream("Ramp(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.RAMP, rate,
+                                               finalTemp))
 
     @command(dtype_in=bool, doc_in='Turn on the Turbo')
     def Turbo(self, turn_on):
@@ -85,9 +472,10 @@ class OxfCryo700(Device):
             turboState = 1
         else:
             turboState = 0
-        data = [3, CSCOMMAND.TURBO, turboState]
-        self.debug_stream("Turbo(): sending data: {}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.TURBO, turboState)
+        self.debug_stream("Turbo(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.TURBO,
+                                               turboState))
 
     @command(dtype_in=float, doc_in='Temperature between 80 to 400 Kelvins')
     def Cool(self, temp):
@@ -96,26 +484,22 @@ class OxfCryo700(Device):
         The Params[] array consists of a short containing the end
         temperature in centi-Kelvin
         """
-        if not (80 <= temp <= 400):
-            raise ValueError("Wrong arguments. Cool only accept values "
-                             "between 80 to 400")
-
+        check_cool(temp)
         cool_value = int(temp * 100)
-        HIBYTE, LOBYTE = splitBytes(cool_value)
-        data = [4, CSCOMMAND.COOL, HIBYTE, LOBYTE]
-        self.debug_stream("Cool(): sending data: {}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.COOL, cool_value)
+        self.debug_stream("Cool(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.COOL, cool_value))
 
     @command
     def Pause(self):
-        data = [2, CSCOMMAND.PAUSE]
-        self.debug_stream("Pause(): sending data:{}".format(data))
-        self._write(data)
+        data = command_packet(CSCOMMAND.PAUSE)
+        self.debug_stream("Pause(): sending data:{}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.PAUSE))
 
     @command
     def Resume(self):
-        data = [2, CSCOMMAND.RESUME]
-        self.debug_stream("Resume(): sending data: {}".format(data))
+        data = command_packet(CSCOMMAND.RESUME)
+        self.debug_stream("Resume(): sending data: {}".format(list(data)))
         self._write(data)
 
     @command(dtype_in=int, doc_in='Plat command identifier - parameter '
@@ -127,10 +511,9 @@ class OxfCryo700(Device):
         Plat in minutes
         """
 
-        HIBYTE, LOBYTE = splitBytes(val)
-        data = [4, CSCOMMAND.PLAT, HIBYTE, LOBYTE]
-        self.debug_stream("Plat(): sending data: {}".format(data))
-        self.serial.write(data)
+        data = command_packet(CSCOMMAND.PLAT, val)
+        self.debug_stream("Plat(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.PLAT, val))
 
     @command(dtype_in=int, doc_in='End command identifier - parameter follows')
     def End(self, val):
@@ -140,10 +523,9 @@ class OxfCryo700(Device):
         in K/hour
         """
 
-        HIBYTE, LOBYTE = splitBytes(val)
-        data = [4, CSCOMMAND.END, HIBYTE, LOBYTE]
-        self.debug_stream("End(): sending data: {}".format(data))
-        self.serial.write(data)
+        data = command_packet(CSCOMMAND.END, val)
+        self.debug_stream("End(): sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.END, val))
 
     # Command without description on the manual. It is not used on the
     # beamlines
@@ -156,10 +538,10 @@ class OxfCryo700(Device):
     #     anneal time in tenths of a second
     #     """
     #     val = int(value * 10)
-    #     data = [3, CSCOMMAND.CRYOSHUTTER_START_AUTO, val]
+    #     data = command_packet(CSCOMMAND.CRYOSHUTTER_START_AUTO, val)
     #     self.debug_stream("CryoShutter_Start_Auto(): "
-    #                       "sending data: {}".format(data))
-    #     self.serial.write(data)
+    #                       "sending data: {}".format(list(data)))
+    #     self._write(data)
 
     @command
     def CryoShutter_Start_Man(self):
@@ -167,10 +549,10 @@ class OxfCryo700(Device):
         The	CSCOMMAND_CRYOSHUTTER_START_MAN command packet, size = 2
         Shut until CSCOMMAND_CRYOSHUTTER_STOP
         """
-        data = [2, CSCOMMAND.CRYOSHUTTER_START_MAN]
+        data = command_packet(CSCOMMAND.CRYOSHUTTER_START_MAN)
         self.debug_stream("CryoShutter_Start_Man(): "
-                          "sending data: {}".format(data))
-        self.serial.write(data)
+                          "sending data: {}".format(list(data)))
+        self._write(data)
 
     @command
     def CryoShutter_Stop(self):
@@ -178,178 +560,863 @@ class OxfCryo700(Device):
         The	CSCOMMAND_CRYOSHUTTER_STOP command packet, size = 2
         Open the CryoShutter
         """
-        data = [2, CSCOMMAND.CRYOSHUTTER_STOP]
+        data = command_packet(CSCOMMAND.CRYOSHUTTER_STOP)
         self.debug_stream("CryoShutter_Stop(): "
-                          "sending data: {}".format(data))
-        self.serial.write(data)
+                          "sending data: {}".format(list(data)))
+        self._write(data)
 
     @command(dtype_in=int, doc_in='Set status packet format: 0 old, '
                                   '1 extended')
-    def Status_Format(self, args):
+    def Status_Format(self, val):
         """
         The CSCOMMAND_SETSTATUSFORMAT command packet, size = 3
+        The Params[] array consists of a single char, 0 for the standard
+        status packets and 1 for the extended ones. Both formats are
+        decoded by the reader.
         """
-
-        if len(args) != 1:
-            raise Exception(
-                "Wrong number of arguments. Required paramters 0 or 1.")
-        try:
-            val = int(args[0])
-            if val != 0 and val != 1:
-                raise Exception()
-        except Exception:
-            raise Exception(
-                "Wrong type of arguments. Status_Format must be an integer, "
+        if val not in (0, 1):
+            raise ValueError(
+                "Wrong arguments. Status_Format must be an integer, "
                 "0 or 1.")
 
-        data = [3, CSCOMMAND.SETSTATUSFORMAT, val]
+        data = command_packet(CSCOMMAND.SETSTATUSFORMAT, val)
         self.debug_stream("Status_Format(): "
-                          "sending data: {}".format(data))
-        self.serial.write(data)
+                          "sending data: {}".format(list(data)))
+        self._write(data, command_confirmation(CSCOMMAND.SETSTATUSFORMAT,
+                                               val))
+
+    @command(dtype_in=float, doc_in='Timeout in seconds',
+             dtype_out=bool, doc_out='True if the last command was applied, '
+                                     'False on timeout or if it was '
+                                     'superseded by another one')
+    def WaitConfirmation(self, timeout):
+        """
+        Waits until the status packets show that the last command sent to
+        the controller is applied (e.g. the new phase and target after a
+        Cool or a Ramp), so scripts do not need fixed sleeps. Remember to
+        increase the client timeout accordingly.
+        """
+        request = self.last_command
+        if request is None:
+            return True
+        return request.wait(timeout)
+
+    @command(dtype_in='DevVarDoubleStringArray',
+             doc_in='[timeout s, arguments...] and [command]: {}'.format(
+                 ', '.join(SEND_COMMANDS)),
+             dtype_out=str,
+             doc_out='confirmed, sent (no confirmation), superseded, '
+                     'expired, failed or timeout')
+    def SendAndConfirm(self, args):
+        """
+        Sends a command (with the arguments of the command of the same
+        name) and waits until the status packets show that it is applied.
+        Unlike WaitConfirmation after the command, it waits for this
+        command even if other clients send commands meanwhile.
+        """
+        request, timeout = self._send(args)
+        request.wait(timeout)
+        return self._request_state(request)
+
+    def _send(self, args):
+        """sends the command of the SendAndConfirm arguments, returns its
+        CommandRequest and the timeout"""
+        values, names = args
+        if len(names) != 1 or names[0] not in SEND_COMMANDS \
+                or len(values) == 0:
+            raise ValueError("Wrong arguments. Required paramters are the "
+                             "timeout, the command arguments and the "
+                             "command: {}".format(', '.join(SEND_COMMANDS)))
+        params = command_values(names[0], values[1:])
+        if params[0] == CSCOMMAND.COOL:
+            check_cool(params[1] / 100.)
+        data = command_packet(*params)
+        self.debug_stream("SendAndConfirm(): sending data: {}".format(
+            list(data)))
+        return self._write(data, command_confirmation(*params)), values[0]
+
+    @staticmethod
+    def _request_state(request):
+        if not request.done:
+            return 'timeout'
+        return request.state
+
+    @command(dtype_in=(float,),
+             doc_in='[target K, tolerance K, timeout s]',
+             dtype_out=str,
+             doc_out='Why the wait ended: Reached, Timeout, Alarm: <alarm>, '
+                     'RunMode: <run mode> or NoData')
+    def WaitForTemperature(self, args):
+        """
+        Waits until the gas temperature is within the tolerance of the
+        target. It returns within one status packet, without polling.
+        Remember to increase the client timeout accordingly.
+        """
+        check, timeout = self._temperature_wait(args)
+        return self._wait_for(check, timeout)
+
+    @command(dtype_in=(float,),
+             doc_in='[band K, hold time s, timeout s]',
+             dtype_out=str,
+             doc_out='Why the wait ended: Stable, Timeout, Alarm: <alarm>, '
+                     'RunMode: <run mode> or NoData')
+    def WaitForStable(self, args):
+        """
+        Waits until the gas temperature stays within a band (max - min)
+        for the hold time. Remember to increase the client timeout
+        accordingly.
+        """
+        check, timeout = self._stable_wait(args)
+        return self._wait_for(check, timeout)
+
+    @staticmethod
+    def _temperature_wait(args):
+        if len(args) != 3:
+            raise ValueError("Wrong number of arguments. Required paramters "
+                             "are target temperature, tolerance and "
+                             "timeout.")
+        target, tolerance, timeout = args
+
+        def check(packet):
+            if abs(packet.gas_temp - target) <= tolerance:
+                return 'Reached'
+        return check, timeout
+
+    @staticmethod
+    def _stable_wait(args):
+        if len(args) != 3:
+            raise ValueError("Wrong number of arguments. Required paramters "
+                             "are band, hold time and timeout.")
+        band, hold, timeout = args
+        window = RunningStatistics(hold)
+        first = []
+
+        def check(packet):
+            timestamp = packet.timestamp
+            if not first:
+                first.append(timestamp)
+            window.add(timestamp, packet.gas_temp)
+            _, _, low, high, _ = window.values()
+            if high - low <= band and timestamp - first[0] >= hold:
+                return 'Stable'
+        return check, timeout
+
+    def _wait_end(self, packet):
+        """reason to stop waiting for a temperature from the device and
+        controller state, None to keep waiting"""
+        if self.quality == AttrQuality.ATTR_INVALID \
+                and self.state_key is not None \
+                and self.state_key[0] == DevState.FAULT:
+            return 'NoData'
+        if packet is None:
+            return None
+        if packet.alarm_code >= FIRST_FAULT_ALARM:
+            return 'Alarm: {}'.format(packet.alarm)
+        if packet.run_mode != 'Run':
+            return 'RunMode: {}'.format(packet.run_mode)
+        return None
+
+    def _wait_step(self, check, checked):
+        """checks the last status packet if not checked yet, returns the
+        reason to stop waiting (or None) and the packet checked"""
+        packet = self.status_packet
+        reason = self._wait_end(packet)
+        if reason is None and packet is not None and packet is not checked:
+            checked = packet
+            reason = check(packet)
+        return reason, checked
+
+    def _wait_for(self, check, timeout):
+        """waits until check(packet) returns the reason to stop waiting,
+        for every new status packet"""
+        deadline = time.monotonic() + timeout
+        checked = None
+        with self.packet_condition:
+            while True:
+                reason, checked = self._wait_step(check, checked)
+                if reason:
+                    return reason
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return 'Timeout'
+                self.packet_condition.wait(min(remaining,
+                                               SUPERVISION_PERIOD))
+
+    def _notify_packet(self):
+        """wakes up the commands waiting for a new status packet"""
+        with self.packet_condition:
+            self.packet_condition.notify_all()
+
+    @command(dtype_in=(str,),
+             doc_in='Temperature program, one phase per line: Ramp <rate '
+                    'K/h> <target K>, Cool <target K>, Plat <duration '
+                    'min>, End <rate K/h> or Purge')
+    def LoadProgram(self, lines):
+        """
+        Loads a temperature program, to be started with RunProgram. Each
+        phase is sent to the controller as soon as the status packets show
+        that the previous one is completed.
+        """
+        phases = [ProgramPhase.parse(line) for line in lines if line.strip()]
+        with self.state_lock:
+            if self.program is not None and self.program.running:
+                raise RuntimeError("A program is running. Abort it before "
+                                   "loading a new one.")
+            self.program = ProgramExecutor(phases, self._write)
+
+    @command
+    def RunProgram(self):
+        with self.state_lock:
+            if self.program is None:
+                raise RuntimeError("No program loaded. Use LoadProgram "
+                                   "first.")
+            self.program.start(self.status_packet)
+
+    @command
+    def AbortProgram(self):
+        """
+        Stops the running program and holds the current temperature
+        """
+        with self.state_lock:
+            if self.program is not None:
+                self.program.abort()
+
+    @command(dtype_in='DevVarDoubleStringArray',
+             doc_in='[start, end] epoch timestamps and the names of the '
+                    'history fields (all if empty)',
+             dtype_out=(float,),
+             doc_out='One row per sample within [start, end] flattened: '
+                     'timestamp followed by the values of the fields')
+    def GetHistory(self, args):
+        limits, fields = args
+        if len(limits) != 2:
+            raise ValueError("Wrong number of arguments. Required paramters "
+                             "are start and end timestamps.")
+        fields = list(fields) or None
+        if fields is not None:
+            unknown = set(fields) - set(HISTORY_FIELDS)
+            if unknown:
+                raise ValueError("Unknown history fields: {}. Valid fields "
+                                 "are {}".format(', '.join(sorted(unknown)),
+                                                 ', '.join(HISTORY_FIELDS)))
+        return self.history.query(limits[0], limits[1], fields).ravel()
+
+    @command(dtype_in='DevVarDoubleStringArray',
+             doc_in='[start, end, resolution] (epoch timestamps and '
+                    'seconds) and [field]',
+             dtype_out=(float,),
+             doc_out='One row per sample within [start, end] flattened: '
+                     'timestamp, min, mean and max')
+    def GetTrend(self, args):
+        """
+        Returns the trend of a field (see trend.TREND_FIELDS) from the
+        finest tier with at least the requested resolution which still
+        holds the start of the span: raw samples (resolution 0), 1 minute
+        (60) or 1 hour (3600) aggregates.
+        """
+        if self.trends is None:
+            raise RuntimeError("Trends disabled. Set the TrendDirectory "
+                               "property.")
+        values, fields = args
+        if len(values) != 3 or len(fields) != 1:
+            raise ValueError("Wrong number of arguments. Required paramters "
+                             "are start, end, resolution and field.")
+        start, end, resolution = values
+        return self.trends.query(fields[0], start, end, resolution).ravel()
+
+    @command(dtype_in='DevVarDoubleStringArray',
+             doc_in='[start, end] epoch timestamps and the transition '
+                    'fields (all if empty): {}'.format(
+                        ', '.join(TRANSITION_FIELDS)),
+             dtype_out='DevVarDoubleStringArray',
+             doc_out='One [timestamp, code before, code after] row per '
+                     'transition within [start, end] flattened, and the '
+                     'transitions as "<field> <before> -> <after>"')
+    def GetTransitions(self, args):
+        """
+        Returns the run mode, phase, alarm and turbo mode transitions of
+        the journal, oldest first.
+        """
+        limits, fields = args
+        if len(limits) != 2:
+            raise ValueError("Wrong number of arguments. Required paramters "
+                             "are start and end timestamps.")
+        fields = list(fields) or None
+        if fields is not None:
+            unknown = set(fields) - set(TRANSITION_FIELDS)
+            if unknown:
+                raise ValueError("Unknown transition fields: {}. Valid "
+                                 "fields are {}".format(
+                                     ', '.join(sorted(unknown)),
+                                     ', '.join(TRANSITION_FIELDS)))
+        transitions = self.journal.query(limits[0], limits[1], fields)
+        values = []
+        for transition in transitions:
+            values.extend((transition.timestamp, transition.before,
+                           transition.after))
+        return values, [transition_text(t) for t in transitions]
 
     # ------------------------------------------------------------------
     # ATTRIBUTES
     # ------------------------------------------------------------------
 
+    def read_attr_hardware(self, attr_list):
+        self._start_read_request()
+
+    def _start_read_request(self):
+        # all the attributes of a read request are served from the same
+        # status packet (the requests of other clients may run
+        # concurrently in other threads)
+        with self.state_lock:
+            self._requests[threading.get_ident()] = (self.status_packet,
+                                                     self.quality)
+        self.metrics.add_read()
+
+    @property
+    def snapshot(self):
+        """status packet of the current attribute read request"""
+        with self.state_lock:
+            packet, _ = self._requests.get(threading.get_ident(),
+                                           (None, None))
+        if packet is None:
+            raise RuntimeError('No status packet received yet')
+        return packet
+
+    def _value(self, value):
+        """value with the timestamp of the snapshot and its quality,
+        invalid when the data is stale"""
+        with self.state_lock:
+            packet, quality = self._requests[threading.get_ident()]
+        return value, packet.timestamp, quality
+
     @attribute(name='GasSetPoint', unit='K')
     def gas_set_point(self):
-        self.info_stream("read_GasSetPoint")
-        return self.status_packet.gas_set_point
+        return self._value(self.snapshot.gas_set_point)
 
     @attribute(name='GasTemp', unit='K')
     def gas_temp(self):
-        self.info_stream("read_GasSetPoint")
-        return self.status_packet.gas_temp
+        return self._value(self.snapshot.gas_temp)
 
     @attribute(name='GasError', unit='K')
     def gas_error(self):
-        self.info_stream("read_GasError")
-        return self.status_packet.gas_error
+        return self._value(self.snapshot.gas_error)
 
     @attribute(name='RunMode', dtype=str)
     def run_mode(self):
-        self.info_stream("read_RunMode")
-        return self.status_packet.run_mode
+        return self._value(self.snapshot.run_mode)
 
     @attribute(name='Phase', dtype=str)
     def phase(self):
-        self.info_stream("read_Phase")
-        return self.status_packet.phase
+        return self._value(self.snapshot.phase)
 
     @attribute(name='RampRate', dtype=int)
     def ramp_rate(self):
-        self.info_stream("read_RampRate")
-        return self.status_packet.ramp_rate
+        return self._value(self.snapshot.ramp_rate)
 
     @attribute(name='TargetTemp')
     def target_temp(self):
-        self.info_stream("read_TargetTemp")
-        return self.status_packet.target_temp
+        return self._value(self.snapshot.target_temp)
 
     @attribute(name='EvapTemp', unit='K')
     def evap_temp(self):
-        self.info_stream("read_EvapTemp")
-        return self.status_packet.evap_temp
+        return self._value(self.snapshot.evap_temp)
 
     @attribute(name='SuctTemp', unit='K')
     def suct_temp(self):
-        self.info_stream("read_SuctTemp")
-        return self.status_packet.suct_temp
+        return self._value(self.snapshot.suct_temp)
 
     @attribute(name='GasFlow', unit='l/min')
     def gas_flow(self):
-        self.info_stream("read_GasFlow")
-        return self.status_packet.gas_flow
+        return self._value(self.snapshot.gas_flow)
 
     @attribute(name='GasHeat', unit='%')
     def gas_heat(self):
-        self.info_stream("read_GasHeat")
-        return self.status_packet.gas_heat
+        return self._value(self.snapshot.gas_heat)
 
     @attribute(name='EvapHeat', unit='%')
     def evap_heat(self):
-        self.info_stream("read_EvapHeat")
-        return self.status_packet.evap_heat
+        return self._value(self.snapshot.evap_heat)
 
     @attribute(name='SuctHeat', unit='%')
     def suct_heat(self):
-        self.info_stream("read_SuctHeat")
-        return self.status_packet.suct_heat
+        return self._value(self.snapshot.suct_heat)
 
     @attribute(name='LinePressure', unit='bar')
     def line_pressure(self):
-        self.info_stream("read_LinePressure")
-        return self.status_packet.line_pressure
+        return self._value(self.snapshot.line_pressure)
 
     @attribute(name='Alarm', dtype=str)
     def alarm(self):
-        self.info_stream("read_Alarm")
-        return self.status_packet.alarm
+        return self._value(self.snapshot.alarm)
 
     @attribute(name='RunTime', dtype=str)
     def run_time(self):
-        self.info_stream("read_RunTime")
-        result = '{}d, {}h, {}m'.format(self.status_packet.run_days,
-                                        self.status_packet.run_hours,
-                                        self.status_packet.run_mins)
-        return result
+        snapshot = self.snapshot
+        result = '{}d, {}h, {}m'.format(snapshot.run_days,
+                                        snapshot.run_hours,
+                                        snapshot.run_mins)
+        return self._value(result)
 
     @attribute(name='ControllerNr', dtype=int)
     def controller_number(self):
-        self.info_stream("read_ControllerNumber")
-        return self.status_packet.controller_nb
+        return self._value(self.snapshot.controller_nb)
 
     @attribute(name='SoftwareVersion', dtype=int)
     def software_version(self):
-        self.info_stream("read_SoftwareVersion")
-        return self.status_packet.software_version
+        return self._value(self.snapshot.software_version)
 
     @attribute(name='EvapAdjust', dtype=int)
     def evap_adjust(self):
-        self.info_stream("read_EvapAdjust")
-        return self.status_packet.evap_adjust
+        return self._value(self.snapshot.evap_adjust)
 
     @attribute(name='TurboMode', dtype=bool)
     def turbo_mode(self):
-        self.info_stream("read_TurboMode")
-        flow = self.status_packet.gas_flow
-        phase = self.status_packet.phase
-        self.info_stream('flow: {} , phase: {}'.format(flow, phase))
-        if flow > 5 and phase != "Cool":
-            turbomode = True
-        else:
-            turbomode = False
-        return turbomode
+        return self._value(turbo_state(self.snapshot))
+
+    # Attributes only available with the extended status packet format
+    # (see Status_Format command), invalid otherwise
+
+    def _extended_field(self, name):
+        snapshot = self.snapshot
+        value = getattr(snapshot, name)
+        if value is None:
+            return 0, snapshot.timestamp, AttrQuality.ATTR_INVALID
+        return self._value(value)
+
+    @attribute(name='HardwareType', dtype=int)
+    def hardware_type(self):
+        return self._extended_field('hardware_type')
+
+    @attribute(name='ShutterState', dtype=int)
+    def shutter_state(self):
+        return self._extended_field('shutter_state')
+
+    @attribute(name='ShutterTime', dtype=int)
+    def shutter_time(self):
+        return self._extended_field('shutter_time')
+
+    @attribute(name='AvgGasHeat', dtype=int, unit='%')
+    def avg_gas_heat(self):
+        return self._extended_field('avg_gas_heat')
+
+    @attribute(name='AvgSuctHeat', dtype=int, unit='%')
+    def avg_suct_heat(self):
+        return self._extended_field('avg_suct_heat')
+
+    @attribute(name='TimeToFill', dtype=int)
+    def time_to_fill(self):
+        return self._extended_field('time_to_fill')
+
+    @attribute(name='TotalHours', dtype=int, unit='h')
+    def total_hours(self):
+        return self._extended_field('total_hours')
+
+    @attribute(name='StatusFormat', dtype=str)
+    def status_format(self):
+        return self._value(self.snapshot.format.name)
+
+    @attribute(name='StatusSnapshot', dtype=(float,),
+               max_dim_x=len(SNAPSHOT_FIELDS),
+               doc='All the fields of the last status packet, in the order '
+                   'of StatusSnapshotFields: {}. NaN for the extended '
+                   'fields of standard packets'.format(
+                       ', '.join(SNAPSHOT_FIELDS)))
+    def status_snapshot(self):
+        snapshot = self.snapshot
+        values = [snapshot.timestamp]
+        for name in SNAPSHOT_FIELDS[1:]:
+            value = getattr(snapshot, name)
+            values.append(NAN if value is None else value)
+        return self._value(values)
+
+    @attribute(name='StatusSnapshotFields', dtype=(str,),
+               max_dim_x=len(SNAPSHOT_FIELDS))
+    def status_snapshot_fields(self):
+        return SNAPSHOT_FIELDS
+
+    @attribute(name='LastTransition', dtype=str,
+               doc='Last run mode, phase, alarm or turbo mode transition, '
+                   'as "<field> <before> -> <after>". A user event is '
+                   'pushed with every transition and a data ready event '
+                   'with TransitionCount')
+    def last_transition(self):
+        transitions = self.journal.last(1)
+        if not transitions:
+            return '', time.time(), AttrQuality.ATTR_INVALID
+        transition = transitions[0]
+        return transition_text(transition), transition.timestamp, \
+            AttrQuality.ATTR_VALID
+
+    @attribute(name='TransitionCount', dtype=int,
+               doc='Number of transitions since the start of the device')
+    def transition_count(self):
+        return self.journal.count
+
+    # History of the last HistorySize status packets, oldest first
+
+    @attribute(name='TimestampHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='s')
+    def timestamp_history(self):
+        return self.history.get_timestamps()
+
+    @attribute(name='GasTempHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='K')
+    def gas_temp_history(self):
+        return self.history.get('gas_temp')
+
+    @attribute(name='GasSetPointHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='K')
+    def gas_set_point_history(self):
+        return self.history.get('gas_set_point')
+
+    @attribute(name='GasErrorHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='K')
+    def gas_error_history(self):
+        return self.history.get('gas_error')
+
+    @attribute(name='GasFlowHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='l/min')
+    def gas_flow_history(self):
+        return self.history.get('gas_flow')
+
+    @attribute(name='EvapTempHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='K')
+    def evap_temp_history(self):
+        return self.history.get('evap_temp')
+
+    @attribute(name='SuctTempHistory', dtype=(float,),
+               max_dim_x=HISTORY_MAX_SIZE, unit='K')
+    def suct_temp_history(self):
+        return self.history.get('suct_temp')
+
+    # Statistics over the windows of the StatisticsWindows property, one
+    # row per window with the columns of StatisticsNames
+
+    @attribute(name='GasTempStatistics', dtype=((float,),),
+               max_dim_x=len(STATISTICS_NAMES),
+               max_dim_y=STATISTICS_MAX_WINDOWS,
+               doc='Mean, std, min, max (K) and slope (K/h) of GasTemp')
+    def gas_temp_statistics(self):
+        return self.statistics.get('gas_temp')
+
+    @attribute(name='GasErrorStatistics', dtype=((float,),),
+               max_dim_x=len(STATISTICS_NAMES),
+               max_dim_y=STATISTICS_MAX_WINDOWS,
+               doc='Mean, std, min, max (K) and slope (K/h) of GasError')
+    def gas_error_statistics(self):
+        return self.statistics.get('gas_error')
+
+    @attribute(name='GasFlowStatistics', dtype=((float,),),
+               max_dim_x=len(STATISTICS_NAMES),
+               max_dim_y=STATISTICS_MAX_WINDOWS,
+               doc='Mean, std, min, max (l/min) and slope (l/min/h) of '
+                   'GasFlow')
+    def gas_flow_statistics(self):
+        return self.statistics.get('gas_flow')
+
+    @attribute(name='StatisticsNames', dtype=(str,),
+               max_dim_x=len(STATISTICS_NAMES))
+    def statistics_names(self):
+        return STATISTICS_NAMES
+
+    @attribute(name='StatisticsWindowSizes', dtype=(float,),
+               max_dim_x=STATISTICS_MAX_WINDOWS, unit='s')
+    def statistics_window_sizes(self):
+        return self.statistics.windows
+
+    @attribute(name='Subscribers', dtype=int,
+               doc='Clients connected to the packet publisher (see '
+                   'PublisherAddress)')
+    def subscribers(self):
+        if self.publisher is None:
+            return 0
+        return len(self.publisher.subscribers)
+
+    # Temperature program (see LoadProgram)
+
+    @attribute(name='Program', dtype=(str,), max_dim_x=1024)
+    def program_phases(self):
+        program = self.program
+        if program is None:
+            return []
+        return [str(phase) for phase in program.phases]
+
+    @attribute(name='ProgramState', dtype=str,
+               doc='Idle, Running, Done, Aborted or Failed, followed by '
+                   'the reason it ended')
+    def program_state(self):
+        program = self.program
+        if program is None:
+            return 'Idle'
+        if program.message:
+            return '{}: {}'.format(program.state, program.message)
+        return program.state
+
+    @attribute(name='ProgramPhase', dtype=int,
+               doc='Index of the current program phase, -1 if not started')
+    def program_phase(self):
+        program = self.program
+        return -1 if program is None else program.index
+
+    @attribute(name='ProgramProgress', unit='%',
+               doc='Elapsed fraction of the estimated program time')
+    def program_progress(self):
+        program = self.program
+        return 0. if program is None else program.progress
+
+    @attribute(name='ProgramETA', unit='s',
+               doc='Estimated time to the end of the program')
+    def program_eta(self):
+        program = self.program
+        return 0. if program is None else program.eta
+
+    # Reader instrumentation
+
+    @attribute(name='PacketRate', unit='Hz',
+               doc='Status packets received per second (moving average)')
+    def packet_rate(self):
+        return self.metrics.rate
+
+    @attribute(name='PacketAge', unit='s',
+               doc='Time since the last status packet was received')
+    def packet_age(self):
+        age = self.metrics.age
+        if age is None:
+            return 0, time.time(), AttrQuality.ATTR_INVALID
+        return age
+
+    @attribute(name='ReadPacketAge', unit='s',
+               doc='Age of the status packet served to the attribute read '
+                   'requests (moving average)')
+    def read_packet_age(self):
+        return self.metrics.read_age
+
+    @attribute(name='ReadPacketAgeMax', unit='s')
+    def read_packet_age_max(self):
+        return self.metrics.read_age_max
+
+    @attribute(name='DecodeTime', unit='s',
+               doc='Decode time per status packet (moving average)')
+    def decode_time(self):
+        return self.metrics.decode_time
+
+    @attribute(name='DecodeTimeMax', unit='s')
+    def decode_time_max(self):
+        return self.metrics.decode_time_max
+
+    @attribute(name='PacketCount', dtype=int)
+    def packet_count(self):
+        return self.metrics.packets
+
+    @attribute(name='SkippedPackets', dtype=int,
+               doc='Packets superseded by a newer one read at the same time')
+    def skipped_packets(self):
+        return self.metrics.skipped
+
+    @attribute(name='CorruptedPackets', dtype=int,
+               doc='Resynchronizations of the stream after a corrupted or '
+                   'truncated packet')
+    def corrupted_packets(self):
+        return self.metrics.corrupted
+
+    @attribute(name='FlushedBytes', dtype=int,
+               doc='Bytes flushed from the input buffer')
+    def flushed_bytes(self):
+        return self.metrics.flushed_bytes
+
+    @attribute(name='DiscardedBytes', dtype=int,
+               doc='Bytes discarded while synchronizing with the packets')
+    def discarded_bytes(self):
+        return self.metrics.discarded_bytes
+
+    @attribute(name='JitterHistogram', dtype=(int,),
+               max_dim_x=len(JITTER_BINS) + 1,
+               doc='Counts of the deviation of the packet inter-arrival '
+                   'times from the average period, in the bins of '
+                   'JitterHistogramBins (the last one counts the larger '
+                   'deviations)')
+    def jitter_histogram(self):
+        return self.metrics.jitter_counts
+
+    @attribute(name='JitterHistogramBins', dtype=(float,),
+               max_dim_x=len(JITTER_BINS), unit='s',
+               doc='Upper edges of the JitterHistogram bins')
+    def jitter_histogram_bins(self):
+        return JITTER_BINS
 
     def update_status_packet(self):
+        with EnsureOmniThread():
+            self._read_status_packets()
+
+    def _read_status_packets(self):
         self.status_thread_stop.clear()
-        # flushing input buffer
-        self.flush_input_buffer()
+        try:
+            # flushing input buffer
+            self.flush_input_buffer()
+        except Exception as e:
+            self._read_error(e)
+            return
         # updating loop
-        while not self.status_thread_stop.isSet():
-            # TODO Implement check of the status format package it can be
-            #  extended
-            raw_data = self.serial.read(32)
-            if self.serial.inWaiting() > 32:
-                # if there are newer packets in the buffer, we do not process
-                # and just continue
+        next_check = 0
+        while not self.status_thread_stop.is_set():
+            # read whatever is available (at least one byte) and let the
+            # decoder find the packet boundaries
+            try:
+                raw_data = self.serial.read(max(1, port_waiting(self.serial)))
+            except Exception as e:
+                self._read_error(e)
+                return
+            if raw_data:
+                self._process_data(raw_data, time.time())
+            monotonic = time.monotonic()
+            if monotonic >= next_check:
+                self._update_state()
+                next_check = monotonic + SUPERVISION_PERIOD
+
+    def _read_error(self, error):
+        """the reader stopped on an error reading the port"""
+        self._port_failed(error)
+
+    def _process_data(self, raw_data, now):
+        """decodes the bytes read from the port and processes the complete
+        status packets"""
+        self._process_packets(self._decode_data(raw_data, now), now)
+
+    def _decode_data(self, raw_data, now):
+        """decodes the bytes read from the port, returns the complete
+        status packets"""
+        monotonic = time.monotonic()
+        discarded = self.decoder.discarded
+        t0 = time.perf_counter()
+        packets = self.decoder.feed(raw_data, now)
+        decode_time = time.perf_counter() - t0
+        self.metrics.add_chunk(len(raw_data), len(packets), decode_time,
+                               monotonic)
+        self.metrics.corrupted = self.decoder.resyncs
+        self.metrics.discarded_bytes = self.decoder.discarded
+        if self.decoder.discarded != discarded:
+            self.warn_stream("Discarded {} bytes while synchronizing "
+                             "with the status packets".format(
+                                 self.decoder.discarded - discarded))
+        return packets
+
+    def _process_packets(self, packets, now):
+        """processes the status packets received at now (wall-clock
+        time), maybe later in a worker"""
+        monotonic = time.monotonic() - max(0., time.time() - now)
+        for packet in packets:
+            self.writer.notify(packet, monotonic)
+            self.history.append(packet, now)
+            self.statistics.append(packet, now)
+            if self.capture is not None:
+                self.capture.append(packet.raw, monotonic, now)
+            if self.publisher is not None:
+                self.publisher.publish(packet.raw, now)
+            if self.shared_packet is not None:
+                self.shared_packet.write(packet.raw, now)
+            if self.trends is not None:
+                self.trends.append(packet, now)
+            self.journal.update(now, transition_values(packet,
+                                                       turbo_state(packet)))
+        if packets:
+            with self.state_lock:
+                # if there are several packets we only keep the newest one
+                self.status_packet = packets[-1]
+                self.reconnect_delay = self.ReconnectDelay
+                self._update_state()
+                if self.program is not None:
+                    self.program.update(self.status_packet)
+            self._notify_packet()
+            self._push_events(self.status_packet, now)
+            self._push_transition_events()
+
+    def _push_events(self, packet, timestamp):
+        """pushes change and archive events for the attributes whose value
+        changed beyond their deadband since the last pushed one"""
+        for name, field in EVENT_ATTRIBUTES.items():
+            value = getattr(packet, field)
+            last = self.event_values.get(name)
+            if last is not None and not self._changed(name, last, value):
                 continue
-            data = list(map(int, raw_data))
+            self.event_values[name] = value
+            try:
+                self.push_change_event(name, value, timestamp,
+                                       AttrQuality.ATTR_VALID)
+                self.push_archive_event(name, value, timestamp,
+                                        AttrQuality.ATTR_VALID)
+            except Exception as e:
+                self.error_stream("Error pushing {} events: "
+                                  "{}".format(name, e))
+
+    def _push_invalid_events(self):
+        """pushes change and archive events with the last values and the
+        invalid quality when the data becomes stale. The next status
+        packet pushes all the attributes again"""
+        timestamp = time.time()
+        values, self.event_values = self.event_values, {}
+        for name, value in values.items():
             try:
-                self.status_packet = StatusPacket(data)
+                self.push_change_event(name, value, timestamp,
+                                       AttrQuality.ATTR_INVALID)
+                self.push_archive_event(name, value, timestamp,
+                                        AttrQuality.ATTR_INVALID)
             except Exception as e:
-                self.error_stream("Error while parsing read data: %s" % e)
-                self.error_stream("Flushing input buffer to start from "
-                                  "the skratch")
-                self.flush_input_buffer()
+                self.error_stream("Error pushing {} events: "
+                                  "{}".format(name, e))
+
+    def _push_transition_events(self):
+        """pushes a user event of LastTransition with each new transition
+        and a data ready event with the number of transitions"""
+        if self.journal.count == self.transitions_pushed:
+            return
+        count = self.journal.count
+        try:
+            for transition in self.journal.last(
+                    count - self.transitions_pushed):
+                self.push_event('LastTransition', [], [],
+                                transition_text(transition),
+                                transition.timestamp,
+                                AttrQuality.ATTR_VALID)
+            self.push_data_ready_event('LastTransition', count)
+        except Exception as e:
+            self.error_stream("Error pushing LastTransition events: "
+                              "{}".format(e))
+        self.transitions_pushed = count
+
+    def _changed(self, name, last, value):
+        if name not in self.deadbands or isinstance(value, str):
+            return value != last
+        absolute, relative = self.deadbands[name]
+        delta = abs(value - last)
+        if delta == 0:
+            return False
+        # a deadband of 0 is disabled, like abs_change and rel_change
+        if absolute <= 0 and relative <= 0:
+            return True
+        if absolute > 0 and delta > absolute:
+            return True
+        return relative > 0 and last != 0 and \
+            100. * delta / abs(last) > relative
 
     def flush_input_buffer(self):
-        while self.serial.inWaiting() > 0:
+        while True:
+            waiting = self.serial.inWaiting()
+            if waiting <= 0:
+                break
+            self.metrics.flushed_bytes += waiting
             self.serial.flushInput()
 
 
+def no_sync():
+    """the requests are not serialized by the device monitor: the wait
+    commands block only their client, and the reader pushes events without
+    waiting for the monitor. The serial model is process-wide, so it is set
+    once before the devices are created"""
+    Util.instance().set_serial_model(SerialModel.NO_SYNC)
+
+
 def main():
-    OxfCryo700.run_server()
+    OxfCryo700.run_server(pre_init_callback=no_sync)
 
 
 if __name__ == '__main__':
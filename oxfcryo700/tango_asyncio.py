@@ -0,0 +1,230 @@
+import asyncio
+import functools
+import time
+from tango import GreenMode
+from tango.server import Device, attribute, command
+from .multiplexer import port_waiting
+from .tango import OxfCryo700, SUPERVISION_PERIOD
+
+# commands of OxfCryo700 reading the history, the trend files or the
+# journal, run in the default executor instead of the event loop
+EXECUTOR_COMMANDS = ('GetHistory', 'GetTrend', 'GetTransitions')
+
+
+def coroutine_device(device_class):
+    """subclass of a synchronous device class whose attribute read methods
+    and commands are coroutines, as required by the asyncio green mode.
+    The attributes and the commands sending a packet are served by the
+    event loop, the EXECUTOR_COMMANDS by the default executor"""
+    members = {'__module__': __name__}
+    for name, member in vars(device_class).items():
+        if isinstance(member, attribute):
+            members[name] = attribute(fget=_coroutine_read(member.fget),
+                                      **member._kwargs)
+        elif hasattr(member, '__tango_command__'):
+            cmd_name, (din, dout, config) = member.__tango_command__
+            members[name] = command(
+                _coroutine_command(member.__wrapped__,
+                                   cmd_name in EXECUTOR_COMMANDS),
+                dtype_in=din[0], doc_in=din[1], dtype_out=dout[0],
+                doc_out=dout[1],
+                display_level=config.get('Display level'),
+                polling_period=config.get('Polling period'))
+    return type(device_class)(device_class.__name__ + 'Coroutines',
+                              (device_class,), members)
+
+
+def _coroutine_read(read):
+    @functools.wraps(read)
+    async def coroutine(self):
+        return read(self)
+    return coroutine
+
+
+def _coroutine_command(method, in_executor):
+    @functools.wraps(method)
+    async def coroutine(self, *args):
+        if in_executor:
+            return await self.loop.run_in_executor(
+                None, functools.partial(method, self, *args))
+        return method(self, *args)
+    return coroutine
+
+
+class OxfCryo700Asyncio(coroutine_device(OxfCryo700)):
+    """OxfCryo700 device running in the asyncio green mode.
+
+    The serial port is read without blocking by the event loop, and the
+    commands waiting for the controller are coroutines, so they do not hold
+    a Tango worker thread. The port must provide a file descriptor.
+    """
+    green_mode = GreenMode.Asyncio
+
+    async def init_device(self):
+        await Device.init_device(self)
+        self.info_stream('In Python init_device method')
+        self.loop = asyncio.get_event_loop()
+        self.packet_waiters = set()
+        self._open()
+
+    async def delete_device(self):
+        self._close()
+        self.info_stream('OxfCryo700Asyncio.delete_device')
+
+    def _start_reader(self):
+        self.serial.timeout = 0
+        try:
+            self.flush_input_buffer()
+        except Exception as e:
+            self.reader_fd = None
+            self._read_error(e)
+            return
+        self.reader_fd = self.serial.fileno()
+        self.loop.add_reader(self.reader_fd, self._read_ready)
+        self.tick_handle = self.loop.call_later(SUPERVISION_PERIOD,
+                                                self._tick)
+
+    async def read_attr_hardware(self, attr_list):
+        self._start_read_request()
+
+    def _stop_reader(self):
+        # the commands waiting for a packet end at once, those waiting for
+        # a command end with its request (see CommandWriter.stop)
+        self._remove_reader()
+        self._notify_packet('NoData')
+
+    def _remove_reader(self):
+        if getattr(self, 'reader_fd', None) is not None:
+            self.loop.remove_reader(self.reader_fd)
+            self.tick_handle.cancel()
+            self.reader_fd = None
+
+    def _tick(self):
+        self._update_state()
+        self.tick_handle = self.loop.call_later(SUPERVISION_PERIOD,
+                                                self._tick)
+
+    def _call_later(self, delay, func):
+        return self.loop.call_later(delay, func)
+
+    def _read_ready(self):
+        try:
+            raw_data = self.serial.read(
+                max(1, port_waiting(self.serial, self.reader_fd)))
+        except Exception as e:
+            self._remove_reader()
+            self._read_error(e)
+            return
+        if raw_data:
+            self._process_data(raw_data, time.time())
+
+    def _notify_packet(self, reason=None):
+        """wakes up the commands waiting for a new status packet, or ends
+        their wait with reason"""
+        for waiter in self.packet_waiters:
+            if not waiter.done():
+                waiter.set_result(reason)
+        self.packet_waiters.clear()
+
+    async def wait_for_async(self, check, timeout):
+        """waits until check(packet) returns the reason to stop waiting,
+        for every new status packet, without blocking the event loop"""
+        deadline = time.monotonic() + timeout
+        checked = None
+        while True:
+            reason, checked = self._wait_step(check, checked)
+            if reason:
+                return reason
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return 'Timeout'
+            future = self.loop.create_future()
+            self.packet_waiters.add(future)
+            try:
+                reason = await asyncio.wait_for(future, min(
+                    remaining, SUPERVISION_PERIOD))
+            except asyncio.TimeoutError:
+                reason = None
+            finally:
+                self.packet_waiters.discard(future)
+            if reason:
+                return reason
+
+    async def wait_request(self, request, timeout):
+        """waits for a CommandRequest of the writer without blocking the
+        event loop"""
+        future = self.loop.create_future()
+
+        def done(_):
+            if not future.done():
+                future.set_result(None)
+
+        request.add_done_callback(
+            lambda r: self.loop.call_soon_threadsafe(done, r))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return request.wait(0)
+
+    @command(dtype_in=float, doc_in='Timeout in seconds',
+             dtype_out=bool, doc_out='True if the last command was applied, '
+                                     'False on timeout or if it was '
+                                     'superseded by another one')
+    async def WaitConfirmation(self, timeout):
+        """
+        Waits until the status packets show that the last command sent to
+        the controller is applied, without blocking the other clients.
+        """
+        request = self.last_command
+        if request is None:
+            return True
+        return await self.wait_request(request, timeout)
+
+    @command(dtype_in='DevVarDoubleStringArray',
+             doc_in='[timeout s, arguments...] and [command]',
+             dtype_out=str,
+             doc_out='confirmed, sent (no confirmation), superseded, '
+                     'expired, failed or timeout')
+    async def SendAndConfirm(self, args):
+        """
+        Sends a command and waits until the status packets show that it
+        is applied, without blocking the other clients.
+        """
+        request, timeout = self._send(args)
+        await self.wait_request(request, timeout)
+        return self._request_state(request)
+
+    @command(dtype_in=(float,),
+             doc_in='[target K, tolerance K, timeout s]',
+             dtype_out=str,
+             doc_out='Why the wait ended: Reached, Timeout, Alarm: <alarm>, '
+                     'RunMode: <run mode> or NoData')
+    async def WaitForTemperature(self, args):
+        """
+        Waits until the gas temperature is within the tolerance of the
+        target, without blocking the other clients.
+        """
+        check, timeout = self._temperature_wait(args)
+        return await self.wait_for_async(check, timeout)
+
+    @command(dtype_in=(float,),
+             doc_in='[band K, hold time s, timeout s]',
+             dtype_out=str,
+             doc_out='Why the wait ended: Stable, Timeout, Alarm: <alarm>, '
+                     'RunMode: <run mode> or NoData')
+    async def WaitForStable(self, args):
+        """
+        Waits until the gas temperature stays within a band (max - min)
+        for the hold time, without blocking the other clients.
+        """
+        check, timeout = self._stable_wait(args)
+        return await self.wait_for_async(check, timeout)
+
+
+def main():
+    OxfCryo700Asyncio.run_server()
+
+
+if __name__ == '__main__':
+    main()
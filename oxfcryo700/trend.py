@@ -0,0 +1,230 @@
+"""
+Fixed-size on-disk trend store of the status packet fields, in tiers of
+decreasing resolution (like RRDtool):
+
+- raw: every status packet, for the most recent samples
+- 1min, 1h: minimum, mean and maximum of each field per minute and per
+  hour, for long spans
+
+Each tier is a ring buffer preallocated in its own file of a directory and
+updated in place with a memory map, so the disk usage is constant. The
+aggregates of the current minute/hour are kept in memory until the period
+is over.
+"""
+
+import os
+import threading
+
+import numpy
+
+# Status packet fields stored in the trends
+TREND_FIELDS = ('gas_set_point', 'gas_temp', 'gas_error', 'gas_flow',
+                'evap_temp', 'suct_temp', 'line_pressure')
+
+# (name, resolution in seconds, capacity in rows): one day of raw samples
+# at 1 Hz, 30 days of minutes and 10 years of hours
+TREND_TIERS = (('raw', 0, 86400),
+               ('1min', 60, 43200),
+               ('1h', 3600, 87600))
+
+MAGIC = int.from_bytes(b'OXFTRD01', 'little')
+# header: magic, number of fields, capacity, resolution, count, next row
+HEADER_ITEMS = 8
+MAGIC_ITEM, FIELDS_ITEM, CAPACITY_ITEM, RESOLUTION_ITEM, COUNT_ITEM, \
+    NEXT_ITEM = range(6)
+HEADER_SIZE = HEADER_ITEMS * 8
+
+
+class TrendTier:
+    """Ring buffer of rows in a preallocated file. The raw tier rows are
+    [timestamp, values...], the aggregated ones [period start, min...,
+    mean..., max...]"""
+
+    def __init__(self, filename, nfields, resolution, capacity):
+        self.filename = filename
+        self.nfields = nfields
+        self.resolution = resolution
+        self.capacity = capacity
+        self.columns = 1 + (nfields if resolution == 0 else 3 * nfields)
+        size = HEADER_SIZE + capacity * self.columns * 8
+        expected = (MAGIC, nfields, capacity, resolution)
+        if not self._valid(size, expected):
+            with open(filename, 'wb') as f:
+                f.truncate(size)
+            header = numpy.memmap(filename, dtype='<u8', mode='r+',
+                                  shape=(HEADER_ITEMS,))
+            header[:4] = expected
+            header.flush()
+        self.header = numpy.memmap(filename, dtype='<u8', mode='r+',
+                                   shape=(HEADER_ITEMS,))
+        self.rows = numpy.memmap(filename, dtype='<f8', mode='r+',
+                                 offset=HEADER_SIZE,
+                                 shape=(capacity, self.columns))
+
+    def _valid(self, size, expected):
+        """the file exists with the same layout"""
+        if not os.path.exists(self.filename) \
+                or os.path.getsize(self.filename) != size:
+            return False
+        header = numpy.fromfile(self.filename, dtype='<u8',
+                                count=HEADER_ITEMS)
+        return tuple(header[:4]) == expected
+
+    @property
+    def count(self):
+        return int(self.header[COUNT_ITEM])
+
+    def append(self, row):
+        index = int(self.header[NEXT_ITEM])
+        self.rows[index] = row
+        self.header[NEXT_ITEM] = (index + 1) % self.capacity
+        if self.header[COUNT_ITEM] < self.capacity:
+            self.header[COUNT_ITEM] += 1
+
+    def _segments(self):
+        """the rows in chronological order, as up to two slices"""
+        count = self.count
+        if count < self.capacity:
+            return [self.rows[:count]]
+        index = int(self.header[NEXT_ITEM])
+        return [self.rows[index:], self.rows[:index]]
+
+    @property
+    def start(self):
+        """timestamp of the oldest row, None if empty"""
+        segments = [s for s in self._segments() if len(s)]
+        return float(segments[0][0, 0]) if segments else None
+
+    def query(self, start, end, columns=None):
+        """copy of the rows within [start, end]"""
+        result = []
+        for segment in self._segments():
+            times = segment[:, 0]
+            first = numpy.searchsorted(times, start, 'left')
+            last = numpy.searchsorted(times, end, 'right')
+            rows = segment[first:last]
+            result.append(rows if columns is None else rows[:, columns])
+        return numpy.concatenate(result)
+
+    def flush(self):
+        self.header.flush()
+        self.rows.flush()
+
+
+class _Aggregate:
+    """min/mean/max of the current period of an aggregated tier"""
+
+    def __init__(self, tier, nfields):
+        self.tier = tier
+        self.period = None
+        self.count = 0
+        self.min = numpy.empty(nfields)
+        self.sum = numpy.empty(nfields)
+        self.max = numpy.empty(nfields)
+
+    def add(self, timestamp, values):
+        period = timestamp - timestamp % self.tier.resolution
+        if period != self.period:
+            self.flush()
+            self.period = period
+            self.count = 0
+        if self.count:
+            numpy.minimum(self.min, values, out=self.min)
+            numpy.maximum(self.max, values, out=self.max)
+            self.sum += values
+        else:
+            self.min[:] = values
+            self.max[:] = values
+            self.sum[:] = values
+        self.count += 1
+
+    def flush(self):
+        if not self.count:
+            return
+        self.tier.append(numpy.concatenate(
+            ([self.period], self.min, self.sum / self.count, self.max)))
+        self.count = 0
+
+
+class TrendStore:
+    """Multi-resolution trends of the status packet fields in a directory,
+    fed with every status packet"""
+
+    def __init__(self, directory, fields=TREND_FIELDS, tiers=TREND_TIERS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fields = tuple(fields)
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        self.tiers = []
+        self._aggregates = []
+        self._raw = None
+        for name, resolution, capacity in tiers:
+            tier = TrendTier(os.path.join(directory, name + '.trend'),
+                             len(self.fields), resolution, capacity)
+            self.tiers.append(tier)
+            if resolution == 0:
+                self._raw = tier
+            else:
+                self._aggregates.append(_Aggregate(tier, len(self.fields)))
+        # finest first
+        self.tiers.sort(key=lambda tier: tier.resolution)
+        self._values = numpy.empty(len(self.fields))
+        self._row = numpy.empty(1 + len(self.fields))
+        self._lock = threading.Lock()
+
+    def append(self, packet, timestamp):
+        values = self._values
+        for i, name in enumerate(self.fields):
+            values[i] = getattr(packet, name)
+        with self._lock:
+            if self._raw is not None:
+                self._row[0] = timestamp
+                self._row[1:] = values
+                self._raw.append(self._row)
+            for aggregate in self._aggregates:
+                aggregate.add(timestamp, values)
+
+    def select_tier(self, resolution, start=None):
+        """the finest tier with a resolution (in seconds) of at least the
+        requested one which still holds the data from start. When none
+        does, the finest one holding the oldest data (within one period
+        of the coarsest tier, the aggregates are stamped with the start of
+        their period)"""
+        candidates = [tier for tier in self.tiers
+                      if tier.resolution >= resolution] or self.tiers[-1:]
+        starts = [(tier, tier.start) for tier in candidates]
+        starts = [(tier, first) for tier, first in starts
+                  if first is not None]
+        if not starts:
+            return candidates[0]
+        if start is not None:
+            for tier, first in starts:
+                if first <= start:
+                    return tier
+        oldest = min(first for _, first in starts)
+        for tier, first in starts:
+            if first - oldest <= candidates[-1].resolution:
+                return tier
+
+    def query(self, field, start, end, resolution=0):
+        """rows [timestamp, min, mean, max] of the field within [start,
+        end] from the tier selected for the resolution and start (min, mean
+        and max are the value for the raw samples)"""
+        if field not in self._index:
+            raise ValueError("Unknown trend field: {}. Valid fields are "
+                             "{}".format(field, ', '.join(self.fields)))
+        i = self._index[field]
+        n = len(self.fields)
+        with self._lock:
+            tier = self.select_tier(resolution, start)
+            if tier.resolution == 0:
+                return tier.query(start, end, [0, 1 + i, 1 + i, 1 + i])
+            return tier.query(start, end, [0, 1 + i, 1 + n + i,
+                                           1 + 2 * n + i])
+
+    def close(self):
+        with self._lock:
+            for aggregate in self._aggregates:
+                aggregate.flush()
+            for tier in self.tiers:
+                tier.flush()
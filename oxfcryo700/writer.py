@@ -0,0 +1,200 @@
+import collections
+import threading
+import time
+
+from .oxfordcryo import CSCOMMAND
+
+# commands setting the current phase, a pending one can not be confirmed
+# anymore once a newer one is sent
+PHASE_COMMANDS = (CSCOMMAND.RAMP, CSCOMMAND.PLAT, CSCOMMAND.HOLD,
+                  CSCOMMAND.COOL, CSCOMMAND.END, CSCOMMAND.PURGE)
+
+# phase commands replaced by a newer one while waiting in the queue. End
+# and Purge are always sent
+COALESCED_COMMANDS = (CSCOMMAND.RAMP, CSCOMMAND.PLAT, CSCOMMAND.HOLD,
+                      CSCOMMAND.COOL)
+
+
+class CommandRequest:
+    """A command packet submitted to a CommandWriter.
+
+    confirm is an optional predicate on the decoded StatusPacket telling
+    when the controller has applied the command. Without it the request is
+    done as soon as the packet is written.
+    """
+    QUEUED = 'queued'
+    SENT = 'sent'
+    CONFIRMED = 'confirmed'
+    SUPERSEDED = 'superseded'
+    EXPIRED = 'expired'
+    FAILED = 'failed'
+
+    def __init__(self, packet, confirm=None):
+        self.packet = packet
+        self.confirm = confirm
+        self.state = self.QUEUED
+        self.error = None
+        self.submit_time = time.monotonic()
+        self.sent_time = None
+        self.done_time = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def __repr__(self):
+        return 'CommandRequest({}, {})'.format(list(self.packet), self.state)
+
+    @property
+    def command(self):
+        return self.packet[1]
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def latency(self):
+        """time from the submission to the confirmation (or the write)"""
+        if self.done_time is None:
+            return None
+        return self.done_time - self.submit_time
+
+    def add_done_callback(self, callback):
+        """calls callback(request) when the request is done, from the
+        thread finishing it, or now if it is already done"""
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.done_time = time.monotonic()
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def wait(self, timeout=None):
+        """waits until the command is written, and confirmed if it has a
+        confirmation. Returns True on success, False on timeout or if the
+        command was superseded, expired or failed"""
+        self._done.wait(timeout)
+        return self.state in (self.CONFIRMED, self.SENT) and self.done
+
+
+class CommandWriter:
+    """Single writer of the command packets to the serial line.
+
+    The packets are written in order by a dedicated thread from a bounded
+    queue. A Ramp, Plat, Hold or Cool command still waiting at the end of
+    the queue is replaced by a newer one of them, one waiting before other
+    commands is superseded and the newer one queued after them, so the
+    commands are applied in the order they were submitted. The requests
+    with a confirmation are completed by notify(), to be called with every
+    decoded status packet, or expire after confirm_expiry seconds.
+    """
+
+    def __init__(self, serial, maxsize=16, confirm_expiry=600.):
+        self.serial = serial
+        self.maxsize = maxsize
+        self.confirm_expiry = confirm_expiry
+        self._queue = collections.deque()
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stop = False
+        self.written = 0
+        self.coalesced = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, packet, confirm=None):
+        """queues a packet (bytes), returns its CommandRequest"""
+        request = CommandRequest(bytes(packet), confirm)
+        with self._condition:
+            if self._stop:
+                raise RuntimeError('Command writer stopped')
+            if request.command in COALESCED_COMMANDS:
+                for queued in list(self._queue):
+                    if queued.command in COALESCED_COMMANDS:
+                        self._queue.remove(queued)
+                        queued._finish(CommandRequest.SUPERSEDED)
+                        self.coalesced += 1
+            if len(self._queue) >= self.maxsize:
+                raise RuntimeError('Command queue full ({} commands '
+                                   'waiting)'.format(len(self._queue)))
+            self._queue.append(request)
+            self._condition.notify()
+        return request
+
+    def notify(self, packet, received=None):
+        """checks the pending confirmations against a new status packet,
+        received at the time.monotonic() time received (now by default).
+        The packets received before a command was written do not confirm
+        it, they may show the state it was meant to change"""
+        if not self._pending:
+            return
+        now = time.monotonic()
+        if received is None:
+            received = now
+        with self._condition:
+            pending = []
+            for request in self._pending:
+                if received > request.sent_time and request.confirm(packet):
+                    request._finish(CommandRequest.CONFIRMED)
+                elif now - request.sent_time > self.confirm_expiry:
+                    request._finish(CommandRequest.EXPIRED)
+                else:
+                    pending.append(request)
+            self._pending = pending
+
+    def stop(self, timeout=None):
+        """stops the writer thread. The queued and pending requests fail,
+        so their waiters return at once"""
+        with self._condition:
+            self._stop = True
+            requests = list(self._queue) + self._pending
+            self._queue.clear()
+            self._pending = []
+            self._condition.notify()
+        for request in requests:
+            request._finish(CommandRequest.FAILED,
+                            RuntimeError('Command writer stopped'))
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stop:
+                    self._condition.wait()
+                if self._stop:
+                    return
+                request = self._queue.popleft()
+            try:
+                self.serial.write(request.packet)
+            except Exception as e:
+                request._finish(CommandRequest.FAILED, e)
+                continue
+            self.written += 1
+            request.sent_time = time.monotonic()
+            if request.confirm is None:
+                request._finish(CommandRequest.SENT)
+                continue
+            with self._condition:
+                if self._stop:
+                    request._finish(CommandRequest.FAILED,
+                                    RuntimeError('Command writer stopped'))
+                    return
+                if request.command in PHASE_COMMANDS:
+                    # an older phase command can not be confirmed anymore
+                    for pending in self._pending:
+                        if pending.command in PHASE_COMMANDS:
+                            pending._finish(CommandRequest.SUPERSEDED)
+                    self._pending = [
+                        pending for pending in self._pending
+                        if pending.command not in PHASE_COMMANDS]
+                request.state = CommandRequest.SENT
+                self._pending.append(request)
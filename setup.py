@@ -36,16 +36,22 @@ setup(
         'Natural Language :: English',
         'Operating System :: POSIX',
         'Operating System :: Microsoft :: Windows',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
         'Topic :: Communications',
         'Topic :: Software Development :: Libraries',
     ],
     entry_points={
         'console_scripts': [
             'OxfCryo700 = oxfcryo700.tango:main',
+            'OxfCryo700Asyncio = oxfcryo700.tango_asyncio:main',
+            'OxfCryo700Simulator = oxfcryo700.simulator:main',
+            'OxfCryo700Monitor = oxfcryo700.monitor:main',
+            'OxfCryo700Analyzer = oxfcryo700.analyzer:main',
 
         ]
     },
-    install_requires=['pyserial', 'pytango'],
-    python_requires='>=3.5',
+    install_requires=['pyserial', 'pytango', 'numpy'],
+    extras_require={'benchmark': ['psutil']},
+    python_requires='>=3.7',
 )
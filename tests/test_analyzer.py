@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from oxfcryo700.analyzer import analyze, analyze_capture
+from oxfcryo700.oxfordcryo import PacketCapture, STANDARD_FORMAT
+
+START = 1.7e9
+
+
+def packet(i):
+    return STANDARD_FORMAT.pack({
+        'controller_nb': 7, 'run_mode_code': 3, 'phase_code': 1,
+        'alarm_code': 5 if 95 <= i < 105 else 0,
+        'gas_error': 2. if 90 <= i < 110 else 0.1,
+        'gas_temp': 100., 'gas_flow': 5. + i / 100.,
+        'line_pressure': 100})
+
+
+class AnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.capture = os.path.join(self.directory.name, 'test.cap')
+        self.dump = os.path.join(self.directory.name, 'test.bin')
+        capture = PacketCapture(self.capture, 'a')
+        with open(self.dump, 'wb') as dump:
+            for i in range(200):
+                capture.append(packet(i), i, START + i)
+                dump.write(packet(i))
+        capture.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_task_boundary(self):
+        whole = analyze_capture(self.capture, 0, 200, 64, 1., 10.)
+        split = analyze_capture(self.capture, 0, 100, 64, 1., 10.)
+        split.merge(analyze_capture(self.capture, 100, 200, 64, 1., 10.))
+        report = whole.controllers[7].report()
+        split_report = split.controllers[7].report()
+        drift = 'gas_flow_drift_per_day'
+        self.assertAlmostEqual(split_report.pop(drift), report.pop(drift))
+        self.assertEqual(split_report, report)
+        self.assertEqual(report['samples'], 200)
+        self.assertEqual(report['excursions'], 1)
+        self.assertEqual(sum(report['alarm_count'].values()), 1)
+        self.assertEqual(sum(report['run_mode_time'].values()), 199.)
+
+    def test_dump_start(self):
+        with self.assertRaises(ValueError):
+            analyze([self.capture, self.dump], jobs=1)
+        analysis = analyze([self.dump], jobs=1, starts=[START])
+        report = analysis.controllers[7].report()
+        self.assertEqual(report['first'], START)
+        self.assertEqual(report['last'], START + 199)
+
+
+if __name__ == '__main__':
+    unittest.main()
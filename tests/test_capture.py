@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from oxfcryo700.oxfordcryo import PacketCapture, STANDARD_FORMAT, \
+    EXTENDED_FORMAT
+
+START = 1.7e9
+
+
+def packet(i):
+    status_format = EXTENDED_FORMAT if i % 2 else STANDARD_FORMAT
+    return status_format.pack({'run_time': i % 60000, 'gas_temp': 100.})
+
+
+class PacketCaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.cap')
+        self.count = PacketCapture.GROW_RECORDS + 100
+        with PacketCapture(self.filename, 'a') as capture:
+            for i in range(self.count):
+                capture.append(packet(i), i / 10., START + i / 10.)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read(self):
+        with PacketCapture(self.filename) as capture:
+            self.assertEqual(len(capture), self.count)
+            monotonic, timestamp, raw = capture.record(4097)
+            self.assertEqual((monotonic, timestamp), (409.7, START + 409.7))
+            self.assertEqual(bytes(raw), packet(4097))
+            raw.release()
+            with self.assertRaises(IndexError):
+                capture.record(self.count)
+
+    def test_find(self):
+        with PacketCapture(self.filename) as capture:
+            self.assertEqual(capture.find(START - 1), 0)
+            self.assertEqual(capture.find(START + 300.05), 3001)
+            self.assertEqual(capture.find(START + 300.), 3000)
+            self.assertEqual(capture.find(START + 1e6), self.count)
+            self.assertEqual(capture.window(START + 10., START + 20.),
+                             range(100, 201))
+            packets = capture.packets(START + 10., START + 10.15)
+            self.assertEqual([p.run_time for _, p in packets],
+                             [100, 101])
+            self.assertEqual([p.extended for _, p in packets],
+                             [False, True])
+            view = capture.view(START, START + 0.15)
+            self.assertEqual(len(view), 2 * PacketCapture.RECORD_SIZE)
+            view.release()
+
+    def test_follow(self):
+        with PacketCapture(self.filename) as reader, \
+                PacketCapture(self.filename, 'a') as writer:
+            self.assertEqual(len(writer), self.count)
+            for i in range(self.count, self.count + 10):
+                writer.append(packet(i), i / 10., START + i / 10.)
+            reader.refresh()
+            self.assertEqual(len(reader), self.count + 10)
+            _, _, raw = reader.record(self.count + 9)
+            self.assertEqual(bytes(raw), packet(self.count + 9))
+            raw.release()
+
+    def test_not_capture(self):
+        other = os.path.join(self.directory.name, 'other')
+        with open(other, 'wb') as f:
+            f.write(bytes(100))
+        with self.assertRaises(ValueError):
+            PacketCapture(other)
+        with self.assertRaises(ValueError):
+            PacketCapture(self.filename, 'w')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+
+from oxfcryo700.oxfordcryo import StatusPacketDecoder, STANDARD_FORMAT, \
+    EXTENDED_FORMAT, decode_status_packets
+
+
+def packets(status_format, count, **values):
+    fields = dict(gas_set_point=100., gas_temp=100., run_mode_code=3,
+                  phase_code=1, target_temp=100., controller_nb=1)
+    fields.update(values)
+    return [status_format.pack(dict(fields, run_time=i))
+            for i in range(count)]
+
+
+def feed(decoder, data, chunk=None):
+    result = []
+    chunk = chunk or len(data)
+    for i in range(0, len(data), chunk):
+        result.extend(decoder.feed(data[i:i + chunk]))
+    return result
+
+
+class StatusPacketDecoderTest(unittest.TestCase):
+
+    def test_aligned(self):
+        decoder = StatusPacketDecoder()
+        raw = packets(STANDARD_FORMAT, 5)
+        decoded = feed(decoder, b''.join(raw))
+        self.assertEqual([p.raw for p in decoded], raw)
+        self.assertEqual(decoder.discarded, 0)
+        self.assertEqual(decoder.resyncs, 0)
+
+    def test_first_packet_waits_for_next_header(self):
+        decoder = StatusPacketDecoder()
+        raw = packets(STANDARD_FORMAT, 2)
+        self.assertEqual(decoder.feed(raw[0]), [])
+        decoded = decoder.feed(raw[1][:2])
+        self.assertEqual([p.raw for p in decoded], raw[:1])
+        # then the packets are returned as soon as they are complete
+        decoded = decoder.feed(raw[1][2:])
+        self.assertEqual([p.raw for p in decoded], raw[1:])
+
+    def test_byte_by_byte(self):
+        raw = packets(EXTENDED_FORMAT, 4)
+        decoded = feed(StatusPacketDecoder(), b''.join(raw), 1)
+        self.assertEqual([p.raw for p in decoded], raw)
+
+    def test_start_in_payload_header_pair(self):
+        # GasTemp 81.93 K is 0x20 0x01, a standard packet header
+        raw = packets(STANDARD_FORMAT, 6, gas_temp=81.93)
+        stream = b''.join(raw)[4:]
+        decoded = feed(StatusPacketDecoder(), stream)
+        self.assertEqual(len(decoded), 5)
+        for packet in decoded:
+            self.assertEqual(packet.gas_temp, 81.93)
+            self.assertEqual(packet.run_mode, 'Run')
+
+    def test_start_in_extended_payload_header_pair(self):
+        # GasFlow 4.2 l/min and GasHeat 2 % are 42 2, an extended header
+        raw = packets(EXTENDED_FORMAT, 6, gas_flow=4.2, gas_heat=2)
+        stream = b''.join(raw)[3:]
+        for chunk in (None, 1, 7):
+            decoded = feed(StatusPacketDecoder(), stream, chunk)
+            self.assertEqual(len(decoded), 5)
+            for packet in decoded:
+                self.assertEqual(packet.gas_flow, 4.2)
+                self.assertEqual(packet.gas_temp, 100.)
+                self.assertEqual(packet.phase, 'Cool')
+
+    def test_resync_after_garbage(self):
+        decoder = StatusPacketDecoder()
+        raw = packets(STANDARD_FORMAT, 6, gas_temp=81.93)
+        stream = b''.join(raw[:3]) + b'\x20\x01\x20' + b''.join(raw[3:])
+        decoded = feed(decoder, stream)
+        self.assertEqual([p.raw for p in decoded], raw)
+        self.assertEqual(decoder.resyncs, 1)
+        self.assertEqual(decoder.discarded, 3)
+
+    def test_truncated_packet(self):
+        decoder = StatusPacketDecoder()
+        raw = packets(STANDARD_FORMAT, 5)
+        stream = b''.join(raw[:2]) + raw[2][:10] + b''.join(raw[3:])
+        decoded = feed(decoder, stream)
+        self.assertEqual([p.raw for p in decoded], raw[:2] + raw[3:])
+        self.assertEqual(decoder.resyncs, 1)
+
+    def test_reset(self):
+        decoder = StatusPacketDecoder()
+        raw = packets(STANDARD_FORMAT, 3)
+        feed(decoder, b''.join(raw))
+        decoder.reset()
+        self.assertEqual(decoder.pending, 0)
+        decoded = feed(decoder, b''.join(raw)[5:])
+        self.assertEqual([p.raw for p in decoded], raw[1:])
+
+
+class DecodeStatusPacketsTest(unittest.TestCase):
+
+    def test_formats(self):
+        for status_format in (STANDARD_FORMAT, EXTENDED_FORMAT):
+            columns = decode_status_packets(
+                b''.join(packets(status_format, 3)))
+            self.assertEqual(list(columns['run_time']), [0, 1, 2])
+            self.assertEqual(list(columns['gas_temp']), [100.] * 3)
+
+    def test_not_aligned(self):
+        with self.assertRaises(ValueError):
+            decode_status_packets(b''.join(packets(STANDARD_FORMAT, 3))[1:])
+        # a byte missing in the middle of the buffer
+        raw = b''.join(packets(STANDARD_FORMAT, 3))
+        with self.assertRaisesRegex(ValueError, 'packet 1 '):
+            decode_status_packets(raw[:20] + raw[21:])
+
+    def test_mixed(self):
+        raw = packets(STANDARD_FORMAT, 2) + packets(EXTENDED_FORMAT, 2)
+        with self.assertRaisesRegex(ValueError, 'Mixed'):
+            decode_status_packets(b''.join(raw))
+        with self.assertRaisesRegex(ValueError, 'Mixed'):
+            decode_status_packets(b''.join(raw[:2]),
+                                  status_format=EXTENDED_FORMAT)
+
+
+if __name__ == '__main__':
+    unittest.main()
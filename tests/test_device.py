@@ -0,0 +1,298 @@
+import inspect
+import socket
+import threading
+import time
+import types
+import unittest
+
+from tango import AttrQuality, DeviceProxy, DevFailed, DevState, EventType
+from tango.server import attribute
+from tango.test_context import DeviceTestContext
+
+from oxfcryo700.oxfordcryo import STANDARD_FORMAT
+from oxfcryo700.tango import OxfCryo700, no_sync
+from oxfcryo700.tango_asyncio import OxfCryo700Asyncio
+
+PORT = 'cryosim://?rate=10&time_scale=60'
+
+
+def wait_first_packet(proxy, timeout=10.):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            proxy.read_attribute('GasTemp')
+            return
+        except DevFailed:
+            time.sleep(0.05)
+    raise RuntimeError('No status packet received')
+
+
+def wait_state(proxy, state, timeout=10.):
+    deadline = time.monotonic() + timeout
+    while proxy.state() != state and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return proxy.state()
+
+
+class Controller:
+    """TCP server standing for the controller, sending status packets
+    while sending is set"""
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(('localhost', 0))
+        self.server.listen(1)
+        self.url = 'socket://localhost:{}'.format(
+            self.server.getsockname()[1])
+        self.connections = 0
+        self.sending = threading.Event()
+        self.closed = False
+        self.packet = STANDARD_FORMAT.pack({'run_mode_code': 3,
+                                            'gas_temp': 100.})
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._send, args=(client,),
+                             daemon=True).start()
+
+    def _send(self, client):
+        connection = self.connections
+        with client:
+            while not self.closed and connection == self.connections:
+                if self.sending.is_set():
+                    try:
+                        client.sendall(self.packet)
+                    except OSError:
+                        return
+                time.sleep(0.1)
+
+    def close(self):
+        self.closed = True
+        self.server.close()
+
+
+class ServerTestContext(DeviceTestContext):
+    """runs the device server with the serial model set by main()"""
+
+    def pre_init(self):
+        no_sync()
+        super().pre_init()
+
+
+class DeviceTest(unittest.TestCase):
+    """device server tests, run against the simulator"""
+
+    device = OxfCryo700
+    properties = {}
+
+    @classmethod
+    def setUpClass(cls):
+        properties = dict(cls.properties, port=PORT)
+        cls.context = ServerTestContext(cls.device, properties=properties,
+                                        process=True)
+        cls.proxy = cls.context.__enter__()
+        cls.proxy.set_timeout_millis(10000)
+        wait_first_packet(cls.proxy)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.context.__exit__(None, None, None)
+
+    def test_send_and_confirm(self):
+        proxy = self.proxy
+        self.assertEqual(proxy.SendAndConfirm([[5.], ['Stop']]), 'confirmed')
+        self.assertEqual(proxy.RunMode, 'ShutdownOK')
+        self.assertEqual(proxy.SendAndConfirm([[5.], ['Restart']]),
+                         'confirmed')
+        self.assertEqual(proxy.SendAndConfirm([[5., 250.], ['Cool']]),
+                         'confirmed')
+        self.assertEqual(proxy.TargetTemp, 250.)
+        self.assertEqual(
+            proxy.SendAndConfirm([[5., 360., 260.123], ['Ramp']]),
+            'confirmed')
+        self.assertEqual(proxy.SendAndConfirm([[5.], ['Resume']]), 'sent')
+        for args in ([[5.], ['Cool']], [[5., 1.], ['Bogus']],
+                     [[5., 20.], ['Cool']], [[], ['Stop']]):
+            with self.assertRaises(DevFailed):
+                proxy.SendAndConfirm(args)
+
+    def test_snapshot(self):
+        fields = list(self.proxy.StatusSnapshotFields)
+        # with the rate of the simulator several packets arrive during
+        # the reads: all the attributes of a request come from one packet
+        for _ in range(20):
+            snapshot, gas_temp, set_point, run_time = \
+                self.proxy.read_attributes(['StatusSnapshot', 'GasTemp',
+                                            'GasSetPoint', 'RunTime'])
+            timestamp = snapshot.time.totime()
+            self.assertAlmostEqual(
+                snapshot.value[fields.index('timestamp')], timestamp,
+                delta=1e-5)
+            for attr in (gas_temp, set_point, run_time):
+                self.assertEqual(attr.time.totime(), timestamp)
+            self.assertEqual(snapshot.value[fields.index('gas_temp')],
+                             gas_temp.value)
+            self.assertEqual(
+                snapshot.value[fields.index('gas_set_point')],
+                set_point.value)
+
+    def test_change_events(self):
+        values = []
+
+        def received(event):
+            if not event.err:
+                values.append(event.attr_value.value)
+
+        event_id = self.proxy.subscribe_event(
+            'RunMode', EventType.CHANGE_EVENT, received)
+        try:
+            self.proxy.SendAndConfirm([[5.], ['Stop']])
+            self.proxy.SendAndConfirm([[5.], ['Restart']])
+            deadline = time.monotonic() + 5.
+            while values[-2:] != ['ShutdownOK', 'Run'] \
+                    and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            self.proxy.unsubscribe_event(event_id)
+        # the value when subscribing, then the pushed changes
+        self.assertEqual(values[1:], ['ShutdownOK', 'Run'])
+
+    def test_wait_commands(self):
+        proxy = self.proxy
+        proxy.SendAndConfirm([[5.], ['Restart']])
+        gas_temp = proxy.GasTemp
+        self.assertEqual(proxy.WaitForTemperature([gas_temp, 50., 5.]),
+                         'Reached')
+        self.assertEqual(proxy.WaitForStable([100., 0.5, 5.]), 'Stable')
+        # the simulated temperature is noisy
+        self.assertEqual(proxy.WaitForStable([0., 0.5, 1.]), 'Timeout')
+        for command in ('WaitForTemperature', 'WaitForStable'):
+            with self.assertRaises(DevFailed):
+                proxy.command_inout(command, [1., 2.])
+
+    def test_wait_does_not_block_reads(self):
+        results = []
+
+        def wait():
+            proxy = DeviceProxy(self.context.get_device_access())
+            proxy.set_timeout_millis(10000)
+            # the simulator can not reach the target within the timeout
+            results.append(proxy.WaitForTemperature([400., 0.01, 3.]))
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.5)
+        t0 = time.monotonic()
+        self.proxy.read_attribute('GasTemp')
+        self.assertLess(time.monotonic() - t0, 1.)
+        waiter.join()
+        self.assertEqual(results, ['Timeout'])
+
+
+class AsyncioDeviceTest(DeviceTest):
+
+    device = OxfCryo700Asyncio
+
+    def test_coroutines(self):
+        for name, member in vars(OxfCryo700Asyncio).items():
+            if isinstance(member, attribute):
+                self.assertTrue(inspect.iscoroutinefunction(member.fget),
+                                name)
+            elif hasattr(member, '__tango_command__'):
+                self.assertTrue(
+                    inspect.iscoroutinefunction(member.__wrapped__), name)
+
+    def test_init_ends_waits(self):
+        results = []
+
+        def wait():
+            proxy = DeviceProxy(self.context.get_device_access())
+            proxy.set_timeout_millis(10000)
+            results.append(proxy.WaitForTemperature([400., 0.01, 8.]))
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.5)
+        t0 = time.monotonic()
+        self.proxy.Init()
+        waiter.join()
+        self.assertLess(time.monotonic() - t0, 2.)
+        self.assertEqual(results, ['NoData'])
+        wait_first_packet(self.proxy)
+
+
+class DeadbandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = types.SimpleNamespace(
+            deadbands=OxfCryo700._parse_deadbands(
+                ['GasTemp 0.05', 'GasFlow 0 10', 'GasError 0']))
+
+    def changed(self, name, last, value):
+        return OxfCryo700._changed(self.device, name, last, value)
+
+    def test_parse(self):
+        self.assertEqual(self.device.deadbands,
+                         {'GasTemp': (0.05, 0.), 'GasFlow': (0., 10.),
+                          'GasError': (0., 0.)})
+        for lines in (['Bogus 1'], ['GasTemp'], ['GasTemp 1 2 3']):
+            with self.assertRaises(ValueError):
+                OxfCryo700._parse_deadbands(lines)
+
+    def test_changed(self):
+        self.assertFalse(self.changed('GasTemp', 100., 100.04))
+        self.assertTrue(self.changed('GasTemp', 100., 100.06))
+        # relative deadband in %
+        self.assertFalse(self.changed('GasFlow', 5., 5.4))
+        self.assertTrue(self.changed('GasFlow', 5., 5.6))
+        # a deadband of 0 is disabled: every change is pushed
+        self.assertTrue(self.changed('GasError', 0., 0.01))
+        self.assertFalse(self.changed('GasError', 0.01, 0.01))
+        # no deadband for the other attributes
+        self.assertTrue(self.changed('EvapTemp', 80., 80.01))
+        self.assertTrue(self.changed('Phase', 'Cool', 'Hold'))
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = Controller()
+        properties = {'port': self.controller.url, 'StaleTimeout': 1.,
+                      'ReconnectDelay': 0.5}
+        self.context = ServerTestContext(OxfCryo700, properties=properties,
+                                         process=True)
+        self.proxy = self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.controller.close()
+
+    def test_stale_reconnect(self):
+        proxy, controller = self.proxy, self.controller
+        self.assertEqual(proxy.state(), DevState.INIT)
+        controller.sending.set()
+        self.assertEqual(wait_state(proxy, DevState.ON), DevState.ON)
+        connections = controller.connections
+        # no packets anymore: stale data, then the port is reopened
+        controller.sending.clear()
+        self.assertEqual(wait_state(proxy, DevState.FAULT), DevState.FAULT)
+        self.assertEqual(proxy.read_attribute('GasTemp').quality,
+                         AttrQuality.ATTR_INVALID)
+        deadline = time.monotonic() + 10.
+        while controller.connections == connections \
+                and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(controller.connections, connections + 1)
+        controller.sending.set()
+        self.assertEqual(wait_state(proxy, DevState.ON), DevState.ON)
+        self.assertEqual(proxy.read_attribute('GasTemp').value, 100.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from oxfcryo700.history import StatusHistory
+from oxfcryo700.oxfordcryo import StatusPacket, STANDARD_FORMAT
+
+
+def packet(gas_temp):
+    return StatusPacket(STANDARD_FORMAT.pack({'gas_temp': gas_temp}))
+
+
+class StatusHistoryTest(unittest.TestCase):
+
+    def test_ordered(self):
+        history = StatusHistory(3, ('gas_temp',))
+        for count in range(1, 8):
+            history.append(packet(100. + count), float(count))
+            expected = [float(i) for i in range(max(1, count - 2),
+                                                count + 1)]
+            self.assertEqual(list(history.get_timestamps()), expected)
+            self.assertEqual(list(history.get('gas_temp')),
+                             [100. + t for t in expected])
+            self.assertEqual(len(history.query(0, 10)), len(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
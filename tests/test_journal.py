@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from oxfcryo700.journal import TransitionJournal, Transition, \
+    transition_text, RECORD
+
+
+class TransitionJournalTest(unittest.TestCase):
+
+    def test_transitions(self):
+        journal = TransitionJournal(3)
+        self.assertEqual(journal.update(1., (0, 0, 0, 0)), [])
+        self.assertEqual(journal.update(2., (0, 0, 0, 0)), [])
+        transitions = journal.update(3., (3, 1, 0, 1))
+        self.assertEqual(transitions,
+                         [Transition(3., 'RunMode', 0, 3),
+                          Transition(3., 'Phase', 0, 1),
+                          Transition(3., 'TurboMode', 0, 1)])
+        self.assertEqual(transition_text(transitions[1]),
+                         'Phase Ramp -> Cool')
+        self.assertEqual(transition_text(Transition(0., 'Phase', 0, 99)),
+                         'Phase Ramp -> Unknown(99)')
+        journal.update(4., (3, 3, 0, 1))
+        # bounded to the size, the count keeps growing
+        self.assertEqual(journal.count, 4)
+        self.assertEqual([t.timestamp for t in journal.last(10)],
+                         [3., 3., 4.])
+        self.assertEqual(journal.query(3., 3., ['Phase']),
+                         [Transition(3., 'Phase', 0, 1)])
+        with self.assertRaises(ValueError):
+            TransitionJournal(0)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'journal')
+            journal = TransitionJournal(4, filename)
+            for i in range(20):
+                journal.update(float(i), (3, i % 2, 0, 0))
+            journal.close()
+            # compacted to at most twice the size
+            self.assertLessEqual(os.path.getsize(filename),
+                                 8 * RECORD.size)
+            reloaded = TransitionJournal(4, filename)
+            self.assertEqual(list(reloaded.entries), list(journal.entries))
+            self.assertEqual(reloaded.last(1)[0].timestamp, 19.)
+            reloaded.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import collections
+import unittest
+import urllib.request
+
+from oxfcryo700.metrics import MetricsServer, ReaderMetrics, JITTER_BINS
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MetricsServer(0)
+        self.port = self.server.httpd.server_address[1]
+        self.server.metrics['a/b/1'] = first = ReaderMetrics()
+        self.server.metrics['a/b/2'] = second = ReaderMetrics()
+        # one regular interval after the first one: a null jitter
+        for i in range(3):
+            first.add_chunk(10, 1, 0.001, 10. + i)
+        second.add_chunk(20, 2, 0.001, 10.)
+
+    def tearDown(self):
+        self.server.httpd.shutdown()
+        self.server.httpd.server_close()
+
+    def test_render_devices(self):
+        url = 'http://localhost:{}/metrics'.format(self.port)
+        with urllib.request.urlopen(url) as response:
+            text = response.read().decode()
+        lines = text.splitlines()
+        # every family is described once, before its samples
+        comments = [line for line in lines if line.startswith('#')]
+        self.assertEqual(len(comments), len(set(comments)))
+        families = collections.Counter(
+            line.split()[2] for line in comments if line.startswith('# TYPE'))
+        self.assertEqual(set(families.values()), {1})
+        self.assertIn('oxfcryo700_packets_total{device="a/b/1"} 3', lines)
+        self.assertIn('oxfcryo700_packets_total{device="a/b/2"} 2', lines)
+        start = lines.index('# TYPE oxfcryo700_jitter_seconds histogram')
+        expected = []
+        for device, count in (1, 1), (2, 0):
+            labels = 'device="a/b/{}"'.format(device)
+            expected += [
+                'oxfcryo700_jitter_seconds_bucket{{{},le="{}"}} {}'.format(
+                    labels, edge, count)
+                for edge in JITTER_BINS + ('+Inf',)]
+            expected += [
+                'oxfcryo700_jitter_seconds_sum{{{}}} 0.0'.format(labels),
+                'oxfcryo700_jitter_seconds_count{{{}}} {}'.format(
+                    labels, count)]
+        self.assertEqual(lines[start + 1:], expected)
+        # the samples of a family are grouped
+        names = [line.split('{')[0] for line in lines
+                 if not line.startswith('#')]
+        self.assertEqual(names[:4], ['oxfcryo700_packets_total'] * 2
+                         + ['oxfcryo700_skipped_packets_total'] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
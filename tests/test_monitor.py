@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+import unittest
+
+from oxfcryo700.monitor import parse_command, command_params
+from oxfcryo700.oxfordcryo import CSCOMMAND, command_packet
+
+
+class MonitorTest(unittest.TestCase):
+
+    def test_commands(self):
+        self.assertEqual(command_params('Ramp 360 250.5'),
+                         [CSCOMMAND.RAMP, 360, 25050])
+        self.assertEqual(parse_command('cool 100'),
+                         command_packet(CSCOMMAND.COOL, 10000))
+        self.assertEqual(parse_command('Stop'),
+                         command_packet(CSCOMMAND.STOP))
+        for line in ('', 'Bogus', 'Cool', 'Stop 1'):
+            with self.assertRaises(ValueError):
+                parse_command(line)
+
+    def test_lazy_imports(self):
+        # the protocol classes are available without importing pytango
+        code = ('import sys, oxfcryo700; oxfcryo700.StatusPacket; '
+                'oxfcryo700.CryostreamSimulator; '
+                'print("tango" in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+    def test_cli(self):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'oxfcryo700.monitor',
+             'cryosim://?rate=50', '--format', 'json', '--count', '3',
+             '--fields', 'gas_temp', 'phase', '--command', 'Cool 250'],
+            timeout=30)
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(set(lines[0]), {'gas_temp', 'phase'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import socket
+import threading
+import time
+import unittest
+
+import serial
+
+from oxfcryo700.multiplexer import SerialMultiplexer
+
+
+class Port:
+    """TCP server standing for a serial line, opened with socket://"""
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(('localhost', 0))
+        self.server.listen(1)
+        self.url = 'socket://localhost:{}'.format(
+            self.server.getsockname()[1])
+        self.client = None
+
+    def open(self):
+        port = serial.serial_for_url(self.url, timeout=0.5)
+        self.client, _ = self.server.accept()
+        return port
+
+    def send(self, data):
+        self.client.sendall(data)
+
+    def kill(self):
+        self.client.close()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+
+
+class Reader:
+
+    def __init__(self):
+        self.data = bytearray()
+        self.errors = []
+        self.failed = threading.Event()
+
+    def callback(self, data, timestamp):
+        self.data.extend(data)
+
+    def error(self, error):
+        self.errors.append(error)
+        self.failed.set()
+
+    def wait_data(self, size, timeout=2.):
+        deadline = time.monotonic() + timeout
+        while len(self.data) < size and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.data) >= size
+
+
+class SerialMultiplexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.multiplexer = SerialMultiplexer()
+        self.ports = [Port(), Port()]
+
+    def tearDown(self):
+        for port in self.ports:
+            port.close()
+
+    def test_kill_and_restore_port(self):
+        port, other = self.ports
+        serial_port, other_serial = port.open(), other.open()
+        reader, other_reader = Reader(), Reader()
+        channel = self.multiplexer.register(serial_port, reader.callback,
+                                            reader.error)
+        other_channel = self.multiplexer.register(
+            other_serial, other_reader.callback, other_reader.error)
+        port.send(b'abc')
+        self.assertTrue(reader.wait_data(3))
+
+        # the remote end goes away: the channel is removed and reported
+        port.kill()
+        self.assertTrue(reader.failed.wait(2.))
+        # the device closes the port before unregistering the channel
+        serial_port.close()
+        self.multiplexer.unregister(channel)
+
+        # a port closed while still registered
+        other2 = Port()
+        self.ports.append(other2)
+        closed_serial = other2.open()
+        closed_reader = Reader()
+        closed_channel = self.multiplexer.register(
+            closed_serial, closed_reader.callback, closed_reader.error)
+        other2.send(b'x')
+        self.assertTrue(closed_reader.wait_data(1))
+        closed_serial.close()
+        self.multiplexer.unregister(closed_channel)
+
+        # the port comes back and the other devices kept reading
+        serial_port = port.open()
+        reader = Reader()
+        channel = self.multiplexer.register(serial_port, reader.callback,
+                                            reader.error)
+        port.send(b'defg')
+        other.send(b'hij')
+        self.assertTrue(reader.wait_data(4))
+        self.assertTrue(other_reader.wait_data(3))
+        self.assertEqual(bytes(reader.data), b'defg')
+        self.assertEqual(bytes(other_reader.data), b'hij')
+        self.assertTrue(self.multiplexer._thread.is_alive())
+        self.assertEqual(other_reader.errors, [])
+        self.multiplexer.unregister(channel)
+        self.multiplexer.unregister(other_channel)
+        serial_port.close()
+        other_serial.close()
+
+    def test_slow_device(self):
+        port, other = self.ports
+        serial_port, other_serial = port.open(), other.open()
+        slow, fast = Reader(), Reader()
+        calls = []
+
+        def slow_callback(data, timestamp):
+            time.sleep(1.)
+            slow.callback(data, timestamp)
+
+        def decode(data, timestamp):
+            calls.append(len(data))
+            return [bytes(data)]
+
+        def fast_callback(items, timestamp):
+            for item in items:
+                fast.callback(item, timestamp)
+
+        slow_channel = self.multiplexer.register(serial_port, slow_callback)
+        fast_channel = self.multiplexer.register(other_serial, fast_callback,
+                                                 decode=decode)
+        port.send(b'a')
+        time.sleep(0.1)
+        # the slow device does not delay the reads of the other one, which
+        # are read at once and not byte by byte
+        t0 = time.monotonic()
+        other.send(b'x' * 100)
+        self.assertTrue(fast.wait_data(100, 0.5))
+        self.assertLess(time.monotonic() - t0, 0.5)
+        self.assertEqual(calls, [100])
+        self.assertTrue(slow.wait_data(1))
+        self.multiplexer.unregister(slow_channel)
+        self.multiplexer.unregister(fast_channel)
+        serial_port.close()
+        other_serial.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from oxfcryo700.oxfordcryo import StatusPacket, STANDARD_FORMAT, \
+    EXTENDED_FORMAT, EXTENDED_ONLY_NAMES, STATUS_FORMATS, turbo_state
+
+
+class StatusFormatTest(unittest.TestCase):
+
+    def test_layouts(self):
+        self.assertEqual(STANDARD_FORMAT.length, 32)
+        self.assertEqual(EXTENDED_FORMAT.length, 42)
+        self.assertEqual(STATUS_FORMATS, {32: STANDARD_FORMAT,
+                                          42: EXTENDED_FORMAT})
+        # the standard fields are first in the extended format
+        self.assertEqual(
+            EXTENDED_FORMAT.names[:len(STANDARD_FORMAT.names)],
+            STANDARD_FORMAT.names)
+        self.assertEqual(EXTENDED_FORMAT.offsets['turbo_mode'], 32)
+        self.assertEqual(EXTENDED_FORMAT.offsets['total_hours'], 40)
+
+    def test_round_trip(self):
+        values = {'gas_set_point': 123.45, 'gas_temp': 100.5,
+                  'gas_error': -1.25, 'gas_flow': 4.2, 'run_mode_code': 3,
+                  'phase_code': 2, 'alarm_code': 5, 'run_time': 1234,
+                  'turbo_mode': 1, 'shutter_state': 1, 'time_to_fill': 90,
+                  'total_hours': 40000}
+        for status_format in (STANDARD_FORMAT, EXTENDED_FORMAT):
+            packet = StatusPacket(status_format.pack(values))
+            self.assertIs(packet.format, status_format)
+            self.assertEqual(packet.length, status_format.length)
+            self.assertEqual(packet.type, status_format.type)
+            for name in ('gas_set_point', 'gas_temp', 'gas_error',
+                         'gas_flow', 'run_time'):
+                self.assertEqual(getattr(packet, name), values[name])
+            self.assertEqual(packet.run_mode, 'Run')
+            self.assertEqual(packet.phase, 'Plat')
+
+    def test_extended_fields(self):
+        values = {'gas_flow': 2., 'phase_code': 0, 'turbo_mode': 1,
+                  'time_to_fill': 90, 'total_hours': 40000}
+        standard = StatusPacket(STANDARD_FORMAT.pack(values))
+        extended = StatusPacket(EXTENDED_FORMAT.pack(values))
+        self.assertFalse(standard.extended)
+        self.assertTrue(extended.extended)
+        for name in EXTENDED_ONLY_NAMES:
+            self.assertIsNone(getattr(standard, name))
+        self.assertEqual(extended.time_to_fill, 90)
+        self.assertEqual(extended.total_hours, 40000)
+        # the turbo mode is sent in the extended format, estimated from
+        # the gas flow otherwise
+        self.assertTrue(turbo_state(extended))
+        self.assertFalse(turbo_state(standard))
+        self.assertIn('total hours: 40000', repr(extended))
+
+    def test_wrong_length(self):
+        with self.assertRaises(ValueError):
+            StatusPacket(bytes([33, 1]) + bytes(31))
+        with self.assertRaises(ValueError):
+            StatusPacket(STANDARD_FORMAT.pack({})[:20])
+
+
+class StatusPacketTest(unittest.TestCase):
+
+    def test_lazy_decoding(self):
+        raw = STANDARD_FORMAT.pack({'gas_temp': 100., 'alarm_code': 9})
+        packet = StatusPacket(bytearray(raw) + b'extra', 12.5)
+        # the raw bytes are kept, the fields decoded on the first access
+        self.assertEqual(packet.raw, raw)
+        self.assertIsNone(packet._values)
+        self.assertEqual(packet.gas_temp, 100.)
+        self.assertIsNotNone(packet._values)
+        self.assertEqual(packet.timestamp, 12.5)
+        self.assertFalse(hasattr(packet, '__dict__'))
+        with self.assertRaises(AttributeError):
+            packet.other = 1
+
+    def test_codes(self):
+        packet = StatusPacket(STANDARD_FORMAT.pack(
+            {'run_mode_code': 5, 'phase_code': 3, 'alarm_code': 9}))
+        self.assertEqual(packet.run_mode, 'ShutdownOK')
+        self.assertEqual(packet.phase, 'Hold')
+        self.assertEqual(packet.alarm, 'AlarmConditionLowFlow')
+        # the names are shared, not built for every packet
+        self.assertIs(packet.phase, StatusPacket.PHASE_CODES[3])
+        unknown = StatusPacket(STANDARD_FORMAT.pack({'phase_code': 99}))
+        self.assertEqual(unknown.phase, 'Unknown(99)')
+
+
+if __name__ == '__main__':
+    unittest.main()
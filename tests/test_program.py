@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from oxfcryo700.oxfordcryo import StatusPacket, STANDARD_FORMAT
+from oxfcryo700.program import ProgramPhase, ProgramExecutor
+from oxfcryo700.writer import CommandWriter
+
+
+def packet(phase, set_point, run_mode='Run', target=None):
+    return StatusPacket(STANDARD_FORMAT.pack({
+        'run_mode_code': StatusPacket.RUNMODE_CODES.index(run_mode),
+        'phase_code': StatusPacket.PHASE_CODES.index(phase),
+        'gas_set_point': set_point, 'gas_temp': set_point,
+        'target_temp': set_point if target is None else target}))
+
+
+class Serial:
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+
+class ProgramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serial = Serial()
+        self.writer = CommandWriter(self.serial)
+
+    def tearDown(self):
+        self.writer.stop(1.)
+
+    def update(self, executor, status):
+        """waits for the command to be written, then feeds the packet"""
+        deadline = time.monotonic() + 1.
+        while executor.request.state == executor.request.QUEUED \
+                and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.writer.notify(status)
+        executor.update(status)
+
+    def test_parse(self):
+        phase = ProgramPhase.parse('Ramp 360 250.5')
+        self.assertEqual(phase.command()[1:], [360, 25050])
+        for line in ('Bogus 1', 'Cool', 'Cool 20', 'Ramp 360'):
+            with self.assertRaises(ValueError):
+                ProgramPhase.parse(line)
+
+    def test_steps(self):
+        phases = [ProgramPhase.parse(line)
+                  for line in ('Cool 280.123', 'Plat 1', 'End 360')]
+        executor = ProgramExecutor(phases, self.writer.submit)
+        executor.start(packet('Hold', 294.))
+        self.assertEqual(executor.index, 0)
+        self.update(executor, packet('Cool', 290., target=280.12))
+        self.assertTrue(executor.phase_started)
+        # the controller holds the target as sent, rounded to 0.01 K
+        self.update(executor, packet('Hold', 280.12))
+        self.assertEqual(executor.index, 1)
+        self.update(executor, packet('Plat', 280.12))
+        self.assertEqual(executor.index, 1)
+        self.update(executor, packet('Hold', 280.12))
+        self.assertEqual(executor.index, 2)
+        self.assertEqual(executor.state, executor.RUNNING)
+        self.assertEqual([data[1] for data in self.serial.written][:2],
+                         [phases[0].command()[0], phases[1].command()[0]])
+
+    def test_run_mode_failure(self):
+        executor = ProgramExecutor([ProgramPhase.parse('Cool 200')],
+                                   self.writer.submit)
+        executor.start(packet('Hold', 294.))
+        self.update(executor, packet('Hold', 294., 'ShutdownOK'))
+        self.assertEqual(executor.state, executor.FAILED)
+
+
+if __name__ == '__main__':
+    unittest.main()
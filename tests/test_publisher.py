@@ -0,0 +1,36 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from oxfcryo700.publisher import PacketPublisher
+
+
+class PacketPublisherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'publisher.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replaces_stale_socket(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        publisher = PacketPublisher(self.path)
+        publisher.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_keeps_other_files(self):
+        with open(self.path, 'w') as f:
+            f.write('data')
+        with self.assertRaises(ValueError):
+            PacketPublisher(self.path)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+from multiprocessing import resource_tracker, shared_memory
+
+from oxfcryo700.oxfordcryo import SharedPacketWriter, SharedPacketReader, \
+    STANDARD_FORMAT, EXTENDED_FORMAT
+
+
+class SharedPacketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'oxfcryo700-test-{}'.format(os.getpid())
+        self.writer = SharedPacketWriter(self.name)
+
+    def tearDown(self):
+        self.writer.unlink()
+        self.writer.close()
+
+    def test_read(self):
+        with SharedPacketReader(self.name) as reader:
+            self.assertEqual(reader.read(), (0, None))
+            self.writer.write(STANDARD_FORMAT.pack({'gas_temp': 100.}), 1.)
+            self.writer.write(EXTENDED_FORMAT.pack(
+                {'gas_temp': 101., 'total_hours': 5}), 2.)
+            sequence, packet = reader.read()
+            self.assertEqual(sequence, 2)
+            self.assertEqual((packet.timestamp, packet.gas_temp,
+                              packet.total_hours), (2., 101., 5))
+
+    def test_restart(self):
+        self.writer.write(STANDARD_FORMAT.pack({'gas_temp': 100.}), 1.)
+        self.writer.close()
+        # a new writer keeps the sequence of the segment
+        self.writer = SharedPacketWriter(self.name)
+        self.writer.write(STANDARD_FORMAT.pack({'gas_temp': 102.}), 3.)
+        with SharedPacketReader(self.name) as reader:
+            self.assertEqual(reader.sequence, 2)
+            self.assertEqual(reader.read()[1].gas_temp, 102.)
+
+    def test_not_packet_segment(self):
+        other = shared_memory.SharedMemory(self.name + '-other', create=True,
+                                           size=SharedPacketReader.SIZE)
+        try:
+            with self.assertRaises(ValueError):
+                SharedPacketReader(other.name)
+        finally:
+            other.close()
+            # untracked by the reader
+            resource_tracker.register(other._name, 'shared_memory')
+            other.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
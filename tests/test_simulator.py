@@ -0,0 +1,94 @@
+import time
+import unittest
+
+import serial
+
+from oxfcryo700.oxfordcryo import StatusPacket, StatusPacketDecoder, \
+    CSCOMMAND, command_packet
+from oxfcryo700.simulator import CryostreamModel, CryostreamSimulator
+
+# allow to open the in-process simulator
+if 'oxfcryo700' not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append('oxfcryo700')
+
+
+def status(model):
+    return StatusPacket(model.packet())
+
+
+class CryostreamModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = CryostreamModel()
+        self.model.NOISE = 0.
+
+    def run_model(self, seconds, dt=1.):
+        for _ in range(int(seconds / dt)):
+            self.model.step(dt)
+
+    def test_cool_then_hold(self):
+        self.model.command(command_packet(CSCOMMAND.COOL, 28400))
+        packet = status(self.model)
+        self.assertEqual((packet.phase, packet.target_temp), ('Cool', 284.))
+        # 10 K at 360 K/h
+        self.run_model(101.)
+        packet = status(self.model)
+        self.assertEqual((packet.phase, packet.gas_set_point),
+                         ('Hold', 284.))
+        self.run_model(60.)
+        self.assertAlmostEqual(status(self.model).gas_temp, 284., 1)
+
+    def test_stop_ignores_phase_commands(self):
+        self.model.command(command_packet(CSCOMMAND.STOP))
+        self.model.command(command_packet(CSCOMMAND.COOL, 20000))
+        packet = status(self.model)
+        self.assertEqual(packet.run_mode, 'ShutdownOK')
+        self.assertEqual(packet.alarm, 'AlarmConditionStopCommand')
+        self.assertEqual(packet.phase, 'Hold')
+        self.model.command(command_packet(CSCOMMAND.RESTART))
+        self.assertEqual(status(self.model).run_mode, 'Run')
+
+    def test_plat_and_extended(self):
+        self.model.command(command_packet(CSCOMMAND.PLAT, 2))
+        self.assertEqual(status(self.model).remaining, 2)
+        self.run_model(121.)
+        self.assertEqual(status(self.model).phase, 'Hold')
+        self.model.command(command_packet(CSCOMMAND.SETSTATUSFORMAT, 1))
+        self.model.command(command_packet(CSCOMMAND.TURBO, 1))
+        packet = status(self.model)
+        self.assertTrue(packet.extended)
+        self.assertEqual(packet.turbo_mode, 1)
+
+
+class CryostreamSimulatorTest(unittest.TestCase):
+
+    def test_feed(self):
+        simulator = CryostreamSimulator()
+        data = bytes([0xff]) + command_packet(CSCOMMAND.COOL, 25000) \
+            + command_packet(CSCOMMAND.RAMP, 360, 26000)
+        # commands split across reads, with a garbage byte first
+        simulator.feed(data[:4])
+        simulator.feed(data[4:])
+        self.assertEqual(simulator.commands_received, 2)
+        self.assertEqual(simulator.model.target, 260.)
+        self.assertEqual(simulator.model.rate, 360)
+
+    def test_url(self):
+        port = serial.serial_for_url('cryosim://?rate=50&time_scale=60',
+                                     timeout=0.1)
+        try:
+            decoder = StatusPacketDecoder()
+            port.write(command_packet(CSCOMMAND.COOL, 25000))
+            packets = []
+            deadline = time.monotonic() + 5.
+            while time.monotonic() < deadline and not any(
+                    p.phase == 'Cool' for p in packets):
+                packets.extend(decoder.feed(port.read(64)))
+            self.assertEqual(packets[-1].phase, 'Cool')
+            self.assertEqual(packets[-1].target_temp, 250.)
+        finally:
+            port.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import math
+import random
+import types
+import unittest
+
+import numpy
+
+from oxfcryo700.statistics import RunningStatistics, StatusStatistics
+
+
+def expected(samples):
+    t, y = numpy.array(samples).T
+    slope = 3600. * numpy.polyfit(t, y, 1)[0]
+    return y.mean(), y.std(ddof=1), y.min(), y.max(), slope
+
+
+class RunningStatisticsTest(unittest.TestCase):
+
+    def test_window(self):
+        rng = random.Random(1)
+        statistics = RunningStatistics(10.)
+        samples = []
+        # long enough for the periodic recomputation
+        for i in range(3000):
+            t = i * 0.1
+            y = 100. + 0.01 * t + rng.gauss(0., 0.5)
+            statistics.add(t, y)
+            samples.append((t, y))
+            if i % 250 == 249:
+                window = [s for s in samples if s[0] >= t - 10.]
+                self.assertEqual(statistics.count, len(window))
+                for value, reference in zip(statistics.values(),
+                                            expected(window)):
+                    self.assertAlmostEqual(value, reference, 6)
+
+    def test_few_samples(self):
+        statistics = RunningStatistics(10.)
+        self.assertTrue(all(math.isnan(v) for v in statistics.values()))
+        statistics.add(0., 5.)
+        mean, std, low, high, slope = statistics.values()
+        self.assertEqual((mean, std, low, high), (5., 0., 5., 5.))
+        self.assertTrue(math.isnan(slope))
+        # the samples leave the window
+        statistics.add(20., 7.)
+        self.assertEqual(statistics.count, 1)
+        self.assertEqual(statistics.values()[:4], (7., 0., 7., 7.))
+        statistics.clear()
+        self.assertEqual(statistics.count, 0)
+
+
+class StatusStatisticsTest(unittest.TestCase):
+
+    def test_fields(self):
+        statistics = StatusStatistics([1., 10.])
+        for i in range(20):
+            statistics.append(types.SimpleNamespace(
+                gas_temp=100. + i, gas_error=0., gas_flow=5.), i * 0.5)
+        rows = statistics.get('gas_temp')
+        self.assertEqual(len(rows), 2)
+        # 1 s window: the last 3 samples
+        self.assertEqual(rows[0][:4], (118., 1., 117., 119.))
+        self.assertAlmostEqual(rows[0][4], 7200.)
+        self.assertEqual(rows[1][2:4], (100., 119.))
+        self.assertEqual(statistics.get('gas_flow')[1][:2], (5., 0.))
+        with self.assertRaises(ValueError):
+            StatusStatistics([0.])
+
+
+if __name__ == '__main__':
+    unittest.main()
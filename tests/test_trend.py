@@ -0,0 +1,49 @@
+import tempfile
+import types
+import unittest
+
+from oxfcryo700.trend import TrendStore
+
+TIERS = (('raw', 0, 100), ('1min', 60, 10), ('1h', 3600, 100))
+
+
+class TrendStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = TrendStore(self.directory.name, ('gas_temp',), TIERS)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def append(self, start, count):
+        for t in range(start, start + count):
+            self.store.append(types.SimpleNamespace(gas_temp=float(t)), t)
+
+    def test_new_store(self):
+        self.append(36000 + 1800, 50)
+        self.assertEqual(len(self.store.query('gas_temp', 0, 1e9, 0)), 50)
+        self.assertEqual(self.store.select_tier(0, 0).resolution, 0)
+        self.assertEqual(self.store.select_tier(30, 0).resolution, 60)
+
+    def test_retention(self):
+        start = 36000
+        self.append(start, 3 * 3600)
+        now = start + 3 * 3600
+        # the raw tier holds the last 100 s, the minutes the last 10 min
+        self.assertEqual(self.store.select_tier(0, now - 50).resolution, 0)
+        self.assertEqual(self.store.select_tier(0, now - 300).resolution,
+                         60)
+        self.assertEqual(self.store.select_tier(0, start).resolution, 3600)
+        self.assertEqual(self.store.select_tier(60, start).resolution,
+                         3600)
+        rows = self.store.query('gas_temp', start, now, 60)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][0], start)
+        self.assertEqual(rows[0][1], start)
+        self.assertEqual(rows[0][3], start + 3599)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+
+from oxfcryo700.oxfordcryo import CSCOMMAND, StatusPacket, STANDARD_FORMAT, \
+    command_confirmation
+from oxfcryo700.writer import CommandRequest, CommandWriter
+
+
+def command(cmd):
+    return bytes([2, cmd])
+
+
+def packet(phase, set_point, target=None):
+    return StatusPacket(STANDARD_FORMAT.pack({
+        'run_mode_code': StatusPacket.RUNMODE_CODES.index('Run'),
+        'phase_code': StatusPacket.PHASE_CODES.index(phase),
+        'gas_set_point': set_point,
+        'target_temp': set_point if target is None else target}))
+
+
+class Serial:
+    """serial line blocking each write until allowed"""
+
+    def __init__(self):
+        self.written = []
+        self.writing = threading.Semaphore(0)
+        self.permits = threading.Semaphore(0)
+
+    def allow(self, count=1):
+        for i in range(count):
+            self.permits.release()
+
+    def write(self, data):
+        self.writing.release()
+        self.permits.acquire(timeout=5.)
+        self.written.append(data[1])
+
+
+class CommandWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serial = Serial()
+        self.writer = CommandWriter(self.serial)
+        # keeps the writer thread busy so that the next commands wait
+        self.first = self.writer.submit(command(CSCOMMAND.RESTART))
+        self.assertTrue(self.serial.writing.acquire(timeout=1.))
+
+    def tearDown(self):
+        self.serial.allow(16)
+        self.writer.stop(1.)
+
+    def written(self, *requests):
+        self.serial.allow(16)
+        for request in requests:
+            request.wait(1.)
+        return self.serial.written[1:]
+
+    def test_coalesce_last(self):
+        ramp = self.writer.submit(command(CSCOMMAND.RAMP))
+        cool = self.writer.submit(command(CSCOMMAND.COOL))
+        self.assertEqual(ramp.state, CommandRequest.SUPERSEDED)
+        self.assertEqual(self.written(cool), [CSCOMMAND.COOL])
+
+    def test_keep_order(self):
+        ramp = self.writer.submit(command(CSCOMMAND.RAMP))
+        stop = self.writer.submit(command(CSCOMMAND.STOP))
+        cool = self.writer.submit(command(CSCOMMAND.COOL))
+        self.assertEqual(ramp.state, CommandRequest.SUPERSEDED)
+        self.assertEqual(self.written(stop, cool),
+                         [CSCOMMAND.STOP, CSCOMMAND.COOL])
+
+    def test_end_purge_not_coalesced(self):
+        cool = self.writer.submit(command(CSCOMMAND.COOL))
+        end = self.writer.submit(command(CSCOMMAND.END))
+        purge = self.writer.submit(command(CSCOMMAND.PURGE))
+        ramp = self.writer.submit(command(CSCOMMAND.RAMP))
+        self.assertEqual(cool.state, CommandRequest.SUPERSEDED)
+        self.assertEqual(self.written(end, purge, ramp),
+                         [CSCOMMAND.END, CSCOMMAND.PURGE, CSCOMMAND.RAMP])
+
+    def test_stop(self):
+        pending = self.writer.submit(command(CSCOMMAND.RAMP),
+                                     lambda packet: False)
+        self.writer.submit(command(CSCOMMAND.RESTART))
+        queued = self.writer.submit(command(CSCOMMAND.STOP))
+        self.serial.allow(2)
+        # the ramp waits for its confirmation, the stop is queued behind
+        # the blocked write of the restart
+        self.assertTrue(self.serial.writing.acquire(timeout=1.))
+        self.assertTrue(self.serial.writing.acquire(timeout=1.))
+        self.assertEqual(pending.state, CommandRequest.SENT)
+        self.writer.stop(0.1)
+        for request in (pending, queued):
+            self.assertFalse(request.wait(0.))
+            self.assertEqual(request.state, CommandRequest.FAILED)
+        with self.assertRaises(RuntimeError):
+            self.writer.submit(command(CSCOMMAND.STOP))
+
+    def test_confirmation(self):
+        self.serial.allow(16)
+        confirm = command_confirmation(CSCOMMAND.COOL, 25000)
+        request = self.writer.submit(command(CSCOMMAND.COOL), confirm)
+        self.assertTrue(self.serial.writing.acquire(timeout=1.))
+        while request.state == CommandRequest.QUEUED:
+            time.sleep(0.001)
+        # a packet read before the write shows the state before the command
+        self.writer.notify(packet('Hold', 250.), request.sent_time - 0.1)
+        self.assertFalse(request.done)
+        # the set point already on the target in another phase
+        self.writer.notify(packet('Plat', 250.))
+        self.assertFalse(request.done)
+        self.writer.notify(packet('Cool', 270., 250.))
+        self.assertEqual(request.state, CommandRequest.CONFIRMED)
+        self.assertTrue(confirm(packet('Hold', 250.)))
+
+
+if __name__ == '__main__':
+    unittest.main()